@@ -2,9 +2,10 @@ from aiogram import Router, F
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
-from shared import ADMIN_ID, get_price_keyboard, get_deadline_keyboard, admin_view_order_handler, get_admin_deadline_keyboard, get_admin_comment_skip_keyboard, pluralize_days, get_all_orders, bot
-import json
+from shared import ADMIN_ID, get_price_keyboard, get_deadline_keyboard, admin_view_order_handler, get_admin_deadline_keyboard, get_admin_comment_skip_keyboard, pluralize_days, get_order, bot
+from order_locks import order_lock
 from datetime import datetime, timedelta
+import order_status
 
 admin_self_take_router = Router()
 
@@ -70,14 +71,12 @@ async def admin_self_take_comment_input(message: Message, state: FSMContext):
     await state.update_data(comment=message.text)
     data = await state.get_data()
     order_id = data.get('order_id')
-    # --- Получаем subject и work_type из state или из orders.json ---
+    # --- Получаем subject и work_type из state или из хранилища заказов ---
     subject = data.get('subject')
     work_type_raw = data.get('work_type')
     if not subject or not work_type_raw:
         try:
-            with open('orders.json', 'r', encoding='utf-8') as f:
-                orders = json.load(f)
-            order = next((o for o in orders if o.get('order_id') == order_id), None)
+            order = get_order(order_id)
             if order:
                 if not subject:
                     subject = order.get('subject', '—')
@@ -116,9 +115,7 @@ async def admin_self_take_skip_comment(callback: CallbackQuery, state: FSMContex
     work_type_raw = data.get('work_type')
     if not subject or not work_type_raw:
         try:
-            with open('orders.json', 'r', encoding='utf-8') as f:
-                orders = json.load(f)
-            order = next((o for o in orders if o.get('order_id') == order_id), None)
+            order = get_order(order_id)
             if order:
                 if not subject:
                     subject = order.get('subject', '—')
@@ -156,41 +153,53 @@ async def admin_self_send_to_pay_handler(callback: CallbackQuery, state: FSMCont
     price = data.get('price')
     deadline = data.get('deadline')
     comment = data.get('comment', '')
-    # Обновляем заказ: назначаем админа исполнителем, статус 'Ожидает оплаты', финальная цена и дедлайн
-    orders = get_all_orders()
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not order:
-        await callback.message.edit_text("Ошибка: заказ не найден.")
-        await state.clear()
-        await callback.answer()
-        return
-    order['executor_id'] = int(ADMIN_ID)
-    order['status'] = 'Ожидает оплаты'
-    order['final_price'] = price
-    order['deadline'] = deadline  # Срок выполнения в днях/текстом
+    async with order_lock(order_id):
+        # Обновляем заказ: назначаем админа исполнителем, статус 'Ожидает оплаты', финальная цена и дедлайн
+        order = get_order(order_id)
+        if not order:
+            await callback.message.edit_text("Ошибка: заказ не найден.")
+            await state.clear()
+            await callback.answer()
+            return
+        # Заказ уже мог забрать исполнитель или админ повторно нажал кнопку
+        if order.get('status') not in ("Рассматривается", "Ожидает подтверждения"):
+            await callback.message.edit_text(f"Заказ №{order_id} уже в статусе «{order.get('status')}».")
+            await state.clear()
+            await callback.answer()
+            return
+        # Поля заказа меняем вместе со статусом, чтобы при сбое сохранения они откатились
+        changes = {
+            'executor_id': int(ADMIN_ID),
+            'final_price': price,
+            'deadline': deadline,  # Срок выполнения в днях/текстом
+        }
 
-    # --- Расчет и сохранение даты сдачи ---
-    due_date = order.get('deadline_date') # Исходный дедлайн от клиента
-    if str(deadline).isdigit():
-        try:
-            # Если срок выполнения - число, считаем от сегодня
-            due_date = (datetime.now() + timedelta(days=int(deadline))).strftime('%d.%m.%Y')
-        except ValueError:
-            pass # Оставляем исходный due_date если deadline не число
-    elif deadline == "До дедлайна" and due_date:
-        pass # Используем исходный дедлайн от клиента
-    else: # Если срок - строка (напр. "1 день"), пытаемся распарсить
-        try:
-            days = int(deadline.split()[0])
-            due_date = (datetime.now() + timedelta(days=days)).strftime('%d.%m.%Y')
-        except (ValueError, IndexError):
-            pass # Оставляем исходный
+        # --- Расчет и сохранение даты сдачи ---
+        due_date = order.get('deadline_date') # Исходный дедлайн от клиента
+        if str(deadline).isdigit():
+            try:
+                # Если срок выполнения - число, считаем от сегодня
+                due_date = (datetime.now() + timedelta(days=int(deadline))).strftime('%d.%m.%Y')
+            except ValueError:
+                pass # Оставляем исходный due_date если deadline не число
+        elif deadline == "До дедлайна" and due_date:
+            pass # Используем исходный дедлайн от клиента
+        else: # Если срок - строка (напр. "1 день"), пытаемся распарсить
+            try:
+                days = int(deadline.split()[0])
+                due_date = (datetime.now() + timedelta(days=days)).strftime('%d.%m.%Y')
+            except (ValueError, IndexError):
+                pass # Оставляем исходный
 
-    order['due_date'] = due_date # Сохраняем дату сдачи
-    order['executor_full_name'] = "Администратор"
-    order['admin_self_comment'] = comment
-    with open('orders.json', 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+        changes['due_date'] = due_date # Сохраняем дату сдачи
+        changes['executor_full_name'] = "Администратор"
+        changes['admin_self_comment'] = comment
+        try:
+            order_status.transition(order, 'Ожидает оплаты', **changes)
+        except order_status.InvalidStatusTransition:
+            await state.clear()
+            await callback.answer(f"Заказ уже в статусе «{order.get('status')}».", show_alert=True)
+            return
     # Сообщение клиенту
     customer_id = order.get('user_id')
     subject = order.get('subject', 'Не указан')
@@ -235,8 +244,7 @@ async def admin_self_view_revision_handler(callback: CallbackQuery, state: FSMCo
     if callback.from_user.id != int(ADMIN_ID):
         return
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
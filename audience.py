@@ -0,0 +1,190 @@
+import logging
+import sqlite3
+from datetime import datetime
+
+import db
+from order_store import order_store
+from user_store import user_store
+
+# Таблицу students создаёт main.init_db, здесь она только читается
+_db = db.LazyConnection()
+# Заглушки, которые попадают в заказы при пропуске шага — это не группа и не вуз
+EMPTY_VALUES = {"", "не указано", "не указана", "не указан", "—", "-"}
+DATE_FORMATS = ("%d.%m.%Y %H:%M", "%d.%m.%Y")
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return None if value.lower() in EMPTY_VALUES else value
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _norm_user_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AudienceIndex:
+    """
+    Аудитория клиентских рассылок: группа -> пользователи.
+    Собирается один раз из users.json, таблицы students и заказов, дальше пересчитывается
+    только запись изменившегося пользователя (по подпискам order_store и user_store).
+    Поэтому в рассылку попадают и клиенты без заказов, а выбор группы — это поиск по индексу.
+    """
+
+    def __init__(self):
+        self._built = False
+        self._students = {}       # user_id -> группа из таблицы students
+        self._records = {}        # user_id -> {"groups", "universities", "statuses", "last_active"}
+        self._by_group = {}       # группа -> {user_id}
+        self._by_university = {}  # вуз -> {user_id}
+
+    def _load_students(self):
+        try:
+            with _db.lock:
+                rows = _db.get().execute("SELECT user_id, group_name FROM students").fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Аудитория: не удалось прочитать таблицу students: {e}")
+            return
+        for user_id, group_name in rows:
+            user_id = _norm_user_id(user_id)
+            if user_id is not None:
+                self._students[user_id] = _clean(group_name)
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        self._built = True
+        self._load_students()
+        user_ids = set(self._students)
+        user_ids.update(_norm_user_id(user_id) for user_id in user_store.all_ids())
+        user_ids.update(_norm_user_id(order.get("user_id")) for order in order_store.all())
+        user_ids.discard(None)
+        for user_id in user_ids:
+            self._refresh(user_id)
+        logging.info(f"Аудитория: {len(self._records)} пользователей, {len(self._by_group)} групп")
+
+    # --- Пересчёт одного пользователя ---
+    def _compute(self, user_id) -> dict:
+        profile = user_store.get(user_id)
+        orders = order_store.by_user(user_id)
+        groups = {_clean(profile.get("group_name")), self._students.get(user_id)}
+        universities = {_clean(profile.get("university_name"))}
+        statuses = set()
+        last_active = None
+        for order in orders:
+            groups.add(_clean(order.get("group_name")))
+            universities.add(_clean(order.get("university_name")))
+            statuses.add(order.get("status"))
+            for field in ("creation_date", "submitted_at"):
+                date = _parse_date(order.get(field))
+                if date and (last_active is None or date > last_active):
+                    last_active = date
+        groups.discard(None)
+        universities.discard(None)
+        return {"groups": groups, "universities": universities, "statuses": statuses, "last_active": last_active}
+
+    def _refresh(self, user_id):
+        old = self._records.pop(user_id, None)
+        if old is not None:
+            for index, keys in ((self._by_group, old["groups"]), (self._by_university, old["universities"])):
+                for key in keys:
+                    bucket = index.get(key)
+                    if bucket is not None:
+                        bucket.discard(user_id)
+                        if not bucket:
+                            del index[key]
+        record = self._compute(user_id)
+        if not record["statuses"] and user_id not in self._students and not user_store.get(user_id):
+            # Пользователь больше нигде не упоминается
+            return
+        self._records[user_id] = record
+        for group in record["groups"]:
+            self._by_group.setdefault(group, set()).add(user_id)
+        for university in record["universities"]:
+            self._by_university.setdefault(university, set()).add(user_id)
+
+    # --- Подписки на изменения ---
+    def on_order_changed(self, order: dict):
+        if not self._built:
+            return
+        user_id = _norm_user_id(order.get("user_id"))
+        if user_id is not None:
+            self._refresh(user_id)
+
+    def on_profile_changed(self, user_id):
+        if not self._built:
+            return
+        user_id = _norm_user_id(user_id)
+        if user_id is not None:
+            self._refresh(user_id)
+
+    def on_student_saved(self, user_id, group_name):
+        """Вызывается после записи в таблицу students (она не проходит через хранилища)."""
+        user_id = _norm_user_id(user_id)
+        if user_id is None:
+            return
+        self._students[user_id] = _clean(group_name)
+        if self._built:
+            self._refresh(user_id)
+
+    # --- Выборки ---
+    def groups(self) -> list:
+        self._ensure_built()
+        return sorted(self._by_group)
+
+    def universities(self) -> list:
+        self._ensure_built()
+        return sorted(self._by_university)
+
+    def group_size(self, group) -> int:
+        self._ensure_built()
+        return len(self._by_group.get(group, ()))
+
+    def university_size(self, university) -> int:
+        self._ensure_built()
+        return len(self._by_university.get(university, ()))
+
+    def resolve(self, group=None, *, status=None, university=None, active_since: datetime = None) -> list:
+        """
+        Получатели сегмента. group/university — точное совпадение, status — хотя бы один заказ
+        в этом статусе (или в одном из статусов, если передан набор), active_since — заказ не раньше даты.
+        """
+        self._ensure_built()
+        if group is not None:
+            candidates = self._by_group.get(group, set())
+        elif university is not None:
+            candidates = self._by_university.get(university, set())
+        else:
+            candidates = self._records.keys()
+        statuses = {status} if isinstance(status, str) else set(status or ())
+        result = []
+        for user_id in candidates:
+            record = self._records[user_id]
+            if university is not None and university not in record["universities"]:
+                continue
+            if statuses and not (statuses & record["statuses"]):
+                continue
+            if active_since is not None and (record["last_active"] is None or record["last_active"] < active_since):
+                continue
+            result.append(user_id)
+        return sorted(result)
+
+
+audience_index = AudienceIndex()
+order_store.subscribe(audience_index.on_order_changed)
+user_store.subscribe(audience_index.on_profile_changed)
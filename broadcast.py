@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и не чаще 1 сообщения в секунду в один чат
+GLOBAL_RATE = 25
+GLOBAL_BURST = 25
+PER_CHAT_INTERVAL = 1.0
+MAX_CONCURRENCY = 10
+MAX_ATTEMPTS = 5
+PROGRESS_INTERVAL = 2.0  # секунд между обновлениями прогресса у админа
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+
+class TokenBucket:
+    """Общий на процесс ограничитель частоты; при flood-wait ставится на паузу целиком."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+_chat_next_send = {}  # chat_id -> время, раньше которого в этот чат писать нельзя
+
+
+async def _wait_chat_slot(chat_id):
+    now = time.monotonic()
+    ready_at = _chat_next_send.get(chat_id, 0.0)
+    _chat_next_send[chat_id] = max(now, ready_at) + PER_CHAT_INTERVAL
+    if ready_at > now:
+        await asyncio.sleep(ready_at - now)
+    if len(_chat_next_send) > 10000:
+        # Старые отметки больше не нужны
+        for key in [k for k, v in _chat_next_send.items() if v < now]:
+            del _chat_next_send[key]
+
+
+async def send_with_limits(bot, chat_id, text: str, copy_from: tuple = None, **kwargs) -> str:
+    """
+    Отправляет одно сообщение с учётом лимитов и повторов. Возвращает SENT, BLOCKED или FAILED.
+    copy_from=(chat_id, message_id) — вместо text копирует это сообщение (фото, документ с подписью).
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await _wait_chat_slot(chat_id)
+        await global_bucket.acquire()
+        try:
+            if copy_from is not None:
+                await bot.copy_message(chat_id, from_chat_id=copy_from[0], message_id=copy_from[1], **kwargs)
+            else:
+                await bot.send_message(chat_id, text, **kwargs)
+            return SENT
+        except TelegramRetryAfter as e:
+            # Flood-wait касается всего бота — притормаживаем все отправки
+            logging.warning(f"Рассылка: flood-wait {e.retry_after} с (чат {chat_id})")
+            global_bucket.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower() or "user is deactivated" in str(e).lower():
+                return BLOCKED
+            logging.error(f"Рассылка: не удалось отправить в чат {chat_id}: {e}")
+            return FAILED
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logging.warning(f"Рассылка: временная ошибка для чата {chat_id} (попытка {attempt}): {e}")
+            await asyncio.sleep(min(2 ** attempt, 30))
+        except Exception as e:
+            logging.error(f"Рассылка: не удалось отправить в чат {chat_id}: {e}")
+            return FAILED
+    return FAILED
+
+
+class BroadcastStats:
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.blocked_ids = []
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    def add(self, chat_id, status: str):
+        if status == SENT:
+            self.sent += 1
+        elif status == BLOCKED:
+            self.blocked += 1
+            self.blocked_ids.append(chat_id)
+        else:
+            self.failed += 1
+
+    def progress_text(self) -> str:
+        return f"⏳ Рассылка: {self.done}/{self.total} (✅ {self.sent}, 🚫 {self.blocked}, ⚠️ {self.failed})"
+
+    def summary_text(self) -> str:
+        elapsed = time.monotonic() - self.started_at
+        return (
+            f"📬 Рассылка завершена за {elapsed:.1f} с\n\n"
+            f"Всего получателей: {self.total}\n"
+            f"✅ Доставлено: {self.sent}\n"
+            f"🚫 Заблокировали бота / недоступны: {self.blocked}\n"
+            f"⚠️ Ошибки: {self.failed}"
+        )
+
+
+async def run_broadcast(bot, chat_ids, text: str, *, on_progress=None, on_result=None, on_start=None,
+                        should_stop=None, concurrency: int = MAX_CONCURRENCY, **send_kwargs) -> BroadcastStats:
+    """
+    Рассылает text по chat_ids параллельно (не больше concurrency одновременных отправок).
+    on_start(chat_id) вызывается перед отправкой, on_result(chat_id, status) — после неё,
+    on_progress(stats) — не чаще PROGRESS_INTERVAL. Если should_stop() вернул True, новые отправки не начинаются.
+    """
+    recipients = list(dict.fromkeys(chat_id for chat_id in chat_ids if chat_id))
+    stats = BroadcastStats(len(recipients))
+    queue = asyncio.Queue()
+    for chat_id in recipients:
+        queue.put_nowait(chat_id)
+    last_progress = time.monotonic()
+
+    async def worker():
+        nonlocal last_progress
+        while True:
+            if should_stop is not None and should_stop():
+                return
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if on_start is not None:
+                await on_start(chat_id)
+            status = await send_with_limits(bot, chat_id, text, **send_kwargs)
+            stats.add(chat_id, status)
+            if on_result is not None:
+                await on_result(chat_id, status)
+            if on_progress is not None and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                try:
+                    await on_progress(stats)
+                except Exception as e:
+                    logging.warning(f"Рассылка: не удалось обновить прогресс: {e}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(recipients))))))
+    return stats
@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import sqlite3
+
+from aiogram.types import InlineKeyboardMarkup
+
+import db
+from broadcast import run_broadcast, SENT, BLOCKED, FAILED
+
+# Статусы рассылки
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+
+# Статусы получателя: pending -> sending -> sent/blocked/failed
+PENDING = "pending"
+SENDING = "sending"
+
+STATUS_TITLES = {
+    QUEUED: "🕓 В очереди",
+    RUNNING: "▶️ Идёт",
+    PAUSED: "⏸ На паузе",
+    CANCELLED: "⛔️ Отменена",
+    DONE: "✅ Завершена",
+}
+
+_wakeup = None
+_current_job_id = None
+_stop_requested = False
+
+def _migrate(conn):
+    # Таблицы, созданные до рассылок с вложениями
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(broadcast_jobs)")]
+    for column in ("source_chat_id", "source_message_id"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE broadcast_jobs ADD COLUMN {column} INTEGER")
+    conn.commit()
+
+
+_db = db.LazyConnection(
+    '''CREATE TABLE IF NOT EXISTS broadcast_jobs
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        title TEXT,
+        text TEXT NOT NULL,
+        parse_mode TEXT,
+        reply_markup TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        admin_chat_id INTEGER,
+        progress_message_id INTEGER,
+        order_id INTEGER,
+        source_chat_id INTEGER,
+        source_message_id INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        finished_at TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS broadcast_recipients
+       (job_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        updated_at TEXT,
+        PRIMARY KEY (job_id, chat_id))''',
+    "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)",
+    init=_migrate,
+)
+
+
+def _get_conn() -> sqlite3.Connection:
+    return _db.get()
+
+
+def _wake():
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+# --- API для хендлеров ---
+def create_job(kind: str, title: str, chat_ids, text: str, *, parse_mode=None, reply_markup=None,
+               admin_chat_id=None, progress_message_id=None, order_id=None, copy_from: tuple = None) -> int:
+    """
+    Ставит рассылку в очередь. Получатели сохраняются сразу, отправляет их фоновый воркер.
+    copy_from=(chat_id, message_id) — разослать копию этого сообщения (с вложением) вместо text.
+    """
+    recipients = []
+    for chat_id in chat_ids:
+        try:
+            recipients.append(int(chat_id))
+        except (TypeError, ValueError):
+            continue
+    recipients = list(dict.fromkeys(recipients))
+    markup_json = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+    source_chat_id, source_message_id = copy_from or (None, None)
+    conn = _get_conn()
+    with conn:
+        cursor = conn.execute(
+            '''INSERT INTO broadcast_jobs (kind, title, text, parse_mode, reply_markup, admin_chat_id, progress_message_id,
+                                         order_id, source_chat_id, source_message_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (kind, title, text, parse_mode, markup_json, admin_chat_id, progress_message_id, order_id,
+             source_chat_id, source_message_id),
+        )
+        job_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT OR IGNORE INTO broadcast_recipients (job_id, chat_id) VALUES (?, ?)",
+            [(job_id, chat_id) for chat_id in recipients],
+        )
+    _wake()
+    return job_id
+
+
+def get_job(job_id) -> dict:
+    conn = _get_conn()
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.row_factory = None
+    if row is None:
+        return None
+    job = dict(row)
+    job["counts"] = get_counts(job_id)
+    return job
+
+
+def get_counts(job_id) -> dict:
+    counts = {PENDING: 0, SENDING: 0, SENT: 0, BLOCKED: 0, FAILED: 0}
+    rows = _get_conn().execute(
+        "SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status", (job_id,)
+    ).fetchall()
+    for status, count in rows:
+        counts[status] = count
+    return counts
+
+
+def recent_jobs(limit: int = 10) -> list:
+    rows = _get_conn().execute(
+        "SELECT id, title, status FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [{"id": job_id, "title": title, "status": status} for job_id, title, status in rows]
+
+
+def _set_status(job_id, new_status: str, allowed_from) -> bool:
+    conn = _get_conn()
+    placeholders = ", ".join("?" for _ in allowed_from)
+    with conn:
+        cursor = conn.execute(
+            f"UPDATE broadcast_jobs SET status = ? WHERE id = ? AND status IN ({placeholders})",
+            (new_status, job_id, *allowed_from),
+        )
+    return cursor.rowcount > 0
+
+
+def _request_stop(job_id):
+    global _stop_requested
+    if _current_job_id == job_id:
+        _stop_requested = True
+
+
+def pause_job(job_id) -> bool:
+    """Ставит рассылку на паузу: уже начатые отправки завершатся, новые не начнутся."""
+    if not _set_status(job_id, PAUSED, (QUEUED, RUNNING)):
+        return False
+    _request_stop(job_id)
+    return True
+
+
+def resume_job(job_id) -> bool:
+    if not _set_status(job_id, QUEUED, (PAUSED,)):
+        return False
+    _wake()
+    return True
+
+
+def cancel_job(job_id) -> bool:
+    """Отменяет рассылку; неотправленные получатели так и остаются в статусе pending."""
+    if not _set_status(job_id, CANCELLED, (QUEUED, RUNNING, PAUSED)):
+        return False
+    _request_stop(job_id)
+    return True
+
+
+def job_status_text(job: dict) -> str:
+    counts = job["counts"]
+    total = sum(counts.values())
+    done = counts[SENT] + counts[BLOCKED] + counts[FAILED]
+    return (
+        f"📬 Рассылка №{job['id']}: {job.get('title') or job['kind']}\n"
+        f"Статус: {STATUS_TITLES.get(job['status'], job['status'])}\n"
+        f"Создана: {job.get('created_at') or '—'}\n\n"
+        f"Обработано: {done}/{total}\n"
+        f"✅ Доставлено: {counts[SENT]}\n"
+        f"🚫 Заблокировали бота / недоступны: {counts[BLOCKED]}\n"
+        f"⚠️ Ошибки: {counts[FAILED]}\n"
+        f"🕓 Ожидают отправки: {counts[PENDING]}"
+    )
+
+
+# --- Фоновый воркер ---
+def _recover():
+    """
+    После перезапуска: получатели в статусе sending могли как получить сообщение, так и нет.
+    Повторно им не пишем (лучше недоставка, чем дубль) и считаем ошибкой; прерванные рассылки возвращаем в очередь.
+    """
+    conn = _get_conn()
+    with conn:
+        lost = conn.execute(
+            "UPDATE broadcast_recipients SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE status = ?",
+            (FAILED, SENDING),
+        ).rowcount
+        resumed = conn.execute(
+            "UPDATE broadcast_jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)
+        ).rowcount
+    if lost or resumed:
+        logging.warning(f"Рассылки: возобновлено {resumed}, получателей с неизвестным результатом: {lost}")
+
+
+def _next_job_id():
+    row = _get_conn().execute(
+        "SELECT id FROM broadcast_jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _mark_recipient(job_id, chat_id, status: str):
+    conn = _get_conn()
+    with conn:
+        conn.execute(
+            "UPDATE broadcast_recipients SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND chat_id = ?",
+            (status, job_id, chat_id),
+        )
+
+
+async def _report(bot, job: dict):
+    if not job.get("admin_chat_id") or not job.get("progress_message_id"):
+        return
+    try:
+        await bot.edit_message_text(
+            job_status_text(job), chat_id=job["admin_chat_id"], message_id=job["progress_message_id"]
+        )
+    except Exception as e:
+        logging.warning(f"Рассылка №{job['id']}: не удалось обновить прогресс: {e}")
+
+
+async def _run_job(bot, job_id):
+    global _current_job_id, _stop_requested
+    if not _set_status(job_id, RUNNING, (QUEUED,)):
+        return
+    job = get_job(job_id)
+    pending = [row[0] for row in _get_conn().execute(
+        "SELECT chat_id FROM broadcast_recipients WHERE job_id = ? AND status = ? ORDER BY rowid", (job_id, PENDING)
+    )]
+    send_kwargs = {}
+    if job.get("parse_mode"):
+        send_kwargs["parse_mode"] = job["parse_mode"]
+    if job.get("reply_markup"):
+        send_kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate_json(job["reply_markup"])
+    if job.get("source_message_id"):
+        send_kwargs["copy_from"] = (job["source_chat_id"], job["source_message_id"])
+
+    async def on_start(chat_id):
+        # Отмечаем до отправки: если процесс упадёт посреди неё, повторно сообщение не уйдёт
+        _mark_recipient(job_id, chat_id, SENDING)
+
+    async def on_result(chat_id, status):
+        _mark_recipient(job_id, chat_id, status)
+
+    async def on_progress(stats):
+        await _report(bot, get_job(job_id))
+
+    _current_job_id = job_id
+    _stop_requested = False
+    try:
+        await run_broadcast(
+            bot, pending, job["text"],
+            on_start=on_start, on_result=on_result, on_progress=on_progress,
+            should_stop=lambda: _stop_requested,
+            **send_kwargs,
+        )
+    finally:
+        _current_job_id = None
+    if not _stop_requested:
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                "UPDATE broadcast_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                (DONE, job_id, RUNNING),
+            )
+    await _report(bot, get_job(job_id))
+
+
+async def run_broadcast_worker(bot, poll_interval: float = 5.0):
+    """Фоновый воркер рассылок: берёт задания из student.db по одному и переживает перезапуски."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    _recover()
+    while True:
+        job_id = None
+        try:
+            job_id = _next_job_id()
+            if job_id is not None:
+                await _run_job(bot, job_id)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка воркера рассылок (рассылка №{job_id}): {e}")
+            if job_id is not None:
+                _set_status(job_id, PAUSED, (RUNNING, QUEUED))
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,39 @@
+import sqlite3
+import threading
+
+DB_FILE = "student.db"
+
+
+def connect(*schema, db_file: str = DB_FILE) -> sqlite3.Connection:
+    """
+    Соединение с student.db с общими настройками: WAL, synchronous=NORMAL (коммит без fsync
+    на каждую запись) и доступ из потоков io_pool. schema — CREATE-запросы таблиц модуля.
+    """
+    conn = sqlite3.connect(db_file, timeout=10.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+class LazyConnection:
+    """Соединение модуля, которое открывается (и создаёт таблицы) при первом обращении."""
+
+    def __init__(self, *schema, init=None, db_file: str = DB_FILE):
+        self.schema = schema
+        self.init = init  # init(conn) — миграции, которые не выражаются CREATE-запросами
+        self.db_file = db_file
+        self.lock = threading.RLock()  # и для записей из потоков io_pool
+        self._conn = None
+
+    def get(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self.lock:
+                if self._conn is None:
+                    conn = connect(*self.schema, db_file=self.db_file)
+                    if self.init is not None:
+                        self.init(conn)
+                    self._conn = conn
+        return self._conn
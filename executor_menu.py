@@ -3,13 +3,15 @@ from aiogram.types import Message, KeyboardButton, ReplyKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import StateFilter
-import json
-import os
-from shared import ADMIN_ID, bot, get_full_name
+from shared import ADMIN_ID, bot, get_full_name, get_order
+from order_store import order_store, parse_page_cursor
+from order_locks import order_lock
+from executor_registry import executor_registry
+from executor_visibility import EXECUTOR_VISIBLE_STATUSES, executor_visibility
+import order_events
+import order_status
 from datetime import datetime
 
-EXECUTORS_FILE = "executors.json"
-ORDERS_FILE = "orders.json"
 
 executor_menu_router = Router()
 
@@ -34,26 +36,8 @@ EXECUTOR_CANCEL_REASONS = [
     "Другое (ввести вручную)"
 ]
 
-# Список статусов, которые видит исполнитель
-EXECUTOR_VISIBLE_STATUSES = [
-    'Ожидает подтверждения',
-    'В работе',
-    'Выполнена',
-    'Отправлен на проверку',
-    'На доработке',
-    'Утверждено администратором',
-    'Ожидает оплаты'
-]
-
 def is_executor(user_id: int) -> bool:
-    if not os.path.exists(EXECUTORS_FILE):
-        return False
-    with open(EXECUTORS_FILE, "r", encoding="utf-8") as f:
-        try:
-            executors = json.load(f)
-        except Exception:
-            return False
-    return any(str(ex.get("id")) == str(user_id) for ex in executors)
+    return executor_registry.is_executor(user_id)
 
 def get_executor_menu_keyboard():
     buttons = [
@@ -81,28 +65,11 @@ def get_executor_cancel_comment_keyboard():
         [InlineKeyboardButton(text="➡️ Пропустить", callback_data="executor_skip_cancel_comment")]
     ])
 
-def get_executor_orders(user_id: int) -> list:
-    if not os.path.exists(ORDERS_FILE):
-        return []
-    with open(ORDERS_FILE, "r", encoding="utf-8") as f:
-        try:
-            all_orders = json.load(f)
-        except Exception:
-            return []
-    result = []
-    for o in all_orders:
-        status = o.get("status")
-        # Обычные статусы — только если исполнитель назначен
-        if str(o.get("executor_id")) == str(user_id) and status in EXECUTOR_VISIBLE_STATUSES:
-            result.append(o)
-        # Для рассылки: если статус 'Ожидает подтверждения' и оффер был отправлен всем
-        elif status == "Ожидает подтверждения":
-            from shared import get_executors_list
-            all_execs = get_executors_list()
-            all_exec_ids = [str(ex.get("id")) for ex in all_execs]
-            if str(user_id) in all_exec_ids:
-                result.append(o)
-    return result
+EXECUTOR_ORDERS_PAGE_SIZE = 10
+
+def executor_orders_cb(status_index="-", cursor="f"):
+    """eol:<статус>:<курсор>; статус — индекс в EXECUTOR_VISIBLE_STATUSES или -."""
+    return f"eol:{status_index}:{cursor}"
 
 @executor_menu_router.message(F.text == "/start")
 async def executor_start(message: Message, state: FSMContext):
@@ -115,23 +82,45 @@ async def executor_start(message: Message, state: FSMContext):
 
 @executor_menu_router.message(F.text == "📂 Мои заказы")
 @executor_menu_router.callback_query(F.data == "executor_back_to_orders")
-async def executor_my_orders(message_or_callback, state: FSMContext):
+async def executor_my_orders(message_or_callback, state: FSMContext, status_index: str = "-", cursor: str = "f"):
     user_id = message_or_callback.from_user.id
-    orders = get_executor_orders(user_id)
+    status = None
+    if status_index.isdigit() and int(status_index) < len(EXECUTOR_VISIBLE_STATUSES):
+        status = EXECUTOR_VISIBLE_STATUSES[int(status_index)]
+    else:
+        status_index = "-"
+    before, after = parse_page_cursor(cursor)
+    orders, has_more = executor_visibility.page(user_id, status, before=before, after=after, limit=EXECUTOR_ORDERS_PAGE_SIZE)
+    if after is not None and not orders:
+        # Новее ничего не осталось — показываем первую страницу
+        after = None
+        orders, has_more = executor_visibility.page(user_id, status, limit=EXECUTOR_ORDERS_PAGE_SIZE)
+    has_newer = (has_more if after is not None else before is not None)
+    has_older = (has_more if after is None else True)
+    keyboard_buttons = []
     if not orders:
-        text = "❗️ У вас пока нет назначенных заказов."
-        keyboard = None
+        text = "❗️ У вас пока нет назначенных заказов." if status is None else f"❗️ Нет заказов в статусе «{status}»."
     else:
-        text = "Ваши заявки:"
-        keyboard_buttons = []
-        for order in reversed(orders[-10:]):
+        text = "Ваши заявки:" if status is None else f"Ваши заявки в статусе «{status}»:"
+        for order in orders:
             order_id = order.get('order_id')
-            status = order.get('status', 'N/A')
-            subject = order.get('subject', 'Не указан')
+            status_text = order.get('status', 'N/A')
             work_type = order.get('work_type', 'Заявка').replace('work_type_', '')
-            button_text = f"Заказ на тему: {work_type} | {status}"
+            button_text = f"Заказ на тему: {work_type} | {status_text}"
             keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"executor_view_order_{order_id}")])
-        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        nav_buttons = []
+        if has_newer:
+            nav_buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=executor_orders_cb(status_index, f"p{orders[0]['order_id']}")))
+        if has_older:
+            nav_buttons.append(InlineKeyboardButton(text="Старше ➡️", callback_data=executor_orders_cb(status_index, f"n{orders[-1]['order_id']}")))
+        if nav_buttons:
+            keyboard_buttons.append(nav_buttons)
+    if orders or status is not None:
+        filter_row = [InlineKeyboardButton(text="🏷 Фильтр по статусу", callback_data=f"eof:{status_index}")]
+        if status is not None:
+            filter_row.append(InlineKeyboardButton(text="✖️ Все заказы", callback_data=executor_orders_cb()))
+        keyboard_buttons.append(filter_row)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons) if keyboard_buttons else None
     if isinstance(message_or_callback, Message):
         await message_or_callback.answer(text, reply_markup=keyboard)
     else:
@@ -139,11 +128,31 @@ async def executor_my_orders(message_or_callback, state: FSMContext):
         if hasattr(message_or_callback, "answer"):
             await message_or_callback.answer()
 
+@executor_menu_router.callback_query(F.data.startswith("eol:"))
+async def executor_orders_page(callback: CallbackQuery, state: FSMContext):
+    try:
+        _, status_index, cursor = callback.data.split(":", 2)
+    except ValueError:
+        status_index, cursor = "-", "f"
+    await executor_my_orders(callback, state, status_index=status_index, cursor=cursor)
+
+@executor_menu_router.callback_query(F.data.startswith("eof:"))
+async def executor_orders_filter(callback: CallbackQuery, state: FSMContext):
+    current = callback.data.split(":", 1)[1]
+    from shared import STATUS_EMOJI_MAP
+    buttons = [
+        [InlineKeyboardButton(text=f"{STATUS_EMOJI_MAP.get(status, '')} {status}", callback_data=executor_orders_cb(str(i)))]
+        for i, status in enumerate(EXECUTOR_VISIBLE_STATUSES)
+    ]
+    buttons.append([InlineKeyboardButton(text="Все статусы", callback_data=executor_orders_cb())])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=executor_orders_cb(current))])
+    await callback.message.edit_text("Выберите статус:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    await callback.answer()
+
 @executor_menu_router.callback_query(F.data.startswith("executor_view_order_"))
 async def executor_view_order(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[-1])
-    orders = get_executor_orders(callback.from_user.id)
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
+    order = order_store.get(order_id) if executor_visibility.can_see(callback.from_user.id, order_id) else None
     if not order:
         if hasattr(callback, "answer"):
             await callback.answer("Заявка не найдена.", show_alert=True)
@@ -349,22 +358,24 @@ async def executor_work_file_received(message: Message, state: FSMContext):
 
 @executor_menu_router.callback_query(F.data.startswith("executor_send_work_"), ExecutorStates.waiting_for_work_file)
 async def executor_send_work(callback: CallbackQuery, state: FSMContext):
-    from shared import get_all_orders, ADMIN_ID, bot
-    import json
     data = await state.get_data()
     order_id = data.get('submit_order_id')
     file_id = data.get('work_file_id')
     file_name = data.get('work_file_name')
-    orders = get_all_orders()
-    for order in orders:
-        if order.get('order_id') == order_id:
-            order['status'] = 'Отправлен на проверку'
-            order['submitted_work'] = {'file_id': file_id, 'file_name': file_name}
-            order['submitted_at'] = datetime.now().strftime('%d.%m.%Y')
-            break
-    with open('orders.json', 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if order:
+            try:
+                order_status.transition(
+                    order, 'Отправлен на проверку',
+                    submitted_work={'file_id': file_id, 'file_name': file_name},
+                    submitted_at=datetime.now().strftime('%d.%m.%Y'),
+                )
+            except order_status.InvalidStatusTransition:
+                await state.clear()
+                await callback.message.edit_text(f"Заказ №{order_id} в статусе «{order.get('status')}», работу по нему сейчас отправить нельзя.")
+                await callback.answer()
+                return
     subject = order.get('subject', 'Не указан')
     work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
     submitted_at = order.get('submitted_at', '')
@@ -393,8 +404,6 @@ async def executor_cancel_submit(callback: CallbackQuery, state: FSMContext):
 
 @executor_menu_router.callback_query(F.data.startswith("executor_refuse_work_") | F.data.startswith("executor_refuse_"))
 async def executor_refuse_start(callback: CallbackQuery, state: FSMContext):
-    from shared import get_all_orders
-    
     order_id_str = callback.data.split('_')[-1]
     if not order_id_str.isdigit():
         if hasattr(callback, "answer"):
@@ -402,15 +411,27 @@ async def executor_refuse_start(callback: CallbackQuery, state: FSMContext):
         return
     order_id = int(order_id_str)
 
-    all_orders = get_all_orders()
-    order = next((o for o in all_orders if o.get('order_id') == order_id and o.get('executor_id') == callback.from_user.id), None)
-
-    if not order:
-        if hasattr(callback, "answer"):
-            await callback.answer("Заказ не найден или уже не актуален.", show_alert=True)
-        return
-
-    if order.get("status") == "В работе":
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if order and order.get('executor_id') != callback.from_user.id:
+            order = None
+
+        if not order:
+            if hasattr(callback, "answer"):
+                await callback.answer("Заказ не найден или уже не актуален.", show_alert=True)
+            return
+
+        # Заказ «В работе» снимается только после подтверждения и выбора причины
+        in_work = order.get("status") == "В работе"
+        if not in_work:
+            try:
+                order_status.transition(order, "Рассматривается", executor_id=None, executor_offers=None)
+            except order_status.InvalidStatusTransition:
+                if hasattr(callback, "answer"):
+                    await callback.answer(f"Заказ уже в статусе «{order.get('status')}», отказаться от него нельзя.", show_alert=True)
+                return
+
+    if in_work:
         await state.set_state(ExecutorCancelOrder.waiting_for_confirm)
         await state.update_data(cancel_order_id=order_id)
         if hasattr(callback.message, "edit_text"):
@@ -424,13 +445,6 @@ async def executor_refuse_start(callback: CallbackQuery, state: FSMContext):
                 reply_markup=get_executor_cancel_confirm_keyboard(order_id)
             )
     else:
-        order['status'] = "Рассматривается"
-        order.pop('executor_id', None)
-        order.pop('executor_offers', None)
-        
-        with open("orders.json", "w", encoding="utf-8") as f:
-            json.dump(all_orders, f, ensure_ascii=False, indent=4)
-        
         subject = order.get('subject', 'Не указан')
         await bot.send_message(
             ADMIN_ID,
@@ -532,27 +546,32 @@ async def executor_cancel_skip_comment(callback: CallbackQuery, state: FSMContex
 
 
 async def finish_executor_cancel_order(message_or_callback, state, order_id, reason, comment):
-    from shared import get_all_orders, get_full_name
-    all_orders = get_all_orders()
-    target_order = None
-    for order in all_orders:
-        if order.get('order_id') == order_id:
-            order['status'] = "Рассматривается"
-            order.pop('executor_id', None)
-            order.pop('executor_offers', None)
-            target_order = order
-            break
-            
-    if not target_order:
-        if isinstance(message_or_callback, Message):
-            await message_or_callback.answer("Не удалось обработать отказ, заказ не найден.")
-        else:
-            await message_or_callback.message.edit_text("Не удалось обработать отказ, заказ не найден.")
-        await state.clear()
-        return
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            if isinstance(message_or_callback, Message):
+                await message_or_callback.answer("Не удалось обработать отказ, заказ не найден.")
+            else:
+                await message_or_callback.message.edit_text("Не удалось обработать отказ, заказ не найден.")
+            await state.clear()
+            return
 
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(all_orders, f, ensure_ascii=False, indent=4)
+        try:
+            order_status.transition(target_order, "Рассматривается", executor_id=None, executor_offers=None)
+        except order_status.InvalidStatusTransition:
+            text = f"Заказ уже в статусе «{target_order.get('status')}», отказаться от него нельзя."
+            if isinstance(message_or_callback, Message):
+                await message_or_callback.answer(text)
+            else:
+                await message_or_callback.message.edit_text(text)
+            await state.clear()
+            return
+    # Администратора уведомляет подписчик order_events (payment.notify_admin_executor_cancelled)
+    order_events.emit(
+        order_events.EXECUTOR_CANCELLED, target_order,
+        actor_id=message_or_callback.from_user.id, reason=reason, comment=comment,
+        executor_full_name=get_full_name(message_or_callback.from_user),
+    )
     
     await state.clear()
     
@@ -561,12 +580,6 @@ async def finish_executor_cancel_order(message_or_callback, state, order_id, rea
     else:
         await message_or_callback.message.edit_text("Вы отказались от заказа. Администратор уведомлен.")
 
-    admin_text = (f"❌ Исполнитель {get_full_name(message_or_callback.from_user)} (ID: {message_or_callback.from_user.id}) "
-                  f"отказался от заказа №{order_id}, который был в работе.\n\n"
-                  f"<b>Причина:</b> {reason}\n"
-                  f"<b>Комментарий:</b> {comment or 'Нет'}")
-    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
-
 
 @executor_menu_router.callback_query(F.data.startswith("executor_contact_client:"))
 async def executor_contact_client_handler(callback: CallbackQuery, state: FSMContext):
@@ -582,10 +595,7 @@ async def executor_send_message_to_client(message: Message, state: FSMContext):
     order_id = data.get("order_id")
     executor_id = message.from_user.id
 
-    with open(ORDERS_FILE, "r", encoding="utf-8") as f:
-        orders = json.load(f)
-    
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
+    order = get_order(order_id)
 
     if not order:
         await message.answer("❗️ Заказ не найден.")
@@ -622,9 +632,7 @@ async def executor_send_message_to_client(message: Message, state: FSMContext):
 @executor_menu_router.callback_query(F.data.startswith("executor_show_materials:"))
 async def executor_show_materials_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    from shared import get_all_orders
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         if hasattr(callback, "answer"):
             await callback.answer("Заказ не найден.", show_alert=True)
@@ -636,6 +644,8 @@ async def executor_show_materials_handler(callback: CallbackQuery, state: FSMCon
         material_buttons.append([InlineKeyboardButton(text="Задание", callback_data=f"executor_material_task:{order_id}")])
     if order.get('example_file'):
         material_buttons.append([InlineKeyboardButton(text="Пример работы", callback_data=f"executor_material_example:{order_id}")])
+    if len(material_buttons) > 1:
+        material_buttons.append([InlineKeyboardButton(text="📦 Все материалы", callback_data=f"executor_material_all:{order_id}")])
     material_buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"executor_view_order_{order_id}")])
     keyboard = InlineKeyboardMarkup(inline_keyboard=material_buttons)
     if hasattr(callback.message, "edit_text"):
@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import time
+
+from persistence import atomic_write_text
+
+EXECUTORS_FILE = "executors.json"
+# Как часто сверяться с mtime файла (его могут поправить руками на сервере)
+CHECK_INTERVAL = 5.0
+
+
+class ExecutorRegistry:
+    """
+    Список исполнителей из executors.json в памяти с индексом ID для проверки за O(1).
+    Файл перечитывается только при изменении mtime, запись идёт сквозь кэш.
+    """
+
+    def __init__(self, file_path: str = EXECUTORS_FILE):
+        self.file_path = file_path
+        self._executors = []
+        self._ids = set()
+        self._names = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._revision = 0  # растёт при каждой смене списка — для кэшей, зависящих от имён исполнителей
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        mtime = self._file_mtime()
+        if mtime == self._mtime and self._mtime is not None:
+            return
+        executors = []
+        if mtime is not None:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                try:
+                    executors = json.load(f)
+                except Exception as e:
+                    logging.error(f"executors.json повреждён: {e}")
+                    executors = []
+        self._set(executors if isinstance(executors, list) else [])
+        self._mtime = mtime
+
+    def _set(self, executors: list):
+        self._executors = [dict(ex) for ex in executors if isinstance(ex, dict)]
+        self._ids = {str(ex.get("id")) for ex in self._executors}
+        self._names = {str(ex.get("id")): ex.get("name") for ex in self._executors}
+        self._revision += 1
+
+    def list(self) -> list:
+        self._refresh()
+        # Копии: вызывающий код может изменить список перед save()
+        return [dict(ex) for ex in self._executors]
+
+    def ids(self) -> set:
+        self._refresh()
+        return set(self._ids)
+
+    def is_executor(self, user_id) -> bool:
+        self._refresh()
+        return str(user_id) in self._ids
+
+    def get_name(self, executor_id):
+        self._refresh()
+        return self._names.get(str(executor_id))
+
+    def revision(self) -> int:
+        self._refresh()
+        return self._revision
+
+    def save(self, executors: list):
+        atomic_write_text(self.file_path, json.dumps(executors, ensure_ascii=False, indent=4))
+        self._set(executors)
+        self._mtime = self._file_mtime()
+        self._checked_at = time.monotonic()
+
+
+executor_registry = ExecutorRegistry()
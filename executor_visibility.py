@@ -0,0 +1,152 @@
+import bisect
+
+from executor_registry import executor_registry
+from order_store import order_store
+
+# Статусы, в которых назначенный исполнитель видит заказ в своём меню
+EXECUTOR_VISIBLE_STATUSES = [
+    'Ожидает подтверждения',
+    'В работе',
+    'Выполнена',
+    'Отправлен на проверку',
+    'На доработке',
+    'Утверждено администратором',
+    'Ожидает оплаты'
+]
+# Заказы в этом статусе разосланы как предложение и видны всем исполнителям
+OPEN_OFFER_STATUS = 'Ожидает подтверждения'
+
+
+def _norm_id(value):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class ExecutorVisibilityIndex:
+    """
+    Какие заказы видит исполнитель: (executor_id, статус) -> отсортированные номера назначенных заказов
+    и общий отсортированный список открытых предложений (рассылка всем исполнителям).
+    Собирается один раз из order_store, дальше обновляется по его подписке при каждой смене статуса
+    или исполнителя, поэтому проверка доступа к заказу — O(1), а страница списка не зависит от числа заказов.
+    """
+
+    def __init__(self):
+        self._built = False
+        self._keys = {}      # order_id -> (executor_id или None, статус)
+        self._assigned = {}  # (executor_id, статус) -> [order_id по возрастанию]
+        self._open = []      # открытые предложения, order_id по возрастанию
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        self._built = True
+        for order in order_store.all():
+            self._add(order)
+
+    @staticmethod
+    def _order_keys(order: dict):
+        status = order.get("status")
+        executor_id = _norm_id(order.get("executor_id"))
+        if status not in EXECUTOR_VISIBLE_STATUSES:
+            executor_id = None
+        return executor_id, status
+
+    def _add(self, order: dict):
+        order_id = _norm_id(order.get("order_id"))
+        if not isinstance(order_id, int):
+            return
+        executor_id, status = keys = self._order_keys(order)
+        self._keys[order_id] = keys
+        if executor_id is not None:
+            bisect.insort(self._assigned.setdefault((executor_id, status), []), order_id)
+        if status == OPEN_OFFER_STATUS:
+            bisect.insort(self._open, order_id)
+
+    @staticmethod
+    def _discard(ids: list, order_id: int):
+        i = bisect.bisect_left(ids, order_id)
+        if i < len(ids) and ids[i] == order_id:
+            del ids[i]
+
+    def _remove(self, order_id: int):
+        keys = self._keys.pop(order_id, None)
+        if keys is None:
+            return
+        executor_id, status = keys
+        if executor_id is not None:
+            ids = self._assigned.get((executor_id, status))
+            if ids is not None:
+                self._discard(ids, order_id)
+                if not ids:
+                    del self._assigned[(executor_id, status)]
+        if status == OPEN_OFFER_STATUS:
+            self._discard(self._open, order_id)
+
+    def on_order_changed(self, order: dict):
+        if not self._built:
+            return
+        order_id = _norm_id(order.get("order_id"))
+        if not isinstance(order_id, int):
+            return
+        current = order_store.get(order_id)
+        if current is not None and self._keys.get(order_id) == self._order_keys(current):
+            return
+        self._remove(order_id)
+        if current is not None:
+            self._add(current)
+
+    # --- Выборки ---
+    def can_see(self, executor_id, order_id) -> bool:
+        self._ensure_built()
+        keys = self._keys.get(_norm_id(order_id))
+        if keys is None:
+            return False
+        if keys[1] == OPEN_OFFER_STATUS and executor_registry.is_executor(executor_id):
+            return True
+        return keys[0] is not None and keys[0] == _norm_id(executor_id)
+
+    def _sources(self, executor_id, status=None) -> list:
+        executor_id = _norm_id(executor_id)
+        statuses = [status] if status else EXECUTOR_VISIBLE_STATUSES
+        sources = [self._assigned.get((executor_id, s), []) for s in statuses if s in EXECUTOR_VISIBLE_STATUSES]
+        if (status is None or status == OPEN_OFFER_STATUS) and executor_registry.is_executor(executor_id):
+            sources.append(self._open)
+        return sources
+
+    def page(self, executor_id, status=None, before=None, after=None, limit: int = 10):
+        """
+        Страница видимых исполнителю заказов от новых к старым с keyset-курсором по order_id
+        (before — старше, after — новее). Возвращает (заказы, есть_ещё_в_направлении_обхода).
+        """
+        self._ensure_built()
+        candidates = set()
+        for ids in self._sources(executor_id, status):
+            # Из каждого списка достаточно limit + 1 номеров рядом с курсором
+            if after is not None:
+                start = bisect.bisect_right(ids, int(after))
+                candidates.update(ids[start:start + limit + 1])
+            else:
+                end = bisect.bisect_left(ids, int(before)) if before is not None else len(ids)
+                candidates.update(ids[max(0, end - limit - 1):end])
+        ordered = sorted(candidates, reverse=after is None)
+        has_more = len(ordered) > limit
+        ordered = ordered[:limit]
+        if after is not None:
+            ordered.reverse()
+        return [order_store.get(order_id) for order_id in ordered], has_more
+
+    def stats(self) -> dict:
+        self._ensure_built()
+        return {
+            "orders": len(self._keys),
+            "open_offers": len(self._open),
+            "executors": len({executor_id for executor_id, _ in self._assigned}),
+        }
+
+
+executor_visibility = ExecutorVisibilityIndex()
+order_store.subscribe(executor_visibility.on_order_changed)
@@ -0,0 +1,147 @@
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import db
+from persistence import WriteBehind
+
+# Незавершённые сценарии старше недели считаем брошенными
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def _key_str(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram поверх таблицы fsm_states в student.db.
+    Все чтения идут из памяти, изменения пишутся в базу отложенно (persistence.WriteBehind),
+    поэтому на апдейт это не добавляет обращений к диску. Состояния старше ttl отбрасываются.
+    """
+
+    def __init__(self, db_file: str = db.DB_FILE, ttl: float = DEFAULT_TTL):
+        self.db_file = db_file
+        self.ttl = ttl
+        self._records = None  # ключ -> [state, data, updated_at]
+        self._db = db.LazyConnection(
+            '''CREATE TABLE IF NOT EXISTS fsm_states
+               (key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL)''',
+            db_file=db_file,
+        )
+        self._writer = WriteBehind(self._prepare_flush, name="fsm")
+
+    # --- База ---
+    def _get_conn(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _ensure_loaded(self):
+        if self._records is not None:
+            return
+        records = {}
+        cutoff = time.time() - self.ttl
+        with self._db.lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (cutoff,))
+            rows = conn.execute("SELECT key, state, data, updated_at FROM fsm_states").fetchall()
+        for key, state, data, updated_at in rows:
+            try:
+                records[key] = [state, json.loads(data), updated_at]
+            except json.JSONDecodeError as e:
+                logging.error(f"FSM: повреждённые данные для {key}: {e}")
+        self._records = records
+        if records:
+            logging.info(f"FSM: восстановлено {len(records)} незавершённых сценариев")
+
+    def load(self):
+        """Читает сохранённые состояния заранее (при старте бота)."""
+        self._ensure_loaded()
+
+    def _get(self, key: StorageKey):
+        self._ensure_loaded()
+        k = _key_str(key)
+        record = self._records.get(k)
+        if record is not None and record[2] < time.time() - self.ttl:
+            del self._records[k]
+            self._writer.mark_deleted(k)
+            return None
+        return record
+
+    def _touch(self, key: StorageKey, state=None, data=None, set_state=False, set_data=False):
+        self._ensure_loaded()
+        k = _key_str(key)
+        record = self._get(key) or [None, {}, 0.0]
+        if set_state:
+            record[0] = state
+        if set_data:
+            record[1] = data
+        record[2] = time.time()
+        if record[0] is None and not record[1]:
+            # state.clear(): хранить нечего
+            if self._records.pop(k, None) is not None:
+                self._writer.mark_deleted(k)
+            return
+        self._records[k] = record
+        self._writer.mark_dirty(k)
+
+    # --- BaseStorage ---
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._touch(key, state=state.state if isinstance(state, State) else state, set_state=True)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._touch(key, data=dict(data), set_data=True)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return dict(record[1]) if record else {}
+
+    async def close(self) -> None:
+        await self._writer.aclose()
+
+    # --- Сброс на диск ---
+    def _prepare_flush(self, dirty: set, deleted: set):
+        rows = []
+        for k in dirty:
+            record = self._records.get(k)
+            if record is None:
+                continue
+            try:
+                payload = json.dumps(record[1], ensure_ascii=False, default=str)
+            except (TypeError, ValueError) as e:
+                logging.error(f"FSM: не удалось сохранить данные {k}: {e}")
+                continue
+            rows.append((k, record[0], payload, record[2]))
+        deleted = [(k,) for k in deleted]
+        cutoff = time.time() - self.ttl
+
+        def write():
+            with self._db.lock:
+                conn = self._get_conn()
+                with conn:
+                    if rows:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+                            rows,
+                        )
+                    if deleted:
+                        conn.executemany("DELETE FROM fsm_states WHERE key = ?", deleted)
+                    conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (cutoff,))
+        return write
+
+    def flush(self):
+        self._writer.flush()
@@ -0,0 +1,46 @@
+import logging
+import threading
+
+import gspread
+from google.oauth2.service_account import Credentials
+
+GOOGLE_SHEET_ID = "1D15yyPKHyN1Vw8eRnjT79xV28cwL_q5EIZa97tgTF2U"
+CREDENTIALS_FILE = "google-credentials.json"
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+_lock = threading.Lock()
+_client = None
+_worksheet = None
+
+
+def get_client() -> gspread.Client:
+    """
+    Один авторизованный клиент gspread на процесс.
+    Сессия держит keep-alive соединение, а токен обновляется сам при истечении.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
+            _client = gspread.authorize(creds)
+        return _client
+
+
+def get_worksheet() -> gspread.Worksheet:
+    """Закэшированный лист sheet1 таблицы заказов (метаданные таблицы запрашиваются один раз)."""
+    global _worksheet
+    client = get_client()
+    with _lock:
+        if _worksheet is None:
+            _worksheet = client.open_by_key(GOOGLE_SHEET_ID).sheet1
+        return _worksheet
+
+
+def reset():
+    """Сбрасывает кэш после ошибки: следующий вызов заново авторизуется и откроет лист."""
+    global _client, _worksheet
+    with _lock:
+        if _client is not None or _worksheet is not None:
+            logging.info("Google Sheets: сброс закэшированного клиента")
+        _client = None
+        _worksheet = None
@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+IO_THREADS = int(os.getenv("IO_THREADS", "8"))
+LAG_CHECK_INTERVAL = 0.5  # секунд между замерами задержки event loop
+LAG_WARNING = 0.2         # задержка, после которой loop считаем заблокированным
+
+_executor = None
+_stats = {}  # имя операции -> {"calls", "errors", "wait", "run", "max_run"}
+_loop_lag = {"checks": 0, "blocked": 0, "total": 0.0, "max": 0.0}
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Общий пул потоков для блокирующих операций (диск, SQLite, Google Sheets, QR)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+    return _executor
+
+
+def _record(name: str, wait: float, run: float, error: bool):
+    entry = _stats.setdefault(name, {"calls": 0, "errors": 0, "wait": 0.0, "run": 0.0, "max_run": 0.0})
+    entry["calls"] += 1
+    entry["errors"] += int(error)
+    entry["wait"] += wait
+    entry["run"] += run
+    entry["max_run"] = max(entry["max_run"], run)
+
+
+async def run_io(func, *args, name: str = None, **kwargs):
+    """
+    Выполняет блокирующую функцию в пуле потоков и учитывает время:
+    wait — ожидание свободного потока, run — сама операция (столько бы простоял event loop).
+    """
+    name = name or getattr(func, "__name__", "io")
+    submitted = time.perf_counter()
+    started = None
+
+    def call():
+        nonlocal started
+        started = time.perf_counter()
+        return func(*args, **kwargs)
+
+    error = False
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+    except Exception:
+        error = True
+        raise
+    finally:
+        finished = time.perf_counter()
+        started = started or finished
+        _record(name, started - submitted, finished - started, error)
+
+
+def io_bound(func):
+    """Декоратор: делает из синхронной функции её async-версию, выполняемую через run_io."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_io(func, *args, name=func.__name__, **kwargs)
+    return wrapper
+
+
+async def monitor_loop_lag(interval: float = LAG_CHECK_INTERVAL):
+    """Фоновая задача: меряет, насколько позже положенного просыпается event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        _loop_lag["checks"] += 1
+        _loop_lag["total"] += lag
+        _loop_lag["max"] = max(_loop_lag["max"], lag)
+        if lag >= LAG_WARNING:
+            _loop_lag["blocked"] += 1
+            logging.warning(f"Event loop был заблокирован на {lag:.3f} с")
+
+
+def io_stats() -> dict:
+    return {
+        "threads": IO_THREADS,
+        "operations": {name: dict(entry) for name, entry in _stats.items()},
+        "loop_lag": dict(_loop_lag),
+    }
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -1,14 +1,17 @@
 import asyncio
+import contextlib
+import hmac
 import logging
-import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
-import time
+import secrets
+import signal
 import sqlite3
 
 from aiogram import Bot, Dispatcher, Router, F, types
 from aiogram.filters import Command, StateFilter
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
@@ -18,12 +21,29 @@ from aiogram.types import (
     CallbackQuery,
     ReplyKeyboardRemove,
     ReplyKeyboardMarkup,
-    KeyboardButton
+    KeyboardButton,
+    Update
 )
 from dotenv import load_dotenv
-import gspread
-from google.oauth2.service_account import Credentials
-from shared import get_all_orders, ADMIN_ID, bot, STATUS_EMOJI_MAP, pluralize_days, get_full_name, get_deadline_keyboard, admin_view_order_handler
+from shared import get_order, save_order, delete_order, get_executors_list, save_executors_list, ADMIN_ID, bot, STATUS_EMOJI_MAP, ORDER_STATUSES, pluralize_days, get_full_name, get_deadline_keyboard, admin_view_order_handler
+from order_store import order_store, parse_page_cursor
+from order_locks import order_lock
+from executor_registry import executor_registry
+import order_db
+import order_events
+import order_status
+from user_store import user_store, get_user_phone
+import broadcast_jobs
+import materials
+import metrics
+from shared import bot as shared_bot
+from update_pipeline import UpdatePipeline
+import io_pool
+from io_pool import run_io, io_bound
+from fsm_storage import SQLiteStorage, DEFAULT_TTL as FSM_DEFAULT_TTL
+from audience import audience_index
+import sheets_sync
+import gsheets
 from payment import payment_router
 from executor_menu import executor_menu_router, is_executor, get_executor_menu_keyboard
 from executor_menu import ExecutorStates
@@ -31,14 +51,15 @@ from admin_self_take import admin_self_take_router
 from admin_self_take import admin_view_order_handler
 
 # --- FastAPI интеграция ---
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 import uvicorn
 
 app = FastAPI()
 
 @app.get("/")
 async def root():
-    return {"status": "API is running"}
+    return {"status": "API is running", "updates": update_pipeline.stats(), "io": io_pool.io_stats(), "events": order_events.stats()}
 
 def init_db():
     try:
@@ -83,7 +104,9 @@ logging.basicConfig(level=logging.INFO)
 
 # Инициализация бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+# Состояния FSM хранятся в student.db и переживают перезапуск
+fsm_storage = SQLiteStorage(ttl=int(os.getenv("FSM_TTL", FSM_DEFAULT_TTL)))
+dp = Dispatcher(storage=fsm_storage)
 router = Router()
 dp.include_router(router)
 admin_router = Router()
@@ -93,9 +116,16 @@ dp.include_router(executor_router)
 dp.include_router(payment_router)
 dp.include_router(executor_menu_router)
 dp.include_router(admin_self_take_router)
+# Замеры времени хендлеров и запросов к Telegram (см. /metrics)
+for _router, _router_name in (
+    (router, "client"), (admin_router, "admin"), (executor_router, "executor"),
+    (payment_router, "payment"), (executor_menu_router, "executor_menu"), (admin_self_take_router, "admin_self_take"),
+):
+    metrics.instrument_router(_router, _router_name)
+metrics.instrument_bot(bot)
+metrics.instrument_bot(shared_bot)
 
 # Google Sheets
-GOOGLE_SHEET_ID = "1D15yyPKHyN1Vw8eRnjT79xV28cwL_q5EIZa97tgTF2U"
 GOOGLE_SHEET_HEADERS = [
     "Группа", "Университет", "Тип работы", "Методичка", "Задание", "Пример работы", "Дата сдачи", "Комментарий"
 ]
@@ -144,6 +174,9 @@ class AdminRevision(StatesGroup):
 
 class AdminBroadcastClients(StatesGroup):
     waiting_for_message = State()
+
+class AdminOrdersSearch(StatesGroup):
+    waiting_for_query = State()
 # --- Клавиатуры ---
 # --- FSM для настроек исполнителей ---
 class AdminSettings(StatesGroup):
@@ -158,7 +191,6 @@ class ExecutorResponse(StatesGroup):
     waiting_for_comment = State()
     waiting_for_confirm = State()  # Новый этап
 
-EXECUTORS_FILE = "executors.json"
 
 
 def get_phone_request_keyboard():
@@ -174,6 +206,7 @@ def get_admin_settings_keyboard():
         [InlineKeyboardButton(text="➕ Добавить исполнителя", callback_data="admin_add_executor")],
         [InlineKeyboardButton(text="➖ Удалить исполнителя", callback_data="admin_delete_executor")],
         [InlineKeyboardButton(text="👥 Показать всех исполнителей", callback_data="admin_show_executors")],
+        [InlineKeyboardButton(text="📬 Рассылки", callback_data="admin_broadcast_jobs")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back_to_menu")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -183,19 +216,6 @@ def get_skip_keyboard_admin():
         [InlineKeyboardButton(text="➡️ Пропустить", callback_data="admin_skip_executor_name")]
     ])
 
-def get_executors_list():
-    if not os.path.exists(EXECUTORS_FILE):
-        return []
-    with open(EXECUTORS_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except Exception:
-            return []
-
-def save_executors_list(executors):
-    with open(EXECUTORS_FILE, "w", encoding="utf-8") as f:
-        json.dump(executors, f, ensure_ascii=False, indent=4)
-
 def get_executors_info_keyboard():
     executors = get_executors_list()
     if not executors:
@@ -218,65 +238,19 @@ def get_executors_delete_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def save_user_phone(user_id, phone_number):
-    users_file = "users.json"
-    lock_file = users_file + ".lock"
-    while os.path.exists(lock_file):
-        time.sleep(0.1)
-    try:
-        open(lock_file, 'w').close()
-        users = {}
-        if os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                except json.JSONDecodeError:
-                    users = {}
-        users[str(user_id)] = {"phone_number": phone_number}
-        with open(users_file, "w", encoding="utf-8") as f:
-            json.dump(users, f, ensure_ascii=False, indent=4)
-    finally:
-        if os.path.exists(lock_file):
-            os.remove(lock_file)
+    user_store.replace(user_id, {"phone_number": phone_number})
 
 def get_user_profile(user_id):
     """
-    Возвращает профиль пользователя (ФИО, группа, зачетка, университет) из users.json.
+    Возвращает профиль пользователя (ФИО, группа, зачетка, университет) из кэша user_store.
     """
-    users_file = "users.json"
-    if not os.path.exists(users_file):
-        return {}
-    with open(users_file, "r", encoding="utf-8") as f:
-        try:
-            users = json.load(f)
-        except Exception:
-            return {}
-    return users.get(str(user_id), {})
+    return user_store.get(user_id)
 
 def save_user_profile(user_id, profile_data):
     """
-    Сохраняет профиль пользователя (ФИО, группа, зачетка, университет) в users.json.
+    Сохраняет профиль пользователя (ФИО, группа, зачетка, университет); на диск пишется отложенно.
     """
-    users_file = "users.json"
-    lock_file = users_file + ".lock"
-    while os.path.exists(lock_file):
-        time.sleep(0.1)
-    try:
-        open(lock_file, 'w').close()
-        users = {}
-        if os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                except json.JSONDecodeError:
-                    users = {}
-        user_entry = users.get(str(user_id), {})
-        user_entry.update(profile_data)
-        users[str(user_id)] = user_entry
-        with open(users_file, "w", encoding="utf-8") as f:
-            json.dump(users, f, ensure_ascii=False, indent=4)
-    finally:
-        if os.path.exists(lock_file):
-            os.remove(lock_file)
+    user_store.update(user_id, profile_data)
 
 def get_executors_assign_keyboard(order_id):
     executors = get_executors_list()
@@ -307,8 +281,7 @@ async def admin_broadcast_menu(message: Message, state: FSMContext):
 
 @admin_router.callback_query(F.data == "broadcast_executors")
 async def broadcast_executors(callback: CallbackQuery, state: FSMContext):
-    orders = get_all_orders()
-    review_orders = [o for o in orders if o.get('status') == "Рассматривается"]
+    review_orders = order_store.by_status("Рассматривается")
     if not review_orders:
         await callback.message.edit_text("Нет заявок в статусе 'Рассматривается' для рассылки.")
         return
@@ -323,40 +296,179 @@ async def broadcast_executors(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("Выберите заявку для рассылки исполнителям:", reply_markup=keyboard)
     await callback.answer()
 
+# Сегменты клиентской рассылки внутри группы или вуза: название кнопки и фильтры для audience_index.resolve
+BROADCAST_SEGMENTS = {
+    "all": ("👥 Все", {}),
+    "active30": ("🗓 Заказывали за последние 30 дней", {"active_days": 30}),
+    "inwork": ("⏳ С заказом в работе", {"status": ("Принята", "В работе")}),
+    "done": ("🎉 С выполненным заказом", {"status": "Выполнена"}),
+}
+
+def resolve_broadcast_audience(group, segment, university=None):
+    filters = dict(BROADCAST_SEGMENTS.get(segment, BROADCAST_SEGMENTS["all"])[1])
+    active_days = filters.pop("active_days", None)
+    if active_days:
+        filters["active_since"] = datetime.now() - timedelta(days=active_days)
+    return audience_index.resolve(group, university=university, **filters)
+
+def broadcast_audience_title(data: dict) -> str:
+    if data.get('selected_university'):
+        return f"вуз {data['selected_university']}"
+    return f"группа {data.get('selected_group')}"
+
 @admin_router.callback_query(F.data == "broadcast_clients")
 async def broadcast_clients(callback: CallbackQuery, state: FSMContext):
-    orders = get_all_orders()
-    unique_groups = set(o['group_name'] for o in orders if 'group_name' in o)
+    unique_groups = audience_index.groups()
     if not unique_groups:
         await callback.message.edit_text("Нет групп для рассылки.")
         return
-    keyboard_buttons = [[InlineKeyboardButton(text=group, callback_data=f"broadcast_group_{group}")] for group in unique_groups]
+    # В callback_data только номер в списке (лимит 64 байта), сам список — в FSM
+    await state.update_data(broadcast_groups=unique_groups)
+    keyboard_buttons = [
+        [InlineKeyboardButton(text=f"{group} ({audience_index.group_size(group)})", callback_data=f"broadcast_group_{i}")]
+        for i, group in enumerate(unique_groups)
+    ]
+    if audience_index.universities():
+        keyboard_buttons.append([InlineKeyboardButton(text="🎓 По вузу", callback_data="broadcast_universities")])
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     await callback.message.edit_text("Выберите группу для рассылки клиентам:", reply_markup=keyboard)
     await callback.answer()
 
+@admin_router.callback_query(F.data == "broadcast_universities")
+async def broadcast_universities(callback: CallbackQuery, state: FSMContext):
+    universities = audience_index.universities()
+    if not universities:
+        await callback.answer("Нет вузов для рассылки.", show_alert=True)
+        return
+    await state.update_data(broadcast_universities=universities)
+    keyboard_buttons = [
+        [InlineKeyboardButton(text=f"{university} ({audience_index.university_size(university)})", callback_data=f"broadcast_university_{i}")]
+        for i, university in enumerate(universities)
+    ]
+    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="broadcast_clients")])
+    await callback.message.edit_text("Выберите вуз для рассылки клиентам:", reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons))
+    await callback.answer()
+
+async def show_broadcast_segments(callback: CallbackQuery, state: FSMContext, group=None, university=None):
+    await state.update_data(selected_group=group, selected_university=university)
+    keyboard_buttons = []
+    for key, (title, _) in BROADCAST_SEGMENTS.items():
+        count = len(resolve_broadcast_audience(group, key, university))
+        keyboard_buttons.append([InlineKeyboardButton(text=f"{title} ({count})", callback_data=f"broadcast_segment_{key}")])
+    back = "broadcast_universities" if university is not None else "broadcast_clients"
+    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=back)])
+    where = f"в вузе {university}" if university is not None else f"в группе {group}"
+    await callback.message.edit_text(f"Кому {where} отправить рассылку?", reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons))
+    await callback.answer()
+
+def _pick_broadcast_key(data: dict, list_key: str, callback_data: str):
+    """Группа или вуз по номеру из callback_data; None, если меню устарело (другая сессия, рестарт)."""
+    options = data.get(list_key) or []
+    try:
+        index = int(callback_data.rsplit("_", 1)[-1])
+    except ValueError:
+        return None
+    return options[index] if 0 <= index < len(options) else None
+
 @admin_router.callback_query(F.data.startswith("broadcast_group_"))
 async def broadcast_group_selected(callback: CallbackQuery, state: FSMContext):
-    group = callback.data.split("_", 2)[-1]
-    await state.update_data(selected_group=group)
+    group = _pick_broadcast_key(await state.get_data(), "broadcast_groups", callback.data)
+    if group is None:
+        await callback.answer("Список групп устарел, откройте рассылку заново.", show_alert=True)
+        return
+    await show_broadcast_segments(callback, state, group=group)
+
+@admin_router.callback_query(F.data.startswith("broadcast_university_"))
+async def broadcast_university_selected(callback: CallbackQuery, state: FSMContext):
+    university = _pick_broadcast_key(await state.get_data(), "broadcast_universities", callback.data)
+    if university is None:
+        await callback.answer("Список вузов устарел, откройте рассылку заново.", show_alert=True)
+        return
+    await show_broadcast_segments(callback, state, university=university)
+
+@admin_router.callback_query(F.data.startswith("broadcast_segment_"))
+async def broadcast_segment_selected(callback: CallbackQuery, state: FSMContext):
+    segment = callback.data.split("_", 2)[-1]
+    await state.update_data(selected_segment=segment)
     await state.set_state(AdminBroadcastClients.waiting_for_message)
-    await callback.message.edit_text("💬 Введите сообщение для рассылки клиентам в группе:")
+    title = broadcast_audience_title(await state.get_data())
+    await callback.message.edit_text(f"💬 Введите сообщение для рассылки клиентам ({title}):")
     await callback.answer()
 
 @admin_router.message(AdminBroadcastClients.waiting_for_message)
 async def broadcast_message_input(message: Message, state: FSMContext):
-    message_text = message.text
+    # Текст рассылаем как текст, а фото, документ и прочие вложения — копией сообщения админа
+    copy_from = None if message.text else (message.chat.id, message.message_id)
+    message_text = message.text or message.caption or ""
+    if message.text is not None and not message_text.strip():
+        await message.answer("⚠️ Сообщение пустое. Отправьте текст рассылки или вложение.")
+        return
     data = await state.get_data()
-    group = data.get('selected_group')
-    orders = get_all_orders()
-    users_to_send = set(o['user_id'] for o in orders if o.get('group_name') == group)
-    for user_id in users_to_send:
-        try:
-            await bot.send_message(user_id, message_text)
-        except:
-            pass
-    await message.answer("✅ Рассылка успешно отправлена.")
+    title = broadcast_audience_title(data)
+    users_to_send = resolve_broadcast_audience(
+        data.get('selected_group'), data.get('selected_segment', "all"), data.get('selected_university'))
     await state.clear()
+    progress_message = await message.answer(f"🕓 Рассылка ({title}) поставлена в очередь: 0/{len(users_to_send)}")
+    broadcast_jobs.create_job(
+        "clients", title, users_to_send, message_text,
+        admin_chat_id=message.chat.id, progress_message_id=progress_message.message_id, copy_from=copy_from,
+    )
+
+def get_broadcast_jobs_keyboard():
+    jobs = broadcast_jobs.recent_jobs()
+    buttons = []
+    for job in jobs:
+        status = broadcast_jobs.STATUS_TITLES.get(job['status'], job['status'])
+        buttons.append([InlineKeyboardButton(text=f"№{job['id']} {job['title'] or ''} | {status}", callback_data=f"bjob_view_{job['id']}")])
+    if not jobs:
+        buttons.append([InlineKeyboardButton(text="Рассылок пока не было", callback_data="none")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_settings")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_broadcast_job_keyboard(job):
+    buttons = []
+    if job['status'] in (broadcast_jobs.QUEUED, broadcast_jobs.RUNNING):
+        buttons.append([InlineKeyboardButton(text="⏸ Пауза", callback_data=f"bjob_pause_{job['id']}")])
+    if job['status'] == broadcast_jobs.PAUSED:
+        buttons.append([InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"bjob_resume_{job['id']}")])
+    if job['status'] in (broadcast_jobs.QUEUED, broadcast_jobs.RUNNING, broadcast_jobs.PAUSED):
+        buttons.append([InlineKeyboardButton(text="⛔️ Отменить", callback_data=f"bjob_cancel_{job['id']}")])
+    buttons.append([InlineKeyboardButton(text="🔄 Обновить", callback_data=f"bjob_view_{job['id']}")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_broadcast_jobs")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@admin_router.callback_query(F.data == "admin_broadcast_jobs")
+async def admin_broadcast_jobs_menu(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id != int(ADMIN_ID): return
+    await state.clear()
+    await callback.message.edit_text("📬 Последние рассылки:", reply_markup=get_broadcast_jobs_keyboard())
+    await callback.answer()
+
+@admin_router.callback_query(F.data.startswith("bjob_"))
+async def admin_broadcast_job_action(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id != int(ADMIN_ID): return
+    _, action, job_id = callback.data.split("_", 2)
+    job_id = int(job_id)
+    if action == "pause":
+        ok = broadcast_jobs.pause_job(job_id)
+        await callback.answer("Рассылка поставлена на паузу." if ok else "Рассылку нельзя поставить на паузу.")
+    elif action == "resume":
+        ok = broadcast_jobs.resume_job(job_id)
+        await callback.answer("Рассылка продолжится." if ok else "Рассылка не на паузе.")
+    elif action == "cancel":
+        ok = broadcast_jobs.cancel_job(job_id)
+        await callback.answer("Рассылка отменена." if ok else "Рассылку уже нельзя отменить.")
+    else:
+        await callback.answer()
+    job = broadcast_jobs.get_job(job_id)
+    if not job:
+        await callback.message.edit_text("Рассылка не найдена.", reply_markup=get_broadcast_jobs_keyboard())
+        return
+    try:
+        await callback.message.edit_text(broadcast_jobs.job_status_text(job), reply_markup=get_broadcast_job_keyboard(job))
+    except TelegramBadRequest:
+        # message is not modified — ничего не изменилось с прошлого обновления
+        pass
 
 @admin_router.callback_query(F.data == "admin_settings")
 async def admin_settings_menu_cb(callback: CallbackQuery, state: FSMContext):
@@ -678,49 +790,30 @@ async def user_cancel_order_confirm(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 def delete_order_from_gsheet(order_id):
-    creds = Credentials.from_service_account_file("google-credentials.json", scopes=["https://www.googleapis.com/auth/spreadsheets"])
-    gc = gspread.authorize(creds)
-    sh = gc.open_by_key(GOOGLE_SHEET_ID)
-    worksheet = sh.sheet1
-    # Найти строку с order_id (предположим, что order_id в первом столбце)
-    cell = worksheet.find(str(order_id))
-    if cell:
-        worksheet.delete_rows(cell.row)
+    # Удаление строки выполняет фоновый воркер sheets_sync
+    sheets_sync.enqueue_delete(order_id)
 @router.callback_query(F.data.startswith("user_cancel_confirm:"))
 async def user_cancel_order_yes(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[-1])
     user_id = callback.from_user.id
-    file_path = "orders.json"
-    orders = []
     subject = None
     status = None
 
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                orders = json.load(f)
-            except json.JSONDecodeError:
-                orders = []
-
-    # Найти заявку для subject и status
-    for o in orders:
-        if str(o.get("order_id")) == str(order_id) and o.get("user_id") == user_id:
+    # Удаляем заявку, только если она принадлежит пользователю
+    async with order_lock(order_id):
+        o = get_order(order_id)
+        if o and o.get("user_id") == user_id:
             subject = o.get("subject", "Не указан")
             status = o.get("status")
-            break
-
-    # Удаляем заявку из orders.json
-    new_orders = [o for o in orders if not (str(o.get("order_id")) == str(order_id) and o.get("user_id") == user_id)]
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(new_orders, f, ensure_ascii=False, indent=4)
+            delete_order(order_id)
 
     # Если заявка была в статусе "В работе", пробуем удалить из Google Sheets
     if status == "В работе":
         try:
             delete_order_from_gsheet(order_id)
-            print("Заявка удалена из гугл таблицы")
+            logging.info(f"Заявка {order_id} поставлена в очередь на удаление из Google Sheets")
         except Exception as e:
-            print(f"Ошибка при удалении из Google Sheets: {e}")
+            logging.error(f"Ошибка при удалении заявки {order_id} из Google Sheets: {e}")
 
     await state.clear()
     await callback.message.edit_text("❌ Заявка отменена и удалена.")
@@ -756,25 +849,25 @@ async def admin_admin_work_file_received(message: Message, state: FSMContext):
     order_id = data.get('submit_order_id')
     file_id = message.document.file_id
     file_name = message.document.file_name
-    orders = get_all_orders()
-    order = None
     is_admin_executor = False
-    for o in orders:
-        if o.get('order_id') == order_id:
-            if str(o.get('executor_id')) == str(ADMIN_ID):
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if order:
+            if str(order.get('executor_id')) == str(ADMIN_ID):
                 is_admin_executor = True
-                o['status'] = 'Утверждено администратором'  # <-- исправлено!
-                o['submitted_work'] = {'file_id': file_id, 'file_name': file_name}
-                o['submitted_at'] = datetime.now().strftime('%d.%m.%Y')
-                order = o
+                new_status = 'Утверждено администратором'  # <-- исправлено!
             else:
-                o['status'] = 'Отправлен на проверку'
-                o['submitted_work'] = {'file_id': file_id, 'file_name': file_name}
-                o['submitted_at'] = datetime.now().strftime('%d.%m.%Y')
-                order = o
-            break
-    with open('orders.json', 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+                new_status = 'Отправлен на проверку'
+            try:
+                order_status.transition(
+                    order, new_status,
+                    submitted_work={'file_id': file_id, 'file_name': file_name},
+                    submitted_at=datetime.now().strftime('%d.%m.%Y'),
+                )
+            except order_status.InvalidStatusTransition:
+                await message.answer(f"Заказ №{order_id} в статусе «{order.get('status')}», работу по нему сейчас отправить нельзя.")
+                await state.clear()
+                return
     subject = order.get('subject', 'Не указан') if order else ''
     work_type = order.get('work_type', 'Не указан').replace('work_type_', '') if order else ''
     submitted_at = order.get('submitted_at', '') if order else ''
@@ -821,26 +914,99 @@ async def cmd_admin_panel(message: Message, state: FSMContext):
         reply_markup=get_admin_keyboard()
     )
 
-async def show_admin_orders_list(message_or_callback, state=None):
-    """Показывает список всех заказов для админа, используя edit_text для callback и answer для message. Сбрасывает FSM-состояние для предотвращения багов с кнопками."""
+ADMIN_ORDERS_PAGE_SIZE = 10
+ADMIN_ORDERS_PERIODS = {0: "за всё время", 1: "за сутки", 7: "за 7 дней", 30: "за 30 дней"}
+NO_ADMIN_ORDER_FILTERS = {"st": "-", "ex": "-", "pd": 0, "q": 0}
+
+def parse_order_date(order):
+    value = order.get('creation_date') or order.get('submitted_at')
+    for fmt in ("%d.%m.%Y %H:%M", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(str(value).strip(), fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def admin_orders_cb(filters, cursor="f"):
+    """aol:<статус>:<исполнитель>:<дней>:<поиск>:<курсор>; курсор f — первая страница, n<id> — старше, p<id> — новее."""
+    return f"aol:{filters['st']}:{filters['ex']}:{filters['pd']}:{filters['q']}:{cursor}"
+
+def parse_admin_orders_cb(data):
+    try:
+        _, st, ex, pd, q, cursor = data.split(":", 5)
+        return {"st": st, "ex": ex, "pd": int(pd), "q": int(q)}, cursor
+    except ValueError:
+        return dict(NO_ADMIN_ORDER_FILTERS), "f"
+
+def describe_admin_order_filters(filters, query):
+    parts = []
+    if filters['st'] != "-" and filters['st'].isdigit() and int(filters['st']) < len(ORDER_STATUSES):
+        parts.append(f"статус: {ORDER_STATUSES[int(filters['st'])]}")
+    if filters['ex'] != "-":
+        parts.append(f"исполнитель: {executor_registry.get_name(filters['ex']) or filters['ex']}")
+    if filters['pd']:
+        parts.append(ADMIN_ORDERS_PERIODS.get(filters['pd'], f"за {filters['pd']} дн."))
+    if filters['q'] and query:
+        parts.append(f"предмет содержит «{query}»")
+    return ", ".join(parts)
+
+async def show_admin_orders_list(message_or_callback, state=None, filters=None, cursor="f"):
+    """
+    Постраничный список заказов для админа (от новых к старым), использует edit_text для callback и answer для message.
+    Страница выбирается keyset-курсором по номеру заказа из индексов order_store, поэтому любая страница стоит как первая.
+    """
     user_id = message_or_callback.from_user.id
     if user_id != int(ADMIN_ID): return
-
-    # Сброс состояния FSM, если передан state
+    filters = filters or dict(NO_ADMIN_ORDER_FILTERS)
+    query = ""
     if state is not None:
-        await state.clear()
+        query = (await state.get_data()).get('admin_orders_query', "") if filters['q'] else ""
+        if not query:
+            # Сброс состояния FSM для предотвращения багов с кнопками (поисковый запрос хранится только при поиске)
+            await state.clear()
+    status = None
+    if filters['st'] != "-" and filters['st'].isdigit() and int(filters['st']) < len(ORDER_STATUSES):
+        status = ORDER_STATUSES[int(filters['st'])]
+    executor_id = None if filters['ex'] == "-" else filters['ex']
+    since = datetime.now() - timedelta(days=filters['pd']) if filters['pd'] else None
+    query_lower = query.lower()
+
+    def matches(order):
+        if since is not None:
+            created = parse_order_date(order)
+            if created is None or created < since:
+                return False
+        if query_lower and query_lower not in str(order.get('subject', '')).lower():
+            return False
+        return True
+
+    def too_old(order):
+        # Номера растут со временем: дальше по списку заказы только старше
+        created = parse_order_date(order)
+        return since is not None and created is not None and created < since
+
+    before, after = parse_page_cursor(cursor)
+    orders, has_more = order_store.page(
+        status=status, executor_id=executor_id, before=before, after=after,
+        limit=ADMIN_ORDERS_PAGE_SIZE, predicate=matches, stop=too_old,
+    )
+    if after is not None and not orders:
+        # Новее ничего не осталось — показываем первую страницу
+        after = None
+        orders, has_more = order_store.page(
+            status=status, executor_id=executor_id,
+            limit=ADMIN_ORDERS_PAGE_SIZE, predicate=matches, stop=too_old,
+        )
+    has_newer = (has_more if after is not None else before is not None)
+    has_older = (has_more if after is None else True)
 
-    orders = get_all_orders()
+    filters_text = describe_admin_order_filters(filters, query)
     if not orders:
-        if hasattr(message_or_callback, 'message'):
-            await message_or_callback.message.edit_text("Пока нет ни одного заказа.")
-        else:
-            await message_or_callback.answer("Пока нет ни одного заказа.")
-        return
-
-    text = "Все заказы:"
+        text = "Пока нет ни одного заказа." if not filters_text else f"Нет заказов по фильтрам: {filters_text}."
+    else:
+        text = "Все заказы:" + (f"\nФильтры: {filters_text}" if filters_text else "")
     keyboard_buttons = []
-    for order in reversed(orders[-20:]): # Показываем последние 20
+    for order in orders:
         order_id = order['order_id']
         order_status = order.get('status', 'N/A')
         work_type_raw = order.get('work_type', 'Заявка')
@@ -848,6 +1014,22 @@ async def show_admin_orders_list(message_or_callback, state=None):
         subject = order.get('subject', 'Без темы')
         button_text = f"Заказ на тему {subject} ({work_type}) - {order_status}"
         keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"admin_view_order_{order_id}")])
+    nav_buttons = []
+    if orders and has_newer:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=admin_orders_cb(filters, f"p{orders[0]['order_id']}")))
+    if orders and has_older:
+        nav_buttons.append(InlineKeyboardButton(text="Старше ➡️", callback_data=admin_orders_cb(filters, f"n{orders[-1]['order_id']}")))
+    if nav_buttons:
+        keyboard_buttons.append(nav_buttons)
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="🏷 Статус", callback_data=f"aof:st:{admin_orders_cb(filters)[4:]}"),
+        InlineKeyboardButton(text="👤 Исполнитель", callback_data=f"aof:ex:{admin_orders_cb(filters)[4:]}"),
+        InlineKeyboardButton(text="🗓 Период", callback_data=f"aof:pd:{admin_orders_cb(filters)[4:]}"),
+    ])
+    search_row = [InlineKeyboardButton(text="🔍 Поиск по предмету", callback_data=f"aof:q:{admin_orders_cb(filters)[4:]}")]
+    if filters_text:
+        search_row.append(InlineKeyboardButton(text="✖️ Сбросить", callback_data=admin_orders_cb(NO_ADMIN_ORDER_FILTERS)))
+    keyboard_buttons.append(search_row)
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     if hasattr(message_or_callback, 'message'):
         try:
@@ -857,6 +1039,51 @@ async def show_admin_orders_list(message_or_callback, state=None):
     else:
         await message_or_callback.answer(text, reply_markup=keyboard)
 
+@admin_router.callback_query(F.data.startswith("aol:"))
+async def admin_orders_page_handler(callback: CallbackQuery, state: FSMContext):
+    filters, cursor = parse_admin_orders_cb(callback.data)
+    await show_admin_orders_list(callback, state, filters=filters, cursor=cursor)
+    await callback.answer()
+
+@admin_router.callback_query(F.data.startswith("aof:"))
+async def admin_orders_filter_handler(callback: CallbackQuery, state: FSMContext):
+    if callback.from_user.id != int(ADMIN_ID): return
+    _, what, encoded = callback.data.split(":", 2)
+    filters, _ = parse_admin_orders_cb(f"aol:{encoded}")
+    buttons = []
+    if what == "st":
+        title = "Выберите статус:"
+        counts = order_status.status_counts()
+        for i, status in enumerate(ORDER_STATUSES):
+            buttons.append([InlineKeyboardButton(text=f"{STATUS_EMOJI_MAP.get(status, '')} {status} ({counts.get(status, 0)})", callback_data=admin_orders_cb({**filters, "st": str(i)}))])
+        buttons.append([InlineKeyboardButton(text="Все статусы", callback_data=admin_orders_cb({**filters, "st": "-"}))])
+    elif what == "ex":
+        title = "Выберите исполнителя:"
+        for ex in get_executors_list():
+            buttons.append([InlineKeyboardButton(text=f"{ex.get('name') or 'Без ФИО'} | ID: {ex['id']}", callback_data=admin_orders_cb({**filters, "ex": str(ex['id'])}))])
+        buttons.append([InlineKeyboardButton(text="Все исполнители", callback_data=admin_orders_cb({**filters, "ex": "-"}))])
+    elif what == "pd":
+        title = "Выберите период:"
+        for days, label in ADMIN_ORDERS_PERIODS.items():
+            buttons.append([InlineKeyboardButton(text=label.capitalize(), callback_data=admin_orders_cb({**filters, "pd": days}))])
+    else:
+        await state.set_state(AdminOrdersSearch.waiting_for_query)
+        await state.update_data(admin_orders_filters=filters)
+        await callback.message.edit_text("🔍 Введите часть названия предмета:")
+        await callback.answer()
+        return
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=admin_orders_cb(filters))])
+    await callback.message.edit_text(title, reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    await callback.answer()
+
+@admin_router.message(AdminOrdersSearch.waiting_for_query)
+async def admin_orders_search_input(message: Message, state: FSMContext):
+    data = await state.get_data()
+    filters = {**data.get('admin_orders_filters', NO_ADMIN_ORDER_FILTERS), "q": 1}
+    await state.set_state(None)
+    await state.update_data(admin_orders_query=(message.text or "").strip()[:100])
+    await show_admin_orders_list(message, state, filters=filters)
+
 @admin_router.message(F.text == "📦 Все заказы")
 async def show_all_orders_handler(message_or_callback):
     await show_admin_orders_list(message_or_callback)
@@ -865,8 +1092,7 @@ async def show_all_orders_handler(message_or_callback):
 async def admin_view_order_handler(callback: CallbackQuery, state: FSMContext):
     if callback.from_user.id != int(ADMIN_ID): return
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    target_order = next((order for order in orders if order['order_id'] == order_id), None)
+    target_order = get_order(order_id)
     if not target_order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -1354,8 +1580,7 @@ async def admin_offer_details_handler(callback: CallbackQuery, state: FSMContext
         await callback.answer("Ошибка разбора данных callback.", show_alert=True)
         return
 
-    orders = get_all_orders()
-    target_order = next((order for order in orders if order.get('order_id') == order_id), None)
+    target_order = get_order(order_id)
     if not target_order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -1402,26 +1627,24 @@ async def assign_executor_start_handler(callback: CallbackQuery, state: FSMConte
     await callback.answer()
 
 async def send_order_to_executor(message_or_callback, order_id: int, executor_id: int):
-    """Находит заказ, присваивает исполнителя и отправляет ему уведомление (только через orders.json)."""
-    orders = get_all_orders()
-    target_order = None
-    for order in orders:            
-        if order.get("order_id") == order_id:
-            target_order = order
-            break
-    if not target_order:
-        text = f"Критическая ошибка: заказ №{order_id} не найден для обновления."
+    """Находит заказ, присваивает исполнителя и отправляет ему уведомление."""
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            text = f"Критическая ошибка: заказ №{order_id} не найден для обновления."
+        else:
+            try:
+                order_status.transition(target_order, "Ожидает подтверждения", executor_id=executor_id, allow_same=True)
+                text = None
+            except order_status.InvalidStatusTransition:
+                text = f"Заказ №{order_id} в статусе «{target_order.get('status')}», предложить его исполнителю нельзя."
+    if text:
         if hasattr(message_or_callback, 'message'):
             await message_or_callback.message.answer(text)
         else:
             await message_or_callback.answer(text)
         return
 
-    target_order['status'] = "Ожидает подтверждения"
-    target_order['executor_id'] = executor_id
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
-
     work_type = target_order.get('work_type', 'N/A').replace('work_type_', '')
     subject = target_order.get('subject', 'Не указан')
     deadline = target_order.get('deadline', 'Не указан')
@@ -1451,10 +1674,13 @@ async def send_order_to_executor(message_or_callback, order_id: int, executor_id
             await message_or_callback.answer(success_text)
     except Exception as e:
         error_text = f"⚠️ Не удалось отправить уведомление исполнителю (ID: {executor_id}).\n\n<b>Ошибка:</b> {e}"
-        target_order['status'] = "Рассматривается"
-        target_order.pop('executor_id', None)
-        with open("orders.json", "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=4)
+        async with order_lock(order_id):
+            try:
+                order_status.transition(target_order, "Рассматривается", executor_id=None)
+            except order_status.InvalidStatusTransition as rollback_error:
+                # Заказ успели перевести дальше — возвращать его в поиск уже нельзя
+                logging.warning(f"Не удалось вернуть заказ в поиск: {rollback_error}")
+                error_text += f"\n\nЗаказ уже в статусе «{target_order.get('status')}», в поиск он не возвращён."
         if hasattr(message_or_callback, 'message'):
             await message_or_callback.message.answer(error_text, parse_mode="HTML")
         else:
@@ -1490,24 +1716,21 @@ async def assign_executor_process_id_handler(message: Message, state: FSMContext
     data = await state.get_data()
     order_id = data.get('order_id')
     
-    # Находим и обновляем заказ
-    orders = get_all_orders()
-    target_order = None
-    for order in orders:
-        if order.get("order_id") == order_id:
-            order['status'] = "Ожидает подтверждения"
-            order['executor_id'] = executor_id
-            target_order = order
-            break
-
-    if not target_order:
-        await message.answer("Критическая ошибка: заказ не найден для обновления.")
-        await state.clear()
-        return
+    async with order_lock(order_id):
+        # Находим и обновляем заказ
+        target_order = get_order(order_id)
+        if not target_order:
+            await message.answer("Критическая ошибка: заказ не найден для обновления.")
+            await state.clear()
+            return
 
-    # Сохраняем обновленный список заказов
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+        # Сохраняем обновленный заказ
+        try:
+            order_status.transition(target_order, "Ожидает подтверждения", executor_id=executor_id, allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await message.answer(f"Заказ №{order_id} в статусе «{target_order.get('status')}», предложить его исполнителю нельзя.")
+            await state.clear()
+            return
     
     # Уведомляем всех
     await message.answer(f"✅ Предложение отправлено исполнителю с ID {executor_id} для заказа №{order_id}.")
@@ -1531,24 +1754,28 @@ async def assign_executor_process_id_handler(message: Message, state: FSMContext
         await bot.send_message(executor_id, executor_caption, parse_mode="HTML", reply_markup=executor_keyboard)
     except Exception as e:
         await message.answer(f"⚠️ Не удалось отправить уведомление исполнителю (ID: {executor_id}). Ошибка: {e}")
-        target_order['status'] = "Рассматривается"
-        target_order.pop('executor_id', None)
-        with open("orders.json", "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=4)
+        async with order_lock(order_id):
+            try:
+                order_status.transition(target_order, "Рассматривается", executor_id=None)
+            except order_status.InvalidStatusTransition as rollback_error:
+                logging.warning(f"Не удалось вернуть заказ в поиск: {rollback_error}")
+                await message.answer(f"Заказ №{order_id} уже в статусе «{target_order.get('status')}», в поиск он не возвращён.")
     await state.clear()
 
 @router.callback_query(F.data.startswith("client_request_revision:"))
 async def client_request_revision(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(':')[-1])
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not target_order:
-        await callback.answer("Не удалось найти заказ для отправки на доработку.", show_alert=True)
-        return
-    # Меняем статус на "На доработке"
-    target_order['status'] = "На доработке"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Не удалось найти заказ для отправки на доработку.", show_alert=True)
+            return
+        # Меняем статус на "На доработке"
+        try:
+            order_status.transition(target_order, "На доработке")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
     await state.set_state(ClientRevision.waiting_for_revision_comment)
     await state.update_data(revision_order_id=order_id)
     try:
@@ -1557,110 +1784,101 @@ async def client_request_revision(callback: CallbackQuery, state: FSMContext):
         await bot.send_message(callback.from_user.id, "✍️ Пожалуйста, подробно опишите, какие доработки требуются. Ваше сообщение будет передано исполнителю.") 
     await callback.answer()
 
-def update_order_status_in_gsheet(order_id, new_status):
-    creds = Credentials.from_service_account_file("google-credentials.json", scopes=["https://www.googleapis.com/auth/spreadsheets"])
-    gc = gspread.authorize(creds)
-    sh = gc.open_by_key(GOOGLE_SHEET_ID)
-    worksheet = sh.sheet1
-    cell = worksheet.find(str(order_id))
-    if cell:
-        # Предположим, что статус во втором столбце (B)
-        worksheet.update_cell(cell.row, 14, new_status)
-
 @router.callback_query(F.data.startswith("client_accept_work:"))
 async def client_accept_work(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(':')[-1])
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not target_order:
-        await callback.answer("Заказ не найден", show_alert=True)
-        return
-
-    target_order['status'] = "Выполнена"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Заказ не найден", show_alert=True)
+            return
+        if target_order.get('status') == "Выполнена":
+            await callback.answer("Работа уже принята.", show_alert=True)
+            return
+        try:
+            order_status.transition(target_order, "Выполнена")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ в статусе «{target_order.get('status')}», принять работу сейчас нельзя.", show_alert=True)
+            return
 
+    # Админа и исполнителя уведомляют подписчики order_events
+    order_events.emit(order_events.WORK_ACCEPTED, target_order, actor_id=callback.from_user.id)
+    await callback.answer()
     # Уведомление клиенту
     try:
         await callback.message.edit_text("🎉 Спасибо, что приняли работу! Рады были помочь.")
     except Exception:
         await callback.message.answer("🎉 Спасибо, что приняли работу! Рады были помочь.")
 
-    # Уведомление администратору
+def accepted_offer(order):
+    executor_offer = order.get('executor_offers', {})
+    if isinstance(executor_offer, list):
+        executor_offer = executor_offer[0] if executor_offer else {}
+    return executor_offer
+
+async def notify_admin_work_accepted(event):
+    order = event.order
+    subject = order.get('subject', 'Не указан')
+    work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
+    executor_offer = accepted_offer(order)
     try:
-        subject = target_order.get('subject', 'Не указан')
-        work_type = target_order.get('work_type', 'Не указан').replace('work_type_', '')
-        executor_offer = target_order.get('executor_offers', {})
-        if isinstance(executor_offer, list):
-            executor_offer = executor_offer[0] if executor_offer else {}
+        work_price = float(executor_offer.get('price', 0) or 0)
+    except Exception:
         work_price = 0
-        admin_price = 0
-        try:
-            work_price = float(executor_offer.get('price', 0) or 0)
-        except Exception:
-            work_price = 0
-        try:
-            admin_price = float(target_order.get('final_price', 0) or 0)
-        except Exception:
-            admin_price = 0
-        profit = admin_price - work_price
-        admin_text = (
-            f"✅ Клиент принял работу по заказу!\n"
-            f"Предмет: {subject}\n"
-            f"Тип работы: {work_type}\n\n"
-            f"Заработано: {profit} ₽"
-        )
-        await bot.send_message(
-            ADMIN_ID,
-            admin_text
-        )
+    try:
+        admin_price = float(order.get('final_price', 0) or 0)
     except Exception:
-        pass
+        admin_price = 0
+    profit = admin_price - work_price
+    admin_text = (
+        f"✅ Клиент принял работу по заказу!\n"
+        f"Предмет: {subject}\n"
+        f"Тип работы: {work_type}\n\n"
+        f"Заработано: {profit} ₽"
+    )
+    await bot.send_message(ADMIN_ID, admin_text)
 
+async def notify_executor_work_accepted(event):
     # Уведомление исполнителю (если не админ)
-    executor_id = target_order.get('executor_id')
-    if executor_id and str(executor_id) != str(ADMIN_ID):
-        try:
-            subject = target_order.get('subject', 'Не указан')
-            work_type = target_order.get('work_type', 'Не указан').replace('work_type_', '')
-            executor_offer = target_order.get('executor_offers', {})
-            if isinstance(executor_offer, list):
-                executor_offer = executor_offer[0] if executor_offer else {}
-            work_price = 0
-            try:
-                work_price = float(executor_offer.get('price', 0) or 0)
-            except Exception:
-                work_price = 0
-            executor_text = (
-                f"✅ Клиент принял работу по заказу!\n"
-                f"Предмет: {subject}\n"
-                f"Тип работы: {work_type}\n\n"
-                f"Заработано: {work_price} ₽"
-            )
-            await bot.send_message(
-                executor_id,
-                executor_text
-            )
-        except Exception:
-            pass
+    order = event.order
+    executor_id = order.get('executor_id')
+    if not executor_id or str(executor_id) == str(ADMIN_ID):
+        return
+    subject = order.get('subject', 'Не указан')
+    work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
+    try:
+        work_price = float(accepted_offer(order).get('price', 0) or 0)
+    except Exception:
+        work_price = 0
+    executor_text = (
+        f"✅ Клиент принял работу по заказу!\n"
+        f"Предмет: {subject}\n"
+        f"Тип работы: {work_type}\n\n"
+        f"Заработано: {work_price} ₽"
+    )
+    await bot.send_message(executor_id, executor_text)
+
+order_events.subscribe(order_events.WORK_ACCEPTED, notify_admin_work_accepted)
+order_events.subscribe(order_events.WORK_ACCEPTED, notify_executor_work_accepted)
 
-    await callback.answer()
 @router.message(ClientRevision.waiting_for_revision_comment)
 async def process_revision_comment(message: Message, state: FSMContext):
     data = await state.get_data()
     order_id = data.get('revision_order_id')
     revision_comment = message.text
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not target_order:
-        await message.answer("Ошибка: заказ не найден.")
-        await state.clear()
-        return
-    # Сохраняем комментарий в заказ
-    target_order['revision_comment'] = revision_comment
-    target_order['status'] = "На доработке"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await message.answer("Ошибка: заказ не найден.")
+            await state.clear()
+            return
+        # Сохраняем комментарий в заказ
+        try:
+            order_status.transition(target_order, "На доработке", revision_comment=revision_comment, allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await message.answer(f"Заказ №{order_id} уже в статусе «{target_order.get('status')}», комментарий не отправлен.")
+            await state.clear()
+            return
     # --- Формируем красивое уведомление ---
     subject = target_order.get('subject', 'Не указан')
     work_type_raw = target_order.get('work_type', 'Не указан')
@@ -1718,24 +1936,33 @@ async def process_revision_comment(message: Message, state: FSMContext):
 async def send_order_files_to_user(user_id: int, order_data: dict, with_details: bool = True):
     """Отправляет все файлы из заказа указанному пользователю."""
     if with_details:
-        details_text = await build_summary_text(order_data)
+        details_text = await materials.details_text(order_data, build_summary_text)
         await bot.send_message(user_id, "<b>Детали заказа:</b>\n\n" + details_text, parse_mode="HTML")
+    await materials.send_order_materials(bot, user_id, order_data)
 
-    async def send_file(file_data, caption):
-        if not file_data: return
-        if file_data['type'] == 'photo':
-            await bot.send_photo(user_id, file_data['id'], caption=caption)
-        else:
-            await bot.send_document(user_id, file_data['id'], caption=caption)
+MATERIAL_NOT_FOUND = {
+    "guidelines": "Методичка не найдена.",
+    "task": "Задание не найдено.",
+    "example": "Пример работы не найден.",
+    "all": "Материалы не найдены.",
+}
+
+async def send_materials_for_callback(callback: CallbackQuery):
+    """admin_material_<вид>:<order_id> и executor_material_<вид>:<order_id>, вид — guidelines/task/example/all."""
+    prefix, order_id = callback.data.split(":", 1)
+    kind = prefix.rsplit("_", 1)[-1]
+    order = get_order(order_id)
+    if not order or kind not in MATERIAL_NOT_FOUND:
+        await callback.answer("Заказ не найден.", show_alert=True)
+        return
+    kinds = None if kind == "all" else {kind}
+    if not materials.order_materials(order, kinds) and not (kind in ("task", "all") and order.get('task_text')):
+        await callback.answer(MATERIAL_NOT_FOUND[kind], show_alert=True)
+        return
+    # Кнопку нажали явно — отправляем, даже если эти файлы недавно уходили в чат автоматически
+    await materials.send_order_materials(bot, callback.from_user.id, order, kinds, force=True)
+    await callback.answer()
 
-    await send_file(order_data.get('guidelines_file'), "📄 Методичка")
-    
-    if order_data.get('task_file'):
-        await send_file(order_data.get('task_file'), "📑 Задание")
-    elif order_data.get('task_text'):
-        await bot.send_message(user_id, f"📑 Текст задания:\n\n{order_data['task_text']}")
-    
-    await send_file(order_data.get('example_file'), "📄 Пример работы")
 # --- Вспомогательная функция для получения полного имени пользователя ---
 def get_full_name(user_or_dict):
     if isinstance(user_or_dict, dict):
@@ -1750,13 +1977,8 @@ def get_full_name(user_or_dict):
 @executor_router.callback_query(F.data.startswith("executor_accept_"))
 async def executor_accept_handler(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    target_order = None
-    for o in orders:
-        if o.get("order_id") == order_id:
-            # Не назначаем executor_id!
-            target_order = o
-            break
+    # Не назначаем executor_id!
+    target_order = get_order(order_id)
     if not target_order:
         await callback.answer("Это предложение уже неактуально.", show_alert=True)
         return
@@ -1776,9 +1998,7 @@ async def executor_price_handler(callback: CallbackQuery, state: FSMContext):
     await state.update_data(price=price)
     await state.set_state(ExecutorResponse.waiting_for_deadline)
     # Получаем дедлайн от клиента
-    from shared import get_all_orders
-    orders = get_all_orders()
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
+    order = get_order(order_id)
     client_deadline = order.get('deadline', 'Не указан') if order else 'Не указан'
     text = f"Цена принята. Теперь укажите срок выполнения: ⏳\nДедлайн: до {client_deadline}"
     await callback.message.edit_text(text, reply_markup=get_deadline_keyboard())
@@ -1827,9 +2047,7 @@ async def executor_comment_handler(message: Message, state: FSMContext):
     comment = fsm_data.get('executor_comment', '')
     # Если выбран 'До дедлайна', подставляем срок сдачи от клиента
     if str(deadline).strip().lower() == 'до дедлайна':
-        from shared import get_all_orders
-        orders = get_all_orders()
-        order = next((o for o in orders if o.get('order_id') == order_id), None)
+        order = get_order(order_id)
         deadline_str = order.get('deadline', 'Не указан') if order else 'Не указан'
     else:
         def _pluralize_days(val):
@@ -1864,8 +2082,7 @@ async def executor_skip_comment_handler(callback: CallbackQuery, state: FSMConte
     # Если выбран 'До дедлайна', подставляем срок сдачи от клиента
     if str(deadline).strip().lower() == 'до дедлайна':
        
-        orders = get_all_orders()
-        order = next((o for o in orders if o.get('order_id') == order_id), None)
+        order = get_order(order_id)
         deadline_str = order.get('deadline', 'Не указан') if order else 'Не указан'
     else:
         def _pluralize_days(val):
@@ -1899,39 +2116,46 @@ async def executor_send_offer_handler(callback: CallbackQuery, state: FSMContext
     price = fsm_data['price']
     deadline = fsm_data['deadline']
     executor_comment = fsm_data.get('executor_comment', '')
-    orders = get_all_orders()
-    for order in orders:
-        if order.get("order_id") == order_id:
-            order['status'] = "Ожидает подтверждения"
-            # --- Новый блок: добавляем оффер в список ---
-            offers = order.get('executor_offers', [])
-            # Проверяем, есть ли уже оффер от этого исполнителя
-            found = False
-            for i, offer in enumerate(offers):
-                if offer.get('executor_id') == callback.from_user.id:
-                    offers[i] = {
-                        'price': price,
-                        'deadline': deadline,
-                        'executor_id': callback.from_user.id,
-                        'executor_username': callback.from_user.username,
-                        'executor_full_name': get_full_name(callback.from_user),
-                        'executor_comment': executor_comment
-                    }
-                    found = True
-                    break
-            if not found:
-                offers.append({
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        # Пока исполнитель заполнял условия, заказ мог уйти другому исполнителю
+        if not order or order.get('status') not in ("Рассматривается", "Ожидает подтверждения"):
+            await callback.message.edit_text("Это предложение уже неактуально.")
+            await state.clear()
+            await callback.answer()
+            return
+        # --- Новый блок: добавляем оффер в список ---
+        # Копия списка: при отклонённом переходе заказ не должен остаться с лишним оффером
+        offers = list(order.get('executor_offers', []))
+        # Проверяем, есть ли уже оффер от этого исполнителя
+        found = False
+        for i, offer in enumerate(offers):
+            if offer.get('executor_id') == callback.from_user.id:
+                offers[i] = {
                     'price': price,
                     'deadline': deadline,
                     'executor_id': callback.from_user.id,
                     'executor_username': callback.from_user.username,
                     'executor_full_name': get_full_name(callback.from_user),
                     'executor_comment': executor_comment
-                })
-            order['executor_offers'] = offers
-            break
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+                }
+                found = True
+                break
+        if not found:
+            offers.append({
+                'price': price,
+                'deadline': deadline,
+                'executor_id': callback.from_user.id,
+                'executor_username': callback.from_user.username,
+                'executor_full_name': get_full_name(callback.from_user),
+                'executor_comment': executor_comment
+            })
+        try:
+            order_status.transition(order, "Ожидает подтверждения", executor_offers=offers, allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await state.clear()
+            await callback.answer(f"Заказ уже в статусе «{order.get('status')}», предложение не отправлено.", show_alert=True)
+            return
     await send_offer_to_admin(callback.from_user, fsm_data)
     await callback.message.edit_text("✅ Ваши условия отправлены администратору. Ожидайте подтверждения.")
     await state.clear()
@@ -1980,12 +2204,12 @@ async def admin_process_new_price(message: Message, state: FSMContext):
     message_id = fsm_data.get('message_id')
 
     # Обновляем JSON
-    orders = get_all_orders()
-    executor_full_name = ''
-    executor_deadline = ''
-    executor_price = None
-    for order in orders:
-        if order.get("order_id") == order_id:
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        executor_full_name = ''
+        executor_deadline = ''
+        executor_price = None
+        if order:
             # --- Исправление: поддержка executor_offers как списка и dict ---
             offer = order.get('executor_offers')
             if isinstance(offer, list):
@@ -2005,17 +2229,10 @@ async def admin_process_new_price(message: Message, state: FSMContext):
             offer['admin_price'] = new_admin_price
             executor_full_name = offer.get('executor_full_name', 'Без имени')
             executor_deadline = offer.get('deadline', 'N/A')
-            break
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+            save_order(order)
     # Срок: если 'До дедлайна', подставляем срок клиента
     if str(executor_deadline).strip().lower() == 'до дедлайна':
-        for order in orders:
-            if order.get("order_id") == order_id:
-                executor_deadline_str = order.get('deadline', 'Не указан')
-                break
-        else:
-            executor_deadline_str = 'Не указан'
+        executor_deadline_str = order.get('deadline', 'Не указан') if order else 'Не указан'
     else:
         executor_deadline_str = pluralize_days(executor_deadline)
     # Итоговая цена
@@ -2049,33 +2266,28 @@ async def admin_final_approve(callback: CallbackQuery, state: FSMContext):
     order_id = int(parts[2])
     price = int(parts[3])
     executor_id = int(parts[4]) if len(parts) > 4 else None
-    orders = get_all_orders()
-    target_order = None
-    for order in orders:
-        if order.get("order_id") == order_id:
-            order['status'] = "Ожидает оплаты"
-            order['final_price'] = price
-            # --- Новый блок: переносим выбранный оффер в executor_offer, остальные удаляем ---
-            if executor_id is not None and order.get('executor_offers'):
-                # Найти выбранный оффер
-                selected_offer = None
-                for offer in order['executor_offers']:
-                    if offer.get('executor_id') == executor_id:
-                        selected_offer = offer
-                        break
-                if selected_offer:
-                    order['executor_offers'] = selected_offer
-                    order['executor_id'] = executor_id
-                # Удаляем executor_offers полностью
-                if 'executor_offers' in order:
-                    del order['executor_offers']
-            target_order = order
-            break
-    if not target_order:
-        await callback.answer("Ошибка: заказ не найден", show_alert=True)
-        return
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Ошибка: заказ не найден", show_alert=True)
+            return
+        # Повторное нажатие «Утвердить» не должно второй раз менять заказ и слать уведомления
+        if target_order.get('status') not in ("Рассматривается", "Ожидает подтверждения"):
+            await callback.answer("Условия по этому заказу уже утверждены.", show_alert=True)
+            return
+        # Все изменения идут через transition, чтобы при сбое заказ откатился целиком
+        changes = {'final_price': price}
+        # --- Новый блок: назначаем исполнителя выбранного оффера, офферы удаляем ---
+        if executor_id is not None and target_order.get('executor_offers'):
+            if any(offer.get('executor_id') == executor_id for offer in target_order['executor_offers']):
+                changes['executor_id'] = executor_id
+            # Удаляем executor_offers полностью
+            changes['executor_offers'] = None
+        try:
+            order_status.transition(target_order, "Ожидает оплаты", **changes)
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
     # Уведомление клиенту
     customer_id = target_order.get('user_id')
     if customer_id:
@@ -2126,79 +2338,69 @@ async def admin_final_reject(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Ошибка: неверный формат callback данных", show_alert=True)
         return
     
-    orders = get_all_orders()
-    target_order = None
     executor_id = None
-    
-    # Находим заказ и получаем executor_id, но НЕ изменяем данные
-    for order in orders:
-        if order.get("order_id") == order_id:
-            target_order = order
-            # Используем executor_id из callback, если есть, иначе получаем из executor_offers
-            if executor_id_from_callback:
-                executor_id = executor_id_from_callback
-            else:
-                executor_offers = order.get('executor_offers')
-                if isinstance(executor_offers, dict):
-                    executor_id = executor_offers.get('executor_id')
-                elif isinstance(executor_offers, list) and executor_offers:
-                    executor_id = executor_offers[0].get('executor_id')
-            break
-    
-    if not target_order:
-        await callback.answer("Ошибка: заказ не найден", show_alert=True)
-        return
-    
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Ошибка: заказ не найден", show_alert=True)
+            return
+        # Как и «Утвердить»: отклонять условия можно только пока заказ на рассмотрении
+        if target_order.get('status') not in ("Рассматривается", "Ожидает подтверждения"):
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
+        executor_offers = target_order.get('executor_offers')
+        # Используем executor_id из callback, если есть, иначе получаем из executor_offers
+        if executor_id_from_callback:
+            executor_id = executor_id_from_callback
+        elif isinstance(executor_offers, dict):
+            executor_id = executor_offers.get('executor_id')
+        elif isinstance(executor_offers, list) and executor_offers:
+            executor_id = executor_offers[0].get('executor_id')
+        if executor_id_from_callback and isinstance(executor_offers, list):
+            # Удаляем конкретный оффер по executor_id; если офферов не осталось, удаляем поле полностью
+            remaining_offers = [
+                offer for offer in executor_offers
+                if offer.get('executor_id') != executor_id_from_callback
+            ] or None
+        else:
+            # Удаляем все офферы (старое поведение)
+            remaining_offers = None
+        try:
+            order_status.transition(
+                target_order, "Рассматривается",
+                executor_id=None, executor_offers=remaining_offers, allow_same=True,
+            )
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
+
     # Уведомляем исполнителя (если есть)
     if executor_id:
         try:
             await bot.send_message(executor_id, f"❌ Администратор отклонил ваши условия по заказу №{order_id}.")
         except Exception:
             pass # Не критично
-    
+
     # Отправляем сообщение администратору
     await callback.message.edit_text(f"❌ Вы отклонили предложение исполнителя по заказу №{order_id}. Заказ снова в поиске.")
-    
-    # ТОЛЬКО ПОСЛЕ отправки сообщения изменяем статус и очищаем данные
-    target_order['status'] = "Рассматривается"
-    target_order.pop('executor_id', None)
-    
-    # Обрабатываем executor_offers
-    if 'executor_offers' in target_order:
-        executor_offers = target_order['executor_offers']
-        if executor_id_from_callback and isinstance(executor_offers, list):
-            # Удаляем конкретный оффер по executor_id
-            target_order['executor_offers'] = [
-                offer for offer in executor_offers 
-                if offer.get('executor_id') != executor_id_from_callback
-            ]
-            # Если офферов не осталось, удаляем поле полностью
-            if not target_order['executor_offers']:
-                target_order.pop('executor_offers', None)
-        else:
-            # Удаляем все офферы (старое поведение)
-            target_order.pop('executor_offers', None)
-    
-    # Сохраняем изменения
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
-    
     await callback.answer()
 
 @admin_router.callback_query(F.data.startswith("admin_approve_work_"))
 async def admin_approve_work_handler(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split('_')[-1])
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
 
-    if not target_order or 'submitted_work' not in target_order:
-        await callback.answer("Работа не найдена или была отозвана.", show_alert=True)
-        return
+        if not target_order or 'submitted_work' not in target_order:
+            await callback.answer("Работа не найдена или была отозвана.", show_alert=True)
+            return
 
-    # Меняем статус
-    target_order['status'] = "Утверждено администратором"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+        # Меняем статус
+        try:
+            order_status.transition(target_order, "Утверждено администратором")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
 
     # Отправляем клиенту
     customer_id = target_order.get('user_id')
@@ -2242,16 +2444,18 @@ async def admin_revision_comment_handler(message: Message, state: FSMContext):
     data = await state.get_data()
     order_id = data.get('order_id')
     revision_comment = message.text
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not target_order:
-        await message.answer("Ошибка: заказ не найден.")
-        await state.clear()
-        return
-    target_order['revision_comment'] = revision_comment
-    target_order['status'] = "На доработке"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await message.answer("Ошибка: заказ не найден.")
+            await state.clear()
+            return
+        try:
+            order_status.transition(target_order, "На доработке", revision_comment=revision_comment, allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await message.answer(f"Заказ №{order_id} уже в статусе «{target_order.get('status')}», комментарий не отправлен.")
+            await state.clear()
+            return
     executor_id = target_order.get('executor_id')
     subject = target_order.get('subject', 'Не указан')
     work_type = target_order.get('work_type', 'Не указан').replace('work_type_', '')
@@ -2279,14 +2483,16 @@ async def admin_revision_comment_handler(message: Message, state: FSMContext):
 @admin_router.callback_query(F.data.startswith("admin_reject_work_"))
 async def admin_reject_work_handler(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not target_order:
-        await callback.answer("Заказ не найден.", show_alert=True)
-        return
-    target_order['status'] = "На доработке"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Заказ не найден.", show_alert=True)
+            return
+        try:
+            order_status.transition(target_order, "На доработке")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
     await state.set_state(AdminRevision.waiting_for_revision_comment)
     await state.update_data(order_id=order_id)
     await bot.send_message(callback.from_user.id, "✍️ Напишите комментарий по доработке для исполнителя:")
@@ -2407,45 +2613,50 @@ async def back_to_main_menu_handler(callback: CallbackQuery, state: FSMContext):
 # --- Просмотр заявок ---
 
 def get_user_orders(user_id: int) -> list:
-    """Читает orders.json и возвращает список заявок для конкретного user_id."""
-    file_path = "orders.json"
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, "r", encoding="utf-8") as f:
-        try:
-            all_orders = json.load(f)
-        except json.JSONDecodeError:
-            return []
-    
-    if not isinstance(all_orders, list):
-        return []
+    """Возвращает список заявок для конкретного user_id (по индексу хранилища)."""
+    return order_store.by_user(user_id)
 
-    user_orders = [order for order in all_orders if isinstance(order, dict) and order.get('user_id') == user_id]
-    return user_orders
+MY_ORDERS_PAGE_SIZE = 10
 
-async def show_my_orders(message_or_callback: types.Message | types.CallbackQuery):
-    user_id = message_or_callback.from_user.id
-    orders = get_user_orders(user_id)
-    # --- ДОБАВЛЕНО: если пользователь — исполнитель, показываем заявки, где он назначен исполнителем ---
+def my_orders_cb(status_index="-", cursor="f"):
+    """mol:<статус>:<курсор>; статус — индекс в ORDER_STATUSES или -, курсор как в списке админа."""
+    return f"mol:{status_index}:{cursor}"
+
+def my_orders_queries(user_id, status=None):
+    # Свои заявки клиента и (если он исполнитель) заказы, где он назначен исполнителем
+    queries = [{"user_id": user_id, "status": status}]
     if is_executor(user_id):
-        all_orders = get_all_orders()
-        executor_orders = [o for o in all_orders if o.get('executor_id') == user_id]
-        # Добавляем только те, которых нет в orders (чтобы не дублировать)
-        for eo in executor_orders:
-            if eo not in orders:
-                orders.append(eo)
-    draft_orders_exist = any(o.get('status') == "Редактируется" for o in orders)
+        queries.append({"executor_id": user_id, "status": status})
+    return queries
+
+async def show_my_orders(message_or_callback: types.Message | types.CallbackQuery, status_index="-", cursor="f"):
+    """Постраничный список заявок пользователя (от новых к старым) по индексам order_store."""
+    user_id = message_or_callback.from_user.id
+    status = None
+    if status_index.isdigit() and int(status_index) < len(ORDER_STATUSES):
+        status = ORDER_STATUSES[int(status_index)]
+    else:
+        status_index = "-"
+    before, after = parse_page_cursor(cursor)
+    queries = my_orders_queries(user_id, status)
+    orders, has_more = order_store.page_union(queries, before=before, after=after, limit=MY_ORDERS_PAGE_SIZE)
+    if after is not None and not orders:
+        # Новее ничего не осталось — показываем первую страницу
+        after = None
+        orders, has_more = order_store.page_union(queries, limit=MY_ORDERS_PAGE_SIZE)
+    has_newer = (has_more if after is not None else before is not None)
+    has_older = (has_more if after is None else True)
+    draft_orders_exist = bool(order_store.page(user_id=user_id, status="Редактируется", limit=1)[0])
 
     if not orders:
-        text = "У вас пока нет заявок."
-        keyboard = None
+        text = "У вас пока нет заявок." if status is None else f"Нет заявок в статусе «{status}»."
+        keyboard_buttons = []
     else:
-        text = "Вот ваши заявки:"
+        text = "Вот ваши заявки:" if status is None else f"Ваши заявки в статусе «{status}»:"
         if draft_orders_exist:
             text = "У вас есть незавершенная заявка. Выберите ее, чтобы продолжить.\n\n" + text
         keyboard_buttons = []
-        # Показываем последние 10 заявок, чтобы не перегружать интерфейс
-        for order in reversed(orders[-10:]): 
+        for order in orders:
             order_id = order['order_id']
             order_status = order.get('status', 'N/A')
             emoji = STATUS_EMOJI_MAP.get(order_status, "📄")
@@ -2453,7 +2664,19 @@ async def show_my_orders(message_or_callback: types.Message | types.CallbackQuer
             work_type = work_type_raw.replace('work_type_', '')
             button_text = f"{emoji} Заявка  №{order_id} {work_type}  | {order_status}"
             keyboard_buttons.append([InlineKeyboardButton(text=button_text, callback_data=f"view_order_{order_id}")])
-        keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        nav_buttons = []
+        if has_newer:
+            nav_buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=my_orders_cb(status_index, f"p{orders[0]['order_id']}")))
+        if has_older:
+            nav_buttons.append(InlineKeyboardButton(text="Старше ➡️", callback_data=my_orders_cb(status_index, f"n{orders[-1]['order_id']}")))
+        if nav_buttons:
+            keyboard_buttons.append(nav_buttons)
+    if orders or status is not None:
+        filter_row = [InlineKeyboardButton(text="🏷 Фильтр по статусу", callback_data=f"mof:{status_index}")]
+        if status is not None:
+            filter_row.append(InlineKeyboardButton(text="✖️ Все заявки", callback_data=my_orders_cb()))
+        keyboard_buttons.append(filter_row)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons) if keyboard_buttons else None
 
     if isinstance(message_or_callback, types.Message):
         await message_or_callback.answer(text, reply_markup=keyboard)
@@ -2465,6 +2688,36 @@ async def show_my_orders(message_or_callback: types.Message | types.CallbackQuer
             await message_or_callback.message.answer(text, reply_markup=keyboard)
             await message_or_callback.answer()
 
+@router.callback_query(F.data.startswith("mol:"))
+async def my_orders_page_handler(callback: CallbackQuery, state: FSMContext):
+    try:
+        _, status_index, cursor = callback.data.split(":", 2)
+    except ValueError:
+        status_index, cursor = "-", "f"
+    await show_my_orders(callback, status_index=status_index, cursor=cursor)
+
+@router.callback_query(F.data.startswith("mof:"))
+async def my_orders_filter_handler(callback: CallbackQuery, state: FSMContext):
+    user_id = callback.from_user.id
+    current = callback.data.split(":", 1)[1]
+    # Только статусы, которые реально есть у пользователя (по его индексам, без обхода всех заказов)
+    counts = {}
+    seen = set()
+    orders = get_user_orders(user_id) + (order_store.by_executor(user_id) if is_executor(user_id) else [])
+    for order in orders:
+        if order['order_id'] in seen:
+            continue
+        seen.add(order['order_id'])
+        counts[order.get('status')] = counts.get(order.get('status'), 0) + 1
+    buttons = []
+    for i, status in enumerate(ORDER_STATUSES):
+        if counts.get(status):
+            buttons.append([InlineKeyboardButton(text=f"{STATUS_EMOJI_MAP.get(status, '')} {status} ({counts[status]})", callback_data=my_orders_cb(str(i)))])
+    buttons.append([InlineKeyboardButton(text="Все статусы", callback_data=my_orders_cb())])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=my_orders_cb(current))])
+    await callback.message.edit_text("Выберите статус:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    await callback.answer()
+
 @router.message(F.text == "📂 Мои заявки")
 async def my_orders_handler(message: Message, state: FSMContext):
     await state.clear()
@@ -2768,14 +3021,7 @@ async def edit_university_name(message: Message, state: FSMContext):
 # Получаем номер телефона из FSM или users.json
     phone_number = data.get('phone_number')
     if not phone_number:
-        users_file = "users.json"
-        if os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                    phone_number = users.get(str(message.from_user.id), {}).get("phone_number", "")
-                except Exception:
-                    phone_number = ""
+        phone_number = get_user_phone(message.from_user.id)
     data['phone_number'] = phone_number
     save_user_profile(
         message.from_user.id,
@@ -2990,12 +3236,13 @@ async def build_short_summary_text(data: dict) -> str:
 
 # --- ДОБАВЛЕНО: Получение максимального order_id из Google Sheets ---
 def get_max_order_id_from_gsheet():
-    creds = Credentials.from_service_account_file("google-credentials.json", scopes=["https://www.googleapis.com/auth/spreadsheets"])
-    gc = gspread.authorize(creds)
-    sh = gc.open_by_key(GOOGLE_SHEET_ID)
-    worksheet = sh.sheet1
+    worksheet = gsheets.get_worksheet()
     # Получаем все значения первого столбца (order_id)
-    order_ids = worksheet.col_values(1)
+    try:
+        order_ids = worksheet.col_values(1)
+    except Exception:
+        gsheets.reset()
+        raise
     # Пропускаем заголовок, если он есть
     order_ids = [x for x in order_ids if x.strip() and x.strip().lower() != 'номер заказа']
     order_ids = [x for x in order_ids if x.isdigit()]
@@ -3003,53 +3250,34 @@ def get_max_order_id_from_gsheet():
         return 0
     return max(int(x) for x in order_ids)
 
+@io_bound
+def save_student_row(order_data: dict):
+    with sqlite3.connect('student.db', timeout=10.0) as conn:
+        c = conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO students (user_id, first_name, last_name, phone_number, group_name)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  (order_data['user_id'], order_data.get('first_name', ''), order_data.get('last_name', ''),
+                   order_data.get('phone_number', ''), order_data.get('group_name', '')))
+        conn.commit()
+
 async def save_or_update_order(order_data: dict) -> int:
-    file_path = "orders.json"
-    orders = []
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                orders = json.load(f)
-            except json.JSONDecodeError:
-                orders = []
     order_id_to_process = order_data.get("order_id")
     user_id_to_process = order_data.get("user_id")
     status_to_process = order_data.get("status")
-    # Если заявка подтверждается ("Рассматривается"), удаляем все черновики с этим order_id и user_id
+    # Если заявка подтверждается ("Рассматривается"), удаляем черновик с этим order_id и user_id
     if status_to_process == "Рассматривается" and order_id_to_process and user_id_to_process:
-        orders = [o for o in orders if not (
-            o.get("order_id") == order_id_to_process and o.get("user_id") == user_id_to_process and o.get("status") == "Редактируется"
-        )]
-    if order_id_to_process: # Обновляем существующую
-        found = False
-        for i, order in enumerate(orders):
-            if order.get("order_id") == order_id_to_process:
-                orders[i] = order_data
-                found = True
-                break
-        if not found: # Если по какой-то причине не нашли, добавляем как новую
-            max_json_id = orders[-1]['order_id'] if orders else 0
-            max_gsheet_id = get_max_order_id_from_gsheet()
-            order_id_to_process = max(max_json_id, max_gsheet_id) + 1
-            order_data["order_id"] = order_id_to_process
-            orders.append(order_data)
-    else: # Создаем новую
-        max_json_id = orders[-1]['order_id'] if orders else 0
-        max_gsheet_id = get_max_order_id_from_gsheet()
-        order_id_to_process = max(max_json_id, max_gsheet_id) + 1
+        draft = get_order(order_id_to_process)
+        if draft and draft.get("user_id") == user_id_to_process and draft.get("status") == "Редактируется":
+            delete_order(order_id_to_process)
+    if not order_id_to_process or get_order(order_id_to_process) is None:
+        # Новая заявка (или не нашли существующую) — выдаём следующий номер из локального счётчика
+        order_id_to_process = order_db.next_order_id(order_store.max_order_id())
         order_data["order_id"] = order_id_to_process
-        orders.append(order_data)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    save_order(order_data)
     # Save to SQLite if it's a new order or update
     try:
-        with sqlite3.connect('student.db', timeout=10.0) as conn:
-            c = conn.cursor()
-            c.execute('''INSERT OR REPLACE INTO students (user_id, first_name, last_name, phone_number, group_name)
-                         VALUES (?, ?, ?, ?, ?)''',
-                      (order_data['user_id'], order_data.get('first_name', ''), order_data.get('last_name', ''),
-                       order_data.get('phone_number', ''), order_data.get('group_name', '')))
-            conn.commit()
+        await save_student_row(order_data)
+        audience_index.on_student_saved(order_data['user_id'], order_data.get('group_name', ''))
     except sqlite3.Error as e:
         logging.error(f"Ошибка при работе с базой данных SQLite: {e}")
         # Продолжаем выполнение, так как основные данные уже сохранены в JSON
@@ -3064,14 +3292,7 @@ async def process_confirm_order(callback: CallbackQuery, state: FSMContext):
     # Получаем номер телефона из FSM или users.json
     phone_number = data.get('phone_number')
     if not phone_number:
-        users_file = "users.json"
-        if os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                    phone_number = users.get(str(callback.from_user.id), {}).get("phone_number", "")
-                except Exception:
-                    phone_number = ""
+        phone_number = get_user_phone(callback.from_user.id)
     data['phone_number'] = phone_number
     save_user_profile(
         callback.from_user.id,
@@ -3113,18 +3334,10 @@ async def process_cancel_order(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     order_id = data.get("order_id")
     user_id = callback.from_user.id
-    file_path = "orders.json"
-    orders = []
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                orders = json.load(f)
-            except json.JSONDecodeError:
-                orders = []
     # Удаляем заявку пользователя с этим order_id
-    new_orders = [o for o in orders if not (str(o.get("order_id")) == str(order_id) and o.get("user_id") == user_id)]
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(new_orders, f, ensure_ascii=False, indent=4)
+    order = get_order(order_id) if order_id else None
+    if order and order.get("user_id") == user_id:
+        delete_order(order_id)
     await state.clear()
     await callback.message.edit_text("❌ Заявка отменена и удалена.")
     await callback.answer()
@@ -3246,12 +3459,8 @@ async def send_offer_to_admin(user, fsm_data):
     order_id = fsm_data['order_id']
     price = fsm_data['price']
     executor_comment = fsm_data.get('executor_comment', '')
-    orders = get_all_orders()
-    subject = 'Не указан'
-    for order in orders:
-        if order.get("order_id") == order_id:
-            subject = order.get('subject', 'Не указан')
-            break
+    order = get_order(order_id)
+    subject = order.get('subject', 'Не указан') if order else 'Не указан'
     admin_notification = f"""
     ✅ Исполнитель {get_full_name(user)} (ID: {user.id}) готов взяться за заказ по предмету \"{subject}\"\n<b>Предложенные условия:</b>\n💰 <b>Цена:</b> {price} ₽\n⏳ <b>Срок:</b> {fsm_data['deadline']}\n💬 <b>Комментарий исполнителя:</b> {executor_comment or 'Нет'}
     """
@@ -3266,8 +3475,7 @@ async def send_offer_to_admin(user, fsm_data):
 @admin_router.callback_query(F.data.startswith("admin_show_materials:"))
 async def admin_show_materials_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -3278,6 +3486,8 @@ async def admin_show_materials_handler(callback: CallbackQuery, state: FSMContex
         material_buttons.append([InlineKeyboardButton(text="Задание", callback_data=f"admin_material_task:{order_id}")])
     if order.get('example_file'):
         material_buttons.append([InlineKeyboardButton(text="Пример работы", callback_data=f"admin_material_example:{order_id}")])
+    if len(material_buttons) > 1:
+        material_buttons.append([InlineKeyboardButton(text="📦 Все материалы", callback_data=f"admin_material_all:{order_id}")])
     material_buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_view_order_{order_id}")])
     keyboard = InlineKeyboardMarkup(inline_keyboard=material_buttons)
     await callback.message.edit_text("Выберите материал для просмотра:", reply_markup=keyboard)
@@ -3286,8 +3496,7 @@ async def admin_show_materials_handler(callback: CallbackQuery, state: FSMContex
 @admin_router.callback_query(F.data.startswith("admin_hide_materials:"))
 async def admin_hide_materials_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -3311,80 +3520,32 @@ async def admin_hide_materials_handler(callback: CallbackQuery, state: FSMContex
         await callback.answer()
         return
     # Старое поведение для остальных статусов
-    details_text = await build_summary_text(order)
+    details_text = await materials.details_text(order, build_summary_text)
     details_text = f"<b>Детали заказа {order_id} от {get_full_name(order)}</b>\n\n" + details_text
     keyboard = get_admin_order_keyboard(order, show_materials_button=True)
     await callback.message.edit_text(details_text, reply_markup=keyboard, parse_mode="HTML")
     await callback.answer()
 
-@admin_router.callback_query(F.data.startswith("admin_material_guidelines:"))
-async def admin_material_guidelines_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order or not order.get('guidelines_file'):
-        await callback.answer("Методичка не найдена.", show_alert=True)
-        return
-    file = order['guidelines_file']
-    if file['type'] == 'photo':
-        await bot.send_photo(callback.from_user.id, file['id'], caption="Методичка")
-    else:
-        await bot.send_document(callback.from_user.id, file['id'], caption="Методичка")
-    await callback.answer()
-
-@admin_router.callback_query(F.data.startswith("admin_material_task:"))
-async def admin_material_task_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order:
-        await callback.answer("Задание не найдено.", show_alert=True)
-        return
-    if order.get('task_file'):
-        file = order['task_file']
-        if file['type'] == 'photo':
-            await bot.send_photo(callback.from_user.id, file['id'], caption="Задание")
-        else:
-            await bot.send_document(callback.from_user.id, file['id'], caption="Задание")
-    elif order.get('task_text'):
-        await bot.send_message(callback.from_user.id, f"Текст задания:\n\n{order['task_text']}")
-    await callback.answer()
-
-@admin_router.callback_query(F.data.startswith("admin_material_example:"))
-async def admin_material_example_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order or not order.get('example_file'):
-        await callback.answer("Пример работы не найден.", show_alert=True)
-        return
-    file = order['example_file']
-    if file['type'] == 'photo':
-        await bot.send_photo(callback.from_user.id, file['id'], caption="Пример работы")
-    else:
-        await bot.send_document(callback.from_user.id, file['id'], caption="Пример работы")
-    await callback.answer()
+@admin_router.callback_query(F.data.startswith("admin_material_"))
+async def admin_material_handler(callback: CallbackQuery, state: FSMContext):
+    await send_materials_for_callback(callback)
 
 @admin_router.callback_query(F.data.startswith("admin_delete_order:"))
 async def admin_delete_order_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    new_orders = [o for o in orders if str(o['order_id']) != str(order_id)]
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(new_orders, f, ensure_ascii=False, indent=4)
+    delete_order(order_id)
     await callback.message.edit_text(f"❌ Заявка {order_id} удалена.")
     await callback.answer()
 
 @admin_router.callback_query(F.data == "admin_orders_list")
 async def admin_back_to_orders_list_handler(callback: CallbackQuery, state: FSMContext):
-    await show_admin_orders_list(callback.message)
+    await show_admin_orders_list(callback)
     await callback.answer()
 # Просмотр материалов заказа для Исполнителя
 @executor_router.callback_query(F.data.startswith("executor_show_materials:"))
 async def executor_show_materials_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -3395,6 +3556,8 @@ async def executor_show_materials_handler(callback: CallbackQuery, state: FSMCon
         material_buttons.append([InlineKeyboardButton(text="Задание", callback_data=f"executor_material_task:{order_id}")])
     if order.get('example_file'):
         material_buttons.append([InlineKeyboardButton(text="Пример работы", callback_data=f"executor_material_example:{order_id}")])
+    if len(material_buttons) > 1:
+        material_buttons.append([InlineKeyboardButton(text="📦 Все материалы", callback_data=f"executor_material_all:{order_id}")])
     # Кнопка 'Назад' — разная логика для статуса 'В работе'
     if order.get('status') == 'В работе' or order.get('status') == 'На доработке':
         material_buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"executor_view_order_{order_id}")])
@@ -3421,8 +3584,7 @@ async def executor_back_to_invite_handler(callback: CallbackQuery, state: FSMCon
 @executor_router.callback_query(F.data.startswith("executor_hide_materials:"))
 async def executor_hide_materials_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -3446,53 +3608,9 @@ async def executor_hide_materials_handler(callback: CallbackQuery, state: FSMCon
     await callback.message.edit_text(executor_caption, parse_mode="HTML", reply_markup=executor_keyboard)
     await callback.answer()
 
-@executor_router.callback_query(F.data.startswith("executor_material_guidelines:"))
-async def executor_material_guidelines_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order or not order.get('guidelines_file'):
-        await callback.answer("Методичка не найдена.", show_alert=True)
-        return
-    file = order['guidelines_file']
-    if file['type'] == 'photo':
-        await bot.send_photo(callback.from_user.id, file['id'], caption="Методичка")
-    else:
-        await bot.send_document(callback.from_user.id, file['id'], caption="Методичка")
-    await callback.answer()
-
-@executor_router.callback_query(F.data.startswith("executor_material_task:"))
-async def executor_material_task_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order:
-        await callback.answer("Задание не найдено.", show_alert=True)
-        return
-    if order.get('task_file'):
-        file = order['task_file']
-        if file['type'] == 'photo':
-            await bot.send_photo(callback.from_user.id, file['id'], caption="Задание")
-        else:
-            await bot.send_document(callback.from_user.id, file['id'], caption="Задание")
-    elif order.get('task_text'):
-        await bot.send_message(callback.from_user.id, f"Текст задания:\n\n{order['task_text']}")
-    await callback.answer()
-
-@executor_router.callback_query(F.data.startswith("executor_material_example:"))
-async def executor_material_example_handler(callback: CallbackQuery, state: FSMContext):
-    order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
-    if not order or not order.get('example_file'):
-        await callback.answer("Пример работы не найден.", show_alert=True)
-        return
-    file = order['example_file']
-    if file['type'] == 'photo':
-        await bot.send_photo(callback.from_user.id, file['id'], caption="Пример работы")
-    else:
-        await bot.send_document(callback.from_user.id, file['id'], caption="Пример работы")
-    await callback.answer()
+@executor_router.callback_query(F.data.startswith("executor_material_"))
+async def executor_material_handler(callback: CallbackQuery, state: FSMContext):
+    await send_materials_for_callback(callback)
 
 
 
@@ -3517,8 +3635,7 @@ async def admin_delete_user_msg_handler(callback: CallbackQuery, state: FSMConte
 @admin_router.callback_query(F.data.startswith("admin_save_to_gsheet:"))
 async def admin_save_to_gsheet_handler(callback: CallbackQuery, state: FSMContext):
     order_id = callback.data.split(":", 1)[1]
-    orders = get_all_orders()
-    order = next((o for o in orders if str(o['order_id']) == str(order_id)), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заявка не найдена.", show_alert=True)
         return
@@ -3527,14 +3644,7 @@ async def admin_save_to_gsheet_handler(callback: CallbackQuery, state: FSMContex
         return
     phone_number = order.get("phone_number", "")
     if not phone_number:
-        users_file = "users.json"
-        if os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                    phone_number = users.get(str(order.get("user_id")), {}).get("phone_number", "")
-                except Exception:
-                    phone_number = ""
+        phone_number = get_user_phone(order.get("user_id"))
     # --- Исправление: поддержка executor_offers как списка и dict ---
     executor_offer = order.get("executor_offers", {})
     if isinstance(executor_offer, list):
@@ -3589,71 +3699,234 @@ async def admin_save_to_gsheet_handler(callback: CallbackQuery, state: FSMContex
         order.get("status", "")
     ]
     try:
-        creds = Credentials.from_service_account_file("google-credentials.json", scopes=["https://www.googleapis.com/auth/spreadsheets"])
-        gc = gspread.authorize(creds)
-        sh = gc.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = sh.sheet1
-        # --- Новый блок: ищем строку с этим order_id ---
-        cell = worksheet.find(str(order.get("order_id", "")))
-        if cell:
-            worksheet.update(f"A{cell.row}:N{cell.row}", [row])
-            await callback.answer("Заявка обновлена в Google таблице!", show_alert=True)
-        else:
-            worksheet.append_row(row, value_input_option="USER_ENTERED")
-            await callback.answer("Заявка добавлена в Google таблицу!", show_alert=True)
+        # Строка обновится (или добавится, если её ещё нет) фоновым воркером sheets_sync
+        sheets_sync.enqueue_upsert(order.get("order_id", ""), row)
+        await callback.answer("Заявка поставлена в очередь на сохранение в Google таблицу!", show_alert=True)
     except Exception as e:
         await callback.answer(f"Ошибка при сохранении: {e}", show_alert=True)
 
 @admin_router.callback_query(F.data.startswith("admin_broadcast_select_"))
 async def admin_broadcast_select_handler(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    order = next((o for o in orders if o.get('order_id') == order_id), None)
-    if not order:
-        await callback.answer("Заявка не найдена.", show_alert=True)
-        return
-    executors = get_executors_list()
-    if not executors:
-        await callback.answer("Нет исполнителей для рассылки.", show_alert=True)
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if not order:
+            await callback.answer("Заявка не найдена.", show_alert=True)
+            return
+        if not order_status.can_transition(order.get('status'), "Ожидает подтверждения", allow_same=True):
+            await callback.answer(f"Заявка в статусе «{order.get('status')}», разослать её исполнителям нельзя.", show_alert=True)
+            return
+        executors = get_executors_list()
+        if not executors:
+            await callback.answer("Нет исполнителей для рассылки.", show_alert=True)
+            return
+        # Формируем оффер для рассылки
+        work_type = order.get('work_type', 'N/A').replace('work_type_', '')
+        subject = order.get('subject', 'Не указан')
+        deadline = order.get('deadline', 'Не указан')
+        executor_caption = (
+            f"📬 Вам предложен новый заказ по предмету <b>{subject}</b>\n\n"
+            f"📝 <b>Тип работы:</b> {work_type}\n"
+            f"🗓 <b>Срок сдачи:</b> {deadline}\n\n"
+            "Пожалуйста, ознакомьтесь с материалами заявки и примите решение."
+        )
+        executor_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📎 Посмотреть материалы заказа", callback_data=f"executor_show_materials:{order_id}")],
+            [
+                InlineKeyboardButton(text="✅ Готов взяться", callback_data=f"executor_accept_{order_id}"),
+                InlineKeyboardButton(text="❌ Отказаться", callback_data=f"executor_refuse_{order_id}")
+            ],
+        ])
+        # --- Сначала статус заявки: если переход уже невозможен, рассылку не создаём ---
+        try:
+            order_status.transition(order, "Ожидает подтверждения", allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заявка в статусе «{order.get('status')}», разослать её исполнителям нельзя.", show_alert=True)
+            return
+    await callback.answer("Рассылка поставлена в очередь.")
+    await callback.message.edit_text(f"🕓 Рассылка по заявке №{order_id} поставлена в очередь: 0/{len(executors)}")
+    # Оффер отправит фоновый воркер
+    broadcast_jobs.create_job(
+        "executors", f"заявка №{order_id}", [ex.get('id') for ex in executors], executor_caption,
+        parse_mode="HTML", reply_markup=executor_keyboard,
+        admin_chat_id=callback.message.chat.id, progress_message_id=callback.message.message_id,
+        order_id=order_id,
+    )
+
+async def reconcile_order_ids():
+    """Сверяет локальный счётчик номеров заказов с базой и Google Sheets (только при старте)."""
+    order_db.reconcile_order_sequence(order_store.max_order_id())
+    try:
+        max_gsheet_id = await run_io(get_max_order_id_from_gsheet)
+    except Exception as e:
+        logging.error(f"Не удалось сверить номера заказов с Google Sheets: {e}")
         return
-    # Формируем оффер для рассылки
-    work_type = order.get('work_type', 'N/A').replace('work_type_', '')
-    subject = order.get('subject', 'Не указан')
-    deadline = order.get('deadline', 'Не указан')
-    executor_caption = (
-        f"📬 Вам предложен новый заказ по предмету <b>{subject}</b>\n\n"
-        f"📝 <b>Тип работы:</b> {work_type}\n"
-        f"🗓 <b>Срок сдачи:</b> {deadline}\n\n"
-        "Пожалуйста, ознакомьтесь с материалами заявки и примите решение."
+    current = order_db.reconcile_order_sequence(max_gsheet_id)
+    logging.info(f"Счётчик номеров заказов: {current}")
+
+# --- Webhook-режим ---
+# BOT_MODE=webhook: Telegram сам присылает апдейты на FastAPI-приложение, иначе — long polling
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Render сам выставляет RENDER_EXTERNAL_URL и PORT для web-сервиса
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Если секрет не задан, генерируем свой на запуск — он всё равно передаётся в set_webhook при каждом старте
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("PORT", "8000"))
+
+# Общая очередь обработки апдейтов для обоих режимов
+update_pipeline = UpdatePipeline(
+    dp, bot,
+    workers=int(os.getenv("UPDATE_WORKERS", "8")),
+    max_queue=int(os.getenv("UPDATE_QUEUE_SIZE", "200")),
+)
+
+metrics.Gauge("bot_update_queue_depth", "Апдейты в очереди на обработку", lambda: update_pipeline.queued)
+metrics.Gauge("bot_update_in_flight", "Апдейты в обработке", lambda: update_pipeline.in_flight)
+metrics.Gauge("bot_sheets_outbox_pending", "Задачи в очереди Google Sheets", sheets_sync.pending_count)
+metrics.Gauge("bot_sheets_dead_letter", "Задачи Google Sheets, отложенные после MAX_ATTEMPTS неудач", sheets_sync.dead_letter_count)
+metrics.Gauge(
+    "bot_io_busy_seconds", "Суммарное время блокирующих операций в пуле потоков",
+    lambda: {(name,): entry["run"] for name, entry in io_pool.io_stats()["operations"].items()}, ("operation",),
+)
+metrics.Gauge("bot_order_events_queued", "События заказов в очереди и в обработке", lambda: order_events.stats()["queued"] + order_events.stats()["in_progress"])
+metrics.Gauge(
+    "bot_orders", "Заказы по статусам",
+    lambda: {(status,): count for status, count in order_status.status_counts().items() if status}, ("status",),
+)
+metrics.Gauge("bot_event_loop_lag_max_seconds", "Максимальная задержка event loop", lambda: io_pool.io_stats()["loop_lag"]["max"])
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        return Response(status_code=403)
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except Exception as e:
+        logging.warning(f"Webhook: некорректный апдейт: {e}")
+        # 200, чтобы Telegram не присылал битый апдейт повторно
+        return {"ok": False}
+    # Отвечаем, как только апдейт встал в очередь; если она полна — ждём места (backpressure)
+    await update_pipeline.submit(update)
+    return {"ok": True}
+
+async def run_webhook(server):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("BOT_MODE=webhook, но не задан WEBHOOK_BASE_URL (или RENDER_EXTERNAL_URL)")
+    webhook_url = WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH
+    await bot.set_webhook(
+        webhook_url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
     )
-    executor_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📎 Посмотреть материалы заказа", callback_data=f"executor_show_materials:{order_id}")],
-        [
-            InlineKeyboardButton(text="✅ Готов взяться", callback_data=f"executor_accept_{order_id}"),
-            InlineKeyboardButton(text="❌ Отказаться", callback_data=f"executor_refuse_{order_id}")
-        ],
-    ])
-    count = 0
-    for ex in executors:
-        executor_id = ex.get('id')
-        if not executor_id:
-            continue
-        try:
-            await bot.send_message(executor_id, executor_caption, parse_mode="HTML", reply_markup=executor_keyboard)
-            count += 1
-        except Exception as e:
-            print(f"Не удалось отправить рассылку исполнителю {executor_id}: {e}")
-    # --- Обновляем статус заявки ---
-    order['status'] = "Ожидает подтверждения"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
-    await callback.answer(f"Рассылка отправлена {count} исполнителям.", show_alert=True)
-    await callback.message.edit_text(f"Рассылка по заявке №{order_id} отправлена {count} исполнителям. Статус заявки обновлён.")
+    logging.info(f"Webhook установлен: {webhook_url}")
+    # Вебхук при остановке не снимаем — Telegram придержит апдейты до рестарта
+    await server.serve()
+
+class WebServer(uvicorn.Server):
+    """
+    uvicorn без собственных обработчиков сигналов: SIGTERM/SIGINT ловит main() и останавливает
+    сервер через should_exit, а uvicorn иначе перехватил бы сигнал и после выхода поднял его снова,
+    минуя сброс очередей и хранилищ.
+    """
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+    def install_signal_handlers(self):
+        # uvicorn < 0.29
+        pass
+
+def make_web_server():
+    return WebServer(uvicorn.Config(app, host=WEB_HOST, port=WEB_PORT, log_level="info"))
 
 async def main():
     init_db()
+    order_store.load()
+    fsm_storage.load()
+    await reconcile_order_ids()
+    # Замер задержек event loop (метрики io_pool)
+    lag_task = asyncio.create_task(io_pool.monitor_loop_lag())
+    # Фоновая синхронизация с Google Sheets
+    sheets_task = asyncio.create_task(sheets_sync.run_sheets_worker())
+    # Фоновые рассылки (задания и прогресс лежат в student.db)
+    broadcast_task = asyncio.create_task(broadcast_jobs.run_broadcast_worker(bot))
+    # Побочные эффекты смены статусов заказов: уведомления, таблица, аудит
+    events_task = asyncio.create_task(order_events.run_event_worker())
     # Запуск aiogram-бота
-    await dp.start_polling(bot)
+    update_pipeline.start()
+    # На Render (задан PORT) и в webhook-режиме поднимаем FastAPI: вебхук, health-check и /metrics
+    web_server = make_web_server() if BOT_MODE == "webhook" or os.getenv("PORT") else None
+    web_task = None
+    polling_task = None
+    stopping = asyncio.Event()
+
+    def request_shutdown(sig):
+        logging.info(f"Получен {sig.name}, останавливаем бота")
+        stopping.set()
+        # Сервер перестаёт принимать запросы, polling — забирать апдейты; остальное доделает finally
+        if web_server is not None:
+            web_server.should_exit = True
+        if polling_task is not None:
+            polling_task.cancel()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, request_shutdown, sig)
+        except NotImplementedError:
+            # Windows: останется KeyboardInterrupt, finally всё равно выполнится
+            pass
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(web_server)
+        else:
+            if web_server is not None:
+                web_task = asyncio.create_task(web_server.serve())
+            # Вебхук, оставшийся от webhook-режима, мешает getUpdates
+            await bot.delete_webhook()
+            if not stopping.is_set():
+                polling_task = asyncio.create_task(
+                    update_pipeline.run_polling(allowed_updates=dp.resolve_used_update_types()))
+                try:
+                    await polling_task
+                except asyncio.CancelledError:
+                    # Отменили по сигналу — штатная остановка; иначе отменяют сам main()
+                    if not stopping.is_set():
+                        raise
+    finally:
+        # Одна и та же последовательность остановки при сигнале, ошибке и отмене
+        if polling_task is not None:
+            polling_task.cancel()
+        if web_task is not None:
+            web_server.should_exit = True
+            try:
+                await asyncio.wait_for(web_task, timeout=10.0)
+            except (asyncio.CancelledError, Exception) as e:
+                logging.warning(f"Остановка веб-сервера: {e!r}")
+        # Даём доработать уже принятым апдейтам
+        await update_pipeline.stop()
+        # и разослать уведомления по уже случившимся событиям заказов
+        await order_events.drain()
+        events_task.cancel()
+        sheets_task.cancel()
+        broadcast_task.cancel()
+        lag_task.cancel()
+        # Дописываем отложенные изменения заказов, профилей и FSM перед выходом
+        await order_store.aclose()
+        await user_store.aclose()
+        await fsm_storage.close()
+        io_pool.shutdown()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with contextlib.suppress(NotImplementedError, RuntimeError):
+                loop.remove_signal_handler(sig)
 
 if __name__ == "__main__":
     asyncio.run(main())
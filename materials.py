@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+
+from aiogram.types import InputMediaDocument, InputMediaPhoto
+
+from executor_registry import executor_registry
+
+# Материалы заказа: ключ в заказе, подпись, ключ для callback_data
+MATERIALS = (
+    ("guidelines_file", "📄 Методичка", "guidelines"),
+    ("task_file", "📑 Задание", "task"),
+    ("example_file", "📄 Пример работы", "example"),
+)
+DELIVERY_TTL = 3600  # секунд; позже файлы отправим снова — чат могли очистить
+MAX_DELIVERED = 5000
+MAX_DETAILS = 500
+
+_delivered = OrderedDict()  # (chat_id, file_id) -> время отправки
+_details = OrderedDict()    # (order_id, version, ревизия списка исполнителей) -> текст деталей
+
+
+def _was_delivered(chat_id, file_id) -> bool:
+    sent_at = _delivered.get((chat_id, file_id))
+    return sent_at is not None and time.monotonic() - sent_at < DELIVERY_TTL
+
+
+def _mark_delivered(chat_id, file_id):
+    _delivered[(chat_id, file_id)] = time.monotonic()
+    _delivered.move_to_end((chat_id, file_id))
+    while len(_delivered) > MAX_DELIVERED:
+        _delivered.popitem(last=False)
+
+
+def order_materials(order: dict, kinds=None) -> list:
+    """Список (file_data, подпись) материалов заказа; kinds ограничивает выборку ключами guidelines/task/example."""
+    items = []
+    for field, caption, kind in MATERIALS:
+        if kinds is not None and kind not in kinds:
+            continue
+        file_data = order.get(field)
+        if file_data and file_data.get("id"):
+            items.append((file_data, caption))
+    return items
+
+
+async def send_order_materials(bot, chat_id, order: dict, kinds=None, force: bool = False) -> int:
+    """
+    Отправляет материалы заказа в чат за минимум запросов: фото одним альбомом, документы другим
+    (Telegram не смешивает их в одной media group). Файлы, уже отправленные в этот чат недавно,
+    пропускаются, если не передан force. Возвращает число отправленных сообщений с файлами.
+    """
+    items = [
+        (file_data, caption) for file_data, caption in order_materials(order, kinds)
+        if force or not _was_delivered(chat_id, file_data["id"])
+    ]
+    photos = [(f, c) for f, c in items if f.get("type") == "photo"]
+    documents = [(f, c) for f, c in items if f.get("type") != "photo"]
+    sent = 0
+    for group, media_cls, send_single in (
+        (photos, InputMediaPhoto, bot.send_photo),
+        (documents, InputMediaDocument, bot.send_document),
+    ):
+        if not group:
+            continue
+        if len(group) == 1:
+            file_data, caption = group[0]
+            await send_single(chat_id, file_data["id"], caption=caption)
+        else:
+            await bot.send_media_group(chat_id, [media_cls(media=f["id"], caption=c) for f, c in group])
+        for file_data, _ in group:
+            _mark_delivered(chat_id, file_data["id"])
+        sent += len(group)
+    task_text = order.get("task_text")
+    if (kinds is None or "task" in kinds) and not order.get("task_file") and task_text:
+        await bot.send_message(chat_id, f"📑 Текст задания:\n\n{task_text}")
+        sent += 1
+    return sent
+
+
+async def details_text(order: dict, builder) -> str:
+    """
+    Текст деталей заказа, закэшированный по версии заказа (builder — async функция, например build_summary_text).
+    В тексте есть имя исполнителя из executors.json, поэтому в ключе и ревизия списка исполнителей.
+    """
+    if order.get("version") is None:
+        # Черновик ещё не сохранялся — кэшировать не по чему
+        return await builder(order)
+    key = (order.get("order_id"), order["version"], executor_registry.revision())
+    text = _details.get(key)
+    if text is None:
+        text = _details[key] = await builder(order)
+        while len(_details) > MAX_DETAILS:
+            _details.popitem(last=False)
+    else:
+        _details.move_to_end(key)
+    return text
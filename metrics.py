@@ -0,0 +1,205 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import CallbackQuery, Message
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+_registry = []
+_lock = threading.Lock()  # метрики пишутся и из потоков io_pool
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Gauge:
+    """Значения снимаются в момент запроса /metrics: func() -> число или {кортеж меток: число}."""
+
+    def __init__(self, name: str, documentation: str, func, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        _registry.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        value = self.func()
+        values = value if isinstance(value, dict) else {(): value}
+        for key, item in values.items():
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {_fmt(item)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}  # метки -> [счётчики корзин, сумма, количество]
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, [('le', _fmt(bound))])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_fmt(total)}")
+                lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus (для GET /metrics)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Метрики бота ---
+handler_latency = Histogram(
+    "bot_handler_seconds", "Время работы хендлера", ("router", "handler", "event", "prefix"))
+handler_errors = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("router", "handler"))
+telegram_latency = Histogram(
+    "bot_telegram_request_seconds", "Время запросов к Telegram Bot API", ("method", "result"))
+sheets_latency = Histogram(
+    "bot_sheets_seconds", "Время операций с Google Sheets", ("op", "result"))
+storage_latency = Histogram(
+    "bot_storage_seconds", "Время чтения и записи хранилищ", ("store", "op"))
+storage_bytes = Histogram(
+    "bot_storage_bytes", "Объём прочитанных и записанных данных", ("store", "op"), buckets=SIZE_BUCKETS)
+order_transitions = Counter(
+    "bot_order_transitions_total", "Переходы заказов между статусами", ("old", "new", "result"))
+
+
+def callback_prefix(data: str) -> str:
+    """
+    admin_view_order_12 -> admin_view_order, executor_material_task:5 -> executor_material_task,
+    final_reject_12_345 -> final_reject: убираются все числовые сегменты, иначе метка растёт с числом заказов.
+    """
+    prefix = (data or "").split(":", 1)[0]
+    return re.sub(r"_-?\d+(?=_|$)", "", prefix)[:64]
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner-middleware роутера: меряет время сработавшего хендлера сообщений и колбэков."""
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        if isinstance(event, CallbackQuery):
+            event_type, prefix = "callback_query", callback_prefix(event.data)
+        elif isinstance(event, Message):
+            event_type, prefix = "message", (event.content_type or "")
+        else:
+            event_type, prefix = type(event).__name__, ""
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(router=self.router_name, handler=handler_name)
+            raise
+        finally:
+            handler_latency.observe(
+                time.perf_counter() - started,
+                router=self.router_name, handler=handler_name, event=event_type, prefix=prefix,
+            )
+
+
+def instrument_router(router, name: str):
+    middleware = HandlerTimingMiddleware(name)
+    router.message.middleware(middleware)
+    router.callback_query.middleware(middleware)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    # getUpdates — это long polling, его длительность ничего не говорит о скорости API
+    SKIP = {"GetUpdates"}
+
+    async def __call__(self, make_request, bot, method):
+        method_name = type(method).__name__
+        if method_name in self.SKIP:
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        result = "error"
+        try:
+            response = await make_request(bot, method)
+            result = "ok"
+            return response
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, method=method_name, result=result)
+
+
+def instrument_bot(bot):
+    if not getattr(bot, "_timing_instrumented", False):
+        bot.session.middleware(TelegramTimingMiddleware())
+        bot._timing_instrumented = True
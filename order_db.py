@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import db
+from metrics import storage_latency, storage_bytes
+
+ORDERS_JSON_FILE = "orders.json"
+
+
+def _norm_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def init_orders_table(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders
+                    (order_id INTEGER PRIMARY KEY,
+                     user_id INTEGER,
+                     executor_id INTEGER,
+                     status TEXT,
+                     data TEXT NOT NULL,
+                     updated_at TEXT DEFAULT CURRENT_TIMESTAMP)''')
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(orders)")]
+    if "version" not in columns:
+        conn.execute("ALTER TABLE orders ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_executor ON orders(executor_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS meta
+                    (key TEXT PRIMARY KEY,
+                     value TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS sequences
+                    (name TEXT PRIMARY KEY,
+                     value INTEGER NOT NULL)''')
+    conn.execute("INSERT OR IGNORE INTO sequences (name, value) VALUES ('order_id', 0)")
+    conn.commit()
+
+
+_db = db.LazyConnection(init=init_orders_table)
+
+
+def get_connection() -> sqlite3.Connection:
+    """Единое соединение с student.db для заказов (WAL, доступ из потоков сброса)."""
+    return _db.get()
+
+
+def order_row(order: dict) -> tuple:
+    return (
+        _norm_int(order.get("order_id")),
+        _norm_int(order.get("user_id")),
+        _norm_int(order.get("executor_id")),
+        order.get("status"),
+        _norm_int(order.get("version")) or 0,
+        json.dumps(order, ensure_ascii=False),
+    )
+
+
+def migrate_orders_from_json(json_path: str = ORDERS_JSON_FILE) -> int:
+    """Одноразовый перенос заказов из orders.json в таблицу orders. Возвращает число перенесённых заказов."""
+    conn = get_connection()
+    with _db.lock:
+        done = conn.execute("SELECT value FROM meta WHERE key = 'orders_json_migrated'").fetchone()
+        if done:
+            return 0
+        orders = []
+        if os.path.exists(json_path) and os.path.getsize(json_path) > 0:
+            with open(json_path, "r", encoding="utf-8") as f:
+                try:
+                    orders = json.load(f)
+                except json.JSONDecodeError:
+                    logging.error("Миграция заказов: orders.json повреждён, переносить нечего")
+                    orders = []
+        if not isinstance(orders, list):
+            orders = []
+        rows = [order_row(o) for o in orders if isinstance(o, dict) and _norm_int(o.get("order_id")) is not None]
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO orders (order_id, user_id, executor_id, status, version, data) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('orders_json_migrated', datetime('now'))")
+    if rows:
+        logging.info(f"Миграция заказов: перенесено {len(rows)} заказов из {json_path} в {db.DB_FILE}")
+    return len(rows)
+
+
+def load_orders() -> list:
+    conn = get_connection()
+    started = time.perf_counter()
+    with _db.lock:
+        rows = conn.execute("SELECT data FROM orders ORDER BY order_id").fetchall()
+    storage_latency.observe(time.perf_counter() - started, store="orders", op="load")
+    storage_bytes.observe(sum(len(data) for (data,) in rows), store="orders", op="load")
+    orders = []
+    for (data,) in rows:
+        try:
+            orders.append(json.loads(data))
+        except json.JSONDecodeError as e:
+            logging.error(f"Повреждённая запись заказа в {db.DB_FILE}: {e}")
+    return orders
+
+
+def write_orders(rows: list, deleted_ids) -> None:
+    """Построчно сохраняет изменённые заказы (строки из order_row) и удаляет удалённые одной транзакцией."""
+    rows = [row for row in rows if row[0] is not None]
+    deleted = [(_norm_int(order_id),) for order_id in deleted_ids]
+    conn = get_connection()
+    started = time.perf_counter()
+    with _db.lock, conn:
+        if rows:
+            conn.executemany(
+                '''INSERT INTO orders (order_id, user_id, executor_id, status, version, data, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(order_id) DO UPDATE SET
+                       user_id = excluded.user_id,
+                       executor_id = excluded.executor_id,
+                       status = excluded.status,
+                       version = excluded.version,
+                       data = excluded.data,
+                       updated_at = CURRENT_TIMESTAMP''',
+                rows,
+            )
+        if deleted:
+            conn.executemany("DELETE FROM orders WHERE order_id = ?", deleted)
+    storage_latency.observe(time.perf_counter() - started, store="orders", op="write")
+    storage_bytes.observe(sum(len(row[5]) for row in rows), store="orders", op="write")
+
+
+# --- Последовательность номеров заказов ---
+def next_order_id(min_value: int = 0) -> int:
+    """Выдаёт следующий номер заказа: монотонно, атомарно и без обращения к Google Sheets."""
+    conn = get_connection()
+    with _db.lock, conn:
+        row = conn.execute(
+            "UPDATE sequences SET value = MAX(value, ?) + 1 WHERE name = 'order_id' RETURNING value",
+            (min_value,),
+        ).fetchone()
+    return row[0]
+
+
+def reconcile_order_sequence(known_max: int) -> int:
+    """Поднимает счётчик до известного максимума (вызывается при старте). Возвращает текущее значение."""
+    conn = get_connection()
+    with _db.lock, conn:
+        row = conn.execute(
+            "UPDATE sequences SET value = MAX(value, ?) WHERE name = 'order_id' RETURNING value",
+            (known_max,),
+        ).fetchone()
+    return row[0]
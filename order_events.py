@@ -0,0 +1,169 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+
+import db
+import metrics
+import order_status
+from io_pool import run_io
+
+QUEUE_SIZE = 1000
+MAX_CONCURRENT_HANDLERS = 20
+HANDLER_TIMEOUT = 60.0  # секунд; зависший подписчик не должен держать события заказа
+
+# Все события заказов (кроме status_changed) перечислены здесь, чтобы опечатка в имени не терялась молча
+STATUS_CHANGED = "status_changed"            # любой сохранённый переход статуса (из order_status)
+PAYMENT_ACCEPTED = "payment_accepted"        # админ подтвердил оплату из чека клиента
+PAYMENT_CONFIRMED = "payment_confirmed"      # админ подтвердил оплату из карточки заказа
+WORK_ACCEPTED = "work_accepted"              # клиент принял работу
+EXECUTOR_CANCELLED = "executor_cancelled"    # исполнитель отказался от заказа в работе
+EVENTS = {STATUS_CHANGED, PAYMENT_ACCEPTED, PAYMENT_CONFIRMED, WORK_ACCEPTED, EXECUTOR_CANCELLED}
+
+event_latency = metrics.Histogram(
+    "bot_order_event_handler_seconds", "Время работы подписчиков событий заказов", ("event", "handler", "result"))
+
+_handlers = {}  # имя события или "*" -> [async handler(event)]
+_queue = None
+_tails = {}     # order_id -> задача последнего события заказа (события одного заказа идут по порядку)
+_limit = None
+_stats = {"emitted": 0, "dropped": 0, "handled": 0, "failed": 0}
+
+
+class OrderEvent:
+    """Событие заказа: снимок заказа на момент события и данные конкретного действия."""
+
+    __slots__ = ("name", "order", "data", "created_at")
+
+    def __init__(self, name: str, order: dict, data: dict):
+        self.name = name
+        self.order = order
+        self.data = data
+        self.created_at = time.time()
+
+    @property
+    def order_id(self):
+        return self.order.get("order_id")
+
+
+def subscribe(name: str, handler):
+    """handler(event) — async-функция; name — событие из EVENTS или "*" для всех событий."""
+    if name != "*" and name not in EVENTS:
+        raise ValueError(f"Неизвестное событие заказа: {name}")
+    _handlers.setdefault(name, []).append(handler)
+
+
+def emit(name: str, order: dict, **data):
+    """
+    Публикует событие и сразу возвращается: подписчики выполнятся фоновым воркером.
+    Заказ копируется, чтобы подписчики видели его таким, каким он был в момент события.
+    """
+    global _queue
+    if name not in EVENTS:
+        raise ValueError(f"Неизвестное событие заказа: {name}")
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    try:
+        _queue.put_nowait(OrderEvent(name, copy.deepcopy(order), data))
+        _stats["emitted"] += 1
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        logging.error(f"Очередь событий заказов переполнена, событие {name} заказа {order.get('order_id')} потеряно")
+
+
+def _on_transition(order, old_status, new_status):
+    emit(STATUS_CHANGED, order, old_status=old_status, new_status=new_status)
+
+
+order_status.subscribe(_on_transition)
+
+
+async def _run_handler(event: OrderEvent, handler):
+    handler_name = getattr(handler, "__name__", "handler")
+    started = time.perf_counter()
+    result = "error"
+    try:
+        async with _limit:
+            await asyncio.wait_for(handler(event), timeout=HANDLER_TIMEOUT)
+        result = "ok"
+        _stats["handled"] += 1
+    except Exception as e:
+        _stats["failed"] += 1
+        logging.error(f"Подписчик {handler_name} события {event.name} заказа {event.order_id}: {e}")
+    finally:
+        event_latency.observe(time.perf_counter() - started, event=event.name, handler=handler_name, result=result)
+
+
+async def _dispatch(event: OrderEvent, previous):
+    if previous is not None:
+        # Сначала дожидаемся предыдущего события этого заказа (его ошибки уже залогированы)
+        await asyncio.gather(previous, return_exceptions=True)
+    handlers = _handlers.get(event.name, []) + _handlers.get("*", [])
+    # Подписчики одного события независимы и выполняются параллельно
+    await asyncio.gather(*(_run_handler(event, handler) for handler in handlers))
+
+
+def _forget_tail(order_id, task):
+    if _tails.get(order_id) is task:
+        del _tails[order_id]
+
+
+async def run_event_worker():
+    """Фоновая задача: разбирает очередь событий и запускает подписчиков."""
+    global _queue, _limit
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _limit = asyncio.Semaphore(MAX_CONCURRENT_HANDLERS)
+    while True:
+        event = await _queue.get()
+        try:
+            order_id = event.order_id
+            task = asyncio.create_task(_dispatch(event, _tails.get(order_id)))
+            _tails[order_id] = task
+            task.add_done_callback(lambda t, order_id=order_id: _forget_tail(order_id, t))
+        finally:
+            _queue.task_done()
+
+
+async def drain(timeout: float = 10.0):
+    """Ждёт, пока обработаются уже опубликованные события (при остановке бота)."""
+    try:
+        if _queue is not None:
+            await asyncio.wait_for(_queue.join(), timeout=timeout)
+        if _tails:
+            await asyncio.wait_for(asyncio.gather(*_tails.values(), return_exceptions=True), timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Остановка: не обработано событий заказов: {(_queue.qsize() if _queue else 0) + len(_tails)}")
+
+
+def stats() -> dict:
+    return dict(_stats, queued=_queue.qsize() if _queue is not None else 0, in_progress=len(_tails))
+
+
+# --- Аудит: все события заказов пишутся в таблицу order_audit ---
+_audit_db = db.LazyConnection(
+    '''CREATE TABLE IF NOT EXISTS order_audit
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id TEXT,
+        event TEXT NOT NULL,
+        data TEXT,
+        created_at REAL NOT NULL)''',
+)
+
+
+def _write_audit(row):
+    conn = _audit_db.get()
+    with _audit_db.lock, conn:
+        conn.execute("INSERT INTO order_audit (order_id, event, data, created_at) VALUES (?, ?, ?, ?)", row)
+
+
+async def audit_event(event: OrderEvent):
+    row = (
+        str(event.order_id), event.name,
+        json.dumps(event.data, ensure_ascii=False, default=str), event.created_at,
+    )
+    await run_io(_write_audit, row, name="order_audit")
+
+
+subscribe("*", audit_event)
@@ -0,0 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class OrderLockRegistry:
+    """
+    Реестр asyncio-блокировок по order_id.
+    Изменения разных заказов идут параллельно, одного и того же — строго по очереди.
+    Блокировка удаляется из реестра, когда её больше никто не ждёт.
+    """
+
+    def __init__(self):
+        self._locks = {}  # order_id -> [asyncio.Lock, число владельцев и ожидающих]
+
+    @staticmethod
+    def _key(order_id):
+        try:
+            return int(order_id)
+        except (TypeError, ValueError):
+            return order_id
+
+    @asynccontextmanager
+    async def lock(self, order_id):
+        key = self._key(order_id)
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
+
+
+order_locks = OrderLockRegistry()
+
+
+def order_lock(order_id):
+    """async with order_lock(order_id): ... — сериализует изменения одного заказа."""
+    return order_locks.lock(order_id)
@@ -0,0 +1,90 @@
+import copy
+import logging
+
+import metrics
+from order_store import order_store
+
+# Разрешённые переходы: текущий статус -> статусы, в которые заказ можно перевести.
+# Переход в тот же статус разрешён только явно (allow_same=True), например новый комментарий к доработке.
+TRANSITIONS = {
+    "Редактируется": {"Рассматривается", "Отменена"},
+    "Рассматривается": {"Ожидает подтверждения", "Ожидает оплаты", "Отменена"},
+    "Ожидает подтверждения": {"Рассматривается", "Ожидает оплаты", "Отменена"},
+    "Ожидает подтверждения от исполнителя": {"Ожидает подтверждения", "Рассматривается", "Ожидает оплаты", "Отменена"},
+    # Отмена оплаты клиентом возвращает заказ к выбору условий, отказ исполнителя — в поиск
+    "Ожидает оплаты": {"В работе", "Ожидает подтверждения", "Рассматривается", "Отменена"},
+    "Принята": {"В работе", "Отправлен на проверку", "Рассматривается", "Отменена"},
+    # Работу админа-исполнителя проверять некому — она сразу утверждена
+    "В работе": {"Отправлен на проверку", "Утверждено администратором", "Рассматривается", "Отменена"},
+    "На доработке": {"Отправлен на проверку", "Утверждено администратором", "Рассматривается", "Отменена"},
+    "Отправлен на проверку": {"Утверждено администратором", "На доработке", "Отменена"},
+    "Утверждено администратором": {"Выполнена", "На доработке", "Отменена"},
+    "Выполнена": set(),
+    "Отменена": {"Рассматривается"},
+}
+
+_listeners = []  # callback(order, old_status, new_status) после сохранения перехода
+
+
+class InvalidStatusTransition(Exception):
+    """Переход не предусмотрен таблицей TRANSITIONS (обычно — устаревшая кнопка)."""
+
+    def __init__(self, order_id, old_status, new_status):
+        super().__init__(f"Заказ {order_id}: переход «{old_status}» → «{new_status}» не разрешён")
+        self.order_id = order_id
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+def can_transition(old_status, new_status, allow_same: bool = False) -> bool:
+    if old_status == new_status:
+        return allow_same
+    # Статус вне таблицы (старые данные, опечатка) меняется только через force
+    return new_status in TRANSITIONS.get(old_status, ())
+
+
+def transition(order: dict, new_status: str, *, force: bool = False, allow_same: bool = False, **changes) -> str:
+    """
+    Переводит заказ в new_status и сохраняет его одним вызовом order_store.save.
+    changes — поля, которые меняются вместе со статусом (None удаляет поле, например executor_id=None).
+    Недопустимый переход (в том числе в тот же статус без allow_same) поднимает InvalidStatusTransition,
+    а при ошибке сохранения заказ целиком возвращается к снимку до перехода.
+    force пропускает проверку таблицы (ручные правки админа). Возвращает прежний статус.
+    """
+    old_status = order.get("status")
+    if not force and not can_transition(old_status, new_status, allow_same):
+        metrics.order_transitions.inc(old=old_status or "", new=new_status, result="rejected")
+        raise InvalidStatusTransition(order.get("order_id"), old_status, new_status)
+    snapshot = copy.deepcopy(order)
+    order["status"] = new_status
+    for key, value in changes.items():
+        if value is None:
+            order.pop(key, None)
+        else:
+            order[key] = value
+    try:
+        order_store.save(order)
+    except Exception:
+        # save мог успеть поменять и другие поля (version), а changes — вложенные объекты
+        order.clear()
+        order.update(snapshot)
+        raise
+    metrics.order_transitions.inc(old=old_status or "", new=new_status, result="ok")
+    if old_status != new_status:
+        logging.info(f"Заказ {order.get('order_id')}: «{old_status}» → «{new_status}»")
+        for callback in _listeners:
+            try:
+                callback(order, old_status, new_status)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика перехода заказа {order.get('order_id')}: {e}")
+    return old_status
+
+
+def subscribe(callback):
+    """callback(order, old_status, new_status) вызывается после каждого сохранённого перехода."""
+    _listeners.append(callback)
+
+
+# --- Счётчики (индекс order_store по статусам, без обхода заказов) ---
+def status_counts() -> dict:
+    return order_store.status_counts()
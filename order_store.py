@@ -0,0 +1,273 @@
+import bisect
+import logging
+
+import order_db
+from persistence import WriteBehind
+
+
+def _norm_id(value):
+    # ID в заказах встречаются и числом, и строкой — приводим к int, где это возможно
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def parse_page_cursor(cursor: str):
+    """Курсор списка заказов: f — первая страница, n<id> — старше заказа id, p<id> — новее. Возвращает (before, after)."""
+    cursor = cursor or "f"
+    number = int(cursor[1:]) if cursor[1:].isdigit() else None
+    if number is None:
+        return None, None
+    if cursor.startswith("n"):
+        return number, None
+    if cursor.startswith("p"):
+        return None, number
+    return None, None
+
+
+class OrderStore:
+    """
+    Единое хранилище заказов процесса поверх таблицы orders в student.db (см. order_db).
+    Таблица читается один раз, дальше все выборки идут через индексы в памяти:
+    по order_id, user_id, executor_id и статусу.
+    Изменённые заказы пишутся в базу построчно и отложенно (см. persistence.WriteBehind).
+    """
+
+    def __init__(self):
+        self._loaded = False
+        self._orders = {}       # order_id -> заказ (порядок вставки = порядок создания)
+        self._by_user = {}      # user_id -> {order_id: заказ}
+        self._by_executor = {}  # executor_id -> {order_id: заказ}
+        self._by_status = {}    # status -> {order_id: заказ}
+        self._keys = {}         # order_id -> (user_id, executor_id, status) на момент индексации
+        # Отсортированные по возрастанию списки order_id для постраничного вывода:
+        # ("all",), ("user", id), ("executor", id), ("status", статус) -> [order_id, ...]
+        self._sorted = {}
+        self._listeners = []    # callback(order) после save/delete — для производных индексов
+        self._writer = WriteBehind(self._prepare_flush, name="orders")
+
+    # --- Загрузка ---
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        order_db.migrate_orders_from_json()
+        for order in order_db.load_orders():
+            if isinstance(order, dict) and order.get("order_id") is not None:
+                order_id = _norm_id(order["order_id"])
+                self._orders[order_id] = order
+                self._index(order_id, order)
+
+    def load(self):
+        """Загружает заказы заранее (при старте бота), включая миграцию из orders.json."""
+        self._ensure_loaded()
+
+    # --- Индексы ---
+    def _index(self, order_id, order):
+        keys = (_norm_id(order.get("user_id")), _norm_id(order.get("executor_id")), order.get("status"))
+        user_id, executor_id, status = keys
+        if user_id is not None:
+            self._by_user.setdefault(user_id, {})[order_id] = order
+        if executor_id is not None:
+            self._by_executor.setdefault(executor_id, {})[order_id] = order
+        self._by_status.setdefault(status, {})[order_id] = order
+        self._keys[order_id] = keys
+        if isinstance(order_id, int):
+            for sort_key in self._sort_keys(keys):
+                bisect.insort(self._sorted.setdefault(sort_key, []), order_id)
+
+    @staticmethod
+    def _sort_keys(keys) -> list:
+        user_id, executor_id, status = keys
+        sort_keys = [("all",), ("status", status)]
+        if user_id is not None:
+            sort_keys.append(("user", user_id))
+        if executor_id is not None:
+            sort_keys.append(("executor", executor_id))
+        return sort_keys
+
+    def _unindex(self, order_id):
+        keys = self._keys.pop(order_id, None)
+        if keys is None:
+            return
+        if isinstance(order_id, int):
+            for sort_key in self._sort_keys(keys):
+                ids = self._sorted.get(sort_key)
+                if ids is None:
+                    continue
+                i = bisect.bisect_left(ids, order_id)
+                if i < len(ids) and ids[i] == order_id:
+                    del ids[i]
+                if not ids:
+                    del self._sorted[sort_key]
+        for index, key in zip((self._by_user, self._by_executor, self._by_status), keys):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(order_id, None)
+                if not bucket:
+                    del index[key]
+
+    def _reindex(self, order_id, order):
+        # Заказы меняются по месту, поэтому сравниваем ключи с сохранёнными при прошлой индексации
+        keys = (_norm_id(order.get("user_id")), _norm_id(order.get("executor_id")), order.get("status"))
+        if self._keys.get(order_id) == keys and self._orders.get(order_id) is order:
+            return
+        self._unindex(order_id)
+        self._index(order_id, order)
+
+    # --- Чтение ---
+    def all(self) -> list:
+        self._ensure_loaded()
+        return list(self._orders.values())
+
+    def get(self, order_id):
+        self._ensure_loaded()
+        return self._orders.get(_norm_id(order_id))
+
+    def by_user(self, user_id) -> list:
+        self._ensure_loaded()
+        return list(self._by_user.get(_norm_id(user_id), {}).values())
+
+    def by_executor(self, executor_id) -> list:
+        self._ensure_loaded()
+        return list(self._by_executor.get(_norm_id(executor_id), {}).values())
+
+    def by_status(self, status) -> list:
+        self._ensure_loaded()
+        return list(self._by_status.get(status, {}).values())
+
+    def status_counts(self) -> dict:
+        """Число заказов в каждом статусе — по индексу, без обхода заказов."""
+        self._ensure_loaded()
+        return {status: len(bucket) for status, bucket in self._by_status.items()}
+
+    def page(self, *, user_id=None, executor_id=None, status=None, before=None, after=None,
+             limit: int = 10, predicate=None, stop=None):
+        """
+        Страница заказов от новых к старым с keyset-курсором по order_id.
+        before — заказы старше этого номера (следующая страница), after — новее (предыдущая).
+        Выборка идёт по самому узкому индексу, остальные условия проверяются на лету;
+        stop(order) прекращает обход (например, когда заказы стали старше нужной даты).
+        Возвращает (заказы, есть_ещё_в_направлении_обхода).
+        """
+        self._ensure_loaded()
+        candidates = [("all",)]
+        if status is not None:
+            candidates.append(("status", status))
+        if executor_id is not None:
+            candidates.append(("executor", _norm_id(executor_id)))
+        if user_id is not None:
+            candidates.append(("user", _norm_id(user_id)))
+        ids = min((self._sorted.get(key, []) for key in candidates), key=len)
+        if after is not None:
+            positions = range(bisect.bisect_right(ids, int(after)), len(ids))
+        else:
+            start = bisect.bisect_left(ids, int(before)) if before is not None else len(ids)
+            positions = range(start - 1, -1, -1)
+        result = []
+        has_more = False
+        for i in positions:
+            order = self._orders[ids[i]]
+            keys = self._keys[ids[i]]
+            if user_id is not None and keys[0] != _norm_id(user_id):
+                continue
+            if executor_id is not None and keys[1] != _norm_id(executor_id):
+                continue
+            if status is not None and keys[2] != status:
+                continue
+            if after is None and stop is not None and stop(order):
+                break
+            if predicate is not None and not predicate(order):
+                continue
+            if len(result) == limit:
+                has_more = True
+                break
+            result.append(order)
+        if after is not None:
+            result.reverse()
+        return result, has_more
+
+    def page_union(self, queries, *, before=None, after=None, limit: int = 10):
+        """
+        Страница по объединению нескольких выборок page() (queries — список словарей с условиями),
+        например заказы клиента вместе с заказами, где он исполнитель. Дубли убираются.
+        """
+        merged = {}
+        has_more = False
+        for query in queries:
+            orders, more = self.page(before=before, after=after, limit=limit, **query)
+            has_more = has_more or more
+            for order in orders:
+                merged[order['order_id']] = order
+        # От курсора: при before — от новых к старым, при after — от старых к новым
+        ids = sorted(merged, reverse=after is None)
+        if len(ids) > limit:
+            has_more = True
+            ids = ids[:limit]
+        if after is not None:
+            ids.reverse()
+        return [merged[order_id] for order_id in ids], has_more
+
+    def max_order_id(self) -> int:
+        self._ensure_loaded()
+        # ("all",) — отсортированный список всех числовых номеров, максимум — последний элемент
+        ids = self._sorted.get(("all",))
+        return ids[-1] if ids else 0
+
+    # --- Подписки ---
+    def subscribe(self, callback):
+        """callback(order) вызывается после каждого сохранения и удаления заказа."""
+        self._listeners.append(callback)
+
+    def _notify(self, order):
+        for callback in self._listeners:
+            try:
+                callback(order)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика изменений заказа {order.get('order_id')}: {e}")
+
+    # --- Запись ---
+    def save(self, order: dict):
+        """
+        Добавляет новый заказ или фиксирует изменения существующего.
+        Каждое сохранение увеличивает order['version'] (ключ кэшей, зависящих от содержимого заказа).
+        Конкурентные read-modify-write одного заказа сериализуются через order_locks.order_lock.
+        """
+        self._ensure_loaded()
+        order_id = _norm_id(order["order_id"])
+        current = self._orders.get(order_id)
+        current_version = current.get("version", 0) if current is not None else 0
+        order["version"] = current_version + 1
+        self._orders[order_id] = order
+        self._reindex(order_id, order)
+        self._writer.mark_dirty(order_id)
+        self._notify(order)
+
+    def delete(self, order_id):
+        self._ensure_loaded()
+        order_id = _norm_id(order_id)
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        self._unindex(order_id)
+        self._writer.mark_deleted(order_id)
+        self._notify(order)
+        return order
+
+    # --- Сброс на диск ---
+    def _prepare_flush(self, dirty: set, deleted: set):
+        # Строки сериализуем сразу, пока заказы не поменялись по месту; в базу пишут только они
+        rows = [order_db.order_row(self._orders[order_id]) for order_id in dirty if order_id in self._orders]
+        return lambda: order_db.write_orders(rows, deleted)
+
+    def flush(self):
+        self._writer.flush()
+
+    async def aclose(self):
+        await self._writer.aclose()
+
+
+order_store = OrderStore()
@@ -5,10 +5,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from datetime import datetime, timedelta
 import qrcode
-from shared import get_all_orders, ADMIN_ID, bot, STATUS_EMOJI_MAP, get_full_name, pluralize_days, get_executors_list
+from shared import get_order, ADMIN_ID, bot, STATUS_EMOJI_MAP, get_full_name, pluralize_days
 from aiogram.types import BufferedInputFile
-import json
-from shared import save_order_to_gsheets
+from aiogram.exceptions import TelegramBadRequest
+from user_store import get_user_phone
+from io_pool import run_io
+import order_events
+import order_status
+from order_locks import order_lock
 import requests
 import os
 from aiogram import Router
@@ -79,13 +83,27 @@ def generate_qr_code(payment_url: str) -> BufferedInputFile:
     buf.seek(0)
     return BufferedInputFile(buf.getvalue(), filename="qr_code.png")
 
+# Кэш QR-кодов: (ссылка, сумма) -> {"file": BufferedInputFile, "file_id": str}
+# После первой отправки Telegram хранит картинку у себя, дальше шлём только file_id
+_qr_cache = {}
+
+async def get_payment_qr(payment_url: str, amount=None):
+    entry = _qr_cache.get((payment_url, amount))
+    if entry is None:
+        entry = _qr_cache[(payment_url, amount)] = {"file": await run_io(generate_qr_code, payment_url), "file_id": None}
+    return entry["file_id"] or entry["file"]
+
+def remember_payment_qr(payment_url: str, amount, sent_message):
+    entry = _qr_cache.get((payment_url, amount))
+    if entry is not None and sent_message is not None and sent_message.photo:
+        entry["file_id"] = sent_message.photo[-1].file_id
+
 
 # --- Хендлер старта оплаты ---
 @payment_router.callback_query(F.data.startswith("pay_"))
 async def start_payment(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[1])
-    orders = get_all_orders()
-    order = next((o for o in orders if o['order_id'] == order_id), None)
+    order = get_order(order_id)
     if not order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -95,12 +113,22 @@ async def start_payment(callback: CallbackQuery, state: FSMContext):
     
         # Fallback: старый QR по СБП
     payment_url = f"https://qr.nspk.ru/BS2A001IRUK64DDN8TDB9IVJQLF5RG98?type=01&bank=100000000004&crc=64CA"
-    qr = generate_qr_code(payment_url)
+    # Ссылка СБП статическая и суммы не содержит, поэтому QR один на все платежи
+    qr = await get_payment_qr(payment_url)
     await callback.message.answer(
             f"💳 Сессия оплаты длится 15 минут!\n\nОплатите заказ по предмету: <b>{subject}</b>\nСумма: <b>{price} ₽</b>\n\nСейчас оплата по СБП. Отсканируйте QR-код ниже для оплаты:",
             parse_mode="HTML"
         )
-    await callback.message.answer_photo(qr, caption="После оплаты нажмите кнопку ниже.", reply_markup=get_payment_keyboard(order_id))
+    try:
+        qr_message = await callback.message.answer_photo(qr, caption="После оплаты нажмите кнопку ниже.", reply_markup=get_payment_keyboard(order_id))
+    except TelegramBadRequest:
+        if isinstance(qr, BufferedInputFile):
+            raise
+        # Telegram не принял закэшированный file_id — загружаем картинку заново
+        _qr_cache[(payment_url, None)]["file_id"] = None
+        qr = await get_payment_qr(payment_url)
+        qr_message = await callback.message.answer_photo(qr, caption="После оплаты нажмите кнопку ниже.", reply_markup=get_payment_keyboard(order_id))
+    remember_payment_qr(payment_url, None, qr_message)
     await state.set_state(PaymentState.waiting_for_payment)
     await state.update_data(payment_order_id=order_id, payment_start=datetime.now().isoformat())
     await callback.answer()
@@ -117,8 +145,7 @@ async def payment_paid(callback: CallbackQuery, state: FSMContext):
 async def payment_screenshot(message: Message, state: FSMContext):
     data = await state.get_data()
     order_id = data.get('payment_order_id')
-    orders = get_all_orders()
-    order = next((o for o in orders if o['order_id'] == order_id), None)
+    order = get_order(order_id)
     if not order:
         await message.answer("Заказ не найден.")
         await state.clear()
@@ -145,128 +172,30 @@ async def payment_screenshot(message: Message, state: FSMContext):
 @payment_router.callback_query(F.data.startswith("admin_payment_accept:"))
 async def admin_payment_accept(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[1])
-    orders = get_all_orders()
-    order = next((o for o in orders if o['order_id'] == order_id), None)
-    if not order:
-        await callback.answer("Заказ не найден.", show_alert=True)
-        return
-    order['status'] = "В работе"
-
-    # Сохраняем orders.json
-    with open("orders.json", "w", encoding="utf-8") as f:  
-        json.dump(orders, f, ensure_ascii=False, indent=4)
-    await save_order_to_gsheets(order)
-    # Уведомляем клиента
-    user_id = order.get('user_id')
-    emoji = STATUS_EMOJI_MAP.get('В работе', '⏳')
-    if user_id:
-        # Определяем ФИО исполнителя для клиента
-        executor_full_name = None
-        executor_id = order.get('executor_id')
-        offers = order.get('executor_offers', [])
-        # Ищем offer с нужным executor_id
-        offer = None
-        if executor_id and offers:
-            for o in offers:
-                if str(o.get('executor_id')) == str(executor_id):
-                    offer = o
-                    break
-        if not offer and offers:
-            offer = offers[0]
-        if offer:
-            executor_full_name = offer.get('executor_full_name')
-        # Если не нашли — ищем по executor_id в executors.json
-        if not executor_full_name and executor_id:
-            try:
-                executors = get_executors_list()
-                for ex in executors:
-                    if str(ex.get('id')) == str(executor_id):
-                        executor_full_name = ex.get('name')
-                        break
-            except Exception:
-                executor_full_name = None
-        if not executor_full_name:
-            executor_full_name = 'Не назначен'
-        deadline_executor = offer.get('deadline') if offer else order.get('deadline', '')
-        deadline_executor_str = pluralize_days(deadline_executor) if isinstance(deadline_executor, str) and deadline_executor.isdigit() else deadline_executor
-        await bot.send_message(
-            user_id,
-            f"✅ Оплата подтверждена! Ваш заказ теперь {emoji} В работе.",  
-            parse_mode="HTML"
-        )
-    # Уведомляем исполнителя
-    executor_id = order.get('executor_id')
-    offers = order.get('executor_offers', [])
-    offer = None
-    if executor_id and offers:
-        for o in offers:
-            if str(o.get('executor_id')) == str(executor_id):
-                offer = o
-                break
-    if not offer and offers:
-        offer = offers[0]
-    deadline_executor = offer.get('deadline') if offer else order.get('deadline', '')
-    deadline_client = order.get('deadline', 'Не указан')
-    subject = order.get('subject', 'Не указан')
-    work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
-    executor_full_name = offer.get('executor_full_name') if offer else 'Не назначен'
-    # Если исполнитель — админ, берем ФИО из executors.json или пишем 'Администратор'
-    if executor_id and str(executor_id) == str(ADMIN_ID):
-        executors = get_executors_list()
-        admin_name = None
-        for ex in executors:
-            if str(ex.get('id')) == str(ADMIN_ID):
-                admin_name = ex.get('name')
-                break
-        executor_full_name = admin_name or 'Администратор'
-    deadline_executor_str = pluralize_days(deadline_executor) if isinstance(deadline_executor, str) and deadline_executor.isdigit() else deadline_executor
-    if executor_id:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📔 Перейти к заказу", callback_data=f"executor_view_order_{order_id}")],
-            [InlineKeyboardButton(text="❌ Отказаться", callback_data=f"executor_refuse_work:{order_id}")]
-        ])
-        await bot.send_message(
-            executor_id,
-            f"💸 Клиент оплатил заказ!\nСтатус: В работе.\n\n"
-            f"дедлайн клиента: {deadline_client}\n"
-            f"⏳ Время на работу: {deadline_executor_str}\n"
-            f"📚 Предмет: {subject}\n"
-            f"Тип работы: {work_type}",
-            parse_mode='HTML',
-            reply_markup=keyboard
-        )
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if not order:
+            await callback.answer("Заказ не найден.", show_alert=True)
+            return
+        # Повторное нажатие не должно второй раз добавлять заказ в таблицу
+        if order.get('status') == "В работе":
+            await callback.answer("Оплата по этому заказу уже подтверждена.", show_alert=True)
+            return
+        try:
+            order_status.transition(order, "В работе")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ в статусе «{order.get('status')}», подтвердить оплату нельзя.", show_alert=True)
+            return
+    # Таблицу и уведомления клиенту и исполнителю обновляют подписчики order_events
+    order_events.emit(order_events.PAYMENT_ACCEPTED, order, actor_id=callback.from_user.id)
+    await callback.answer()
     try:
         await callback.message.delete()
     except Exception:
         pass
-    # Если исполнитель — админ, пишем 'Я' в поле Исполнитель
-    if executor_id and str(executor_id) == str(ADMIN_ID):
-        executor_full_name = 'Я'
-    # --- Определяем исполнителя для admin_text ---
-    executor_full_name_admin = None
-    executor_id_admin = order.get('executor_id')
-    offers_admin = order.get('executor_offers', [])
-    offer_admin = None
-    if executor_id_admin and offers_admin:
-        for o in offers_admin:
-            if str(o.get('executor_id')) == str(executor_id_admin):
-                offer_admin = o
-                break
-    if not offer_admin and offers_admin:
-        offer_admin = offers_admin[0]
-    if offer_admin:
-        executor_full_name_admin = offer_admin.get('executor_full_name')
-    if not executor_full_name_admin and executor_id_admin:
-        try:
-            executors = get_executors_list()
-            for ex in executors:
-                if str(ex.get('id')) == str(executor_id_admin):
-                    executor_full_name_admin = ex.get('name')
-                    break
-        except Exception:
-            executor_full_name_admin = None
-    if not executor_full_name_admin:
-        executor_full_name_admin = 'Не назначен'
+    executor_id = order.get('executor_id')
+    subject = order.get('subject', 'Не указан')
+    work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
     admin_text = (
         f"✅ Оплата успешно подтверждена, статус заказа переходит в работу ⏳\n"
         f"<b>Предмет:</b> {subject}\n"
@@ -279,22 +208,74 @@ async def admin_payment_accept(callback: CallbackQuery, state: FSMContext):
             [InlineKeyboardButton(text="Перейти к заказу", callback_data=f"admin_view_order_{order_id}")]
         ])
     await bot.send_message(callback.from_user.id, admin_text, parse_mode="HTML", reply_markup=admin_keyboard)
-    await callback.answer()
+
+def _selected_offer(order):
+    # Оффер назначенного исполнителя, иначе первый из присланных
+    executor_id = order.get('executor_id')
+    offers = order.get('executor_offers', [])
+    if isinstance(offers, dict):
+        offers = [offers]
+    if executor_id and offers:
+        for o in offers:
+            if str(o.get('executor_id')) == str(executor_id):
+                return o
+    return offers[0] if offers else None
+
+async def notify_client_payment_accepted(event):
+    user_id = event.order.get('user_id')
+    if user_id:
+        emoji = STATUS_EMOJI_MAP.get('В работе', '⏳')
+        await bot.send_message(
+            user_id,
+            f"✅ Оплата подтверждена! Ваш заказ теперь {emoji} В работе.",
+            parse_mode="HTML"
+        )
+
+async def notify_executor_payment_accepted(event):
+    order = event.order
+    order_id = event.order_id
+    executor_id = order.get('executor_id')
+    if not executor_id:
+        return
+    offer = _selected_offer(order)
+    deadline_executor = offer.get('deadline') if offer else order.get('deadline', '')
+    deadline_client = order.get('deadline', 'Не указан')
+    subject = order.get('subject', 'Не указан')
+    work_type = order.get('work_type', 'Не указан').replace('work_type_', '')
+    deadline_executor_str = pluralize_days(deadline_executor) if isinstance(deadline_executor, str) and deadline_executor.isdigit() else deadline_executor
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📔 Перейти к заказу", callback_data=f"executor_view_order_{order_id}")],
+        [InlineKeyboardButton(text="❌ Отказаться", callback_data=f"executor_refuse_work:{order_id}")]
+    ])
+    await bot.send_message(
+        executor_id,
+        f"💸 Клиент оплатил заказ!\nСтатус: В работе.\n\n"
+        f"дедлайн клиента: {deadline_client}\n"
+        f"⏳ Время на работу: {deadline_executor_str}\n"
+        f"📚 Предмет: {subject}\n"
+        f"Тип работы: {work_type}",
+        parse_mode='HTML',
+        reply_markup=keyboard
+    )
+
+order_events.subscribe(order_events.PAYMENT_ACCEPTED, notify_client_payment_accepted)
+order_events.subscribe(order_events.PAYMENT_ACCEPTED, notify_executor_payment_accepted)
 
 @payment_router.callback_query(F.data.startswith("admin_payment_reject:"))
 async def admin_payment_reject(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[1])
-    orders = get_all_orders()
-    order = next((o for o in orders if o['order_id'] == order_id), None)
-    if not order:
-        await callback.answer("Заказ не найден.", show_alert=True)
-        return
-    user_id = order.get('user_id')
-    # Меняем статус на 'Ожидает оплаты'
-    order['status'] = "Ожидает оплаты"
-    # Сохраняем orders.json
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        order = get_order(order_id)
+        if not order:
+            await callback.answer("Заказ не найден.", show_alert=True)
+            return
+        user_id = order.get('user_id')
+        # Меняем статус на 'Ожидает оплаты' (чек присылают, не меняя статуса, — остаёмся в нём же)
+        try:
+            order_status.transition(order, "Ожидает оплаты", allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{order.get('status')}».", show_alert=True)
+            return
     if user_id:
         await bot.send_message(user_id, "❌ Оплата не подтверждена. Пожалуйста, попробуйте ещё раз или обратитесь к администратору.")
     try:
@@ -307,17 +288,16 @@ async def admin_payment_reject(callback: CallbackQuery, state: FSMContext):
 @payment_router.callback_query(F.data.startswith("payment_cancel:"))
 async def payment_cancel(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[-1])
-    # 1. Обновляем статус заказа
-    orders = get_all_orders()
-    updated = False
-    for order in orders:
-        if str(order.get("order_id")) == str(order_id):
-            order["status"] = "Ожидает подтверждения"
-            updated = True
-            break
-    if updated:
-        with open("orders.json", "w", encoding="utf-8") as f:
-            json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        # 1. Обновляем статус заказа
+        order = get_order(order_id)
+        if order:
+            try:
+                order_status.transition(order, "Ожидает подтверждения")
+            except order_status.InvalidStatusTransition:
+                await state.clear()
+                await callback.answer(f"Заказ уже в статусе «{order.get('status')}».", show_alert=True)
+                return
     await state.clear()
     # 2. Удаляем/редактируем сообщение пользователя
     try:
@@ -331,13 +311,7 @@ async def payment_cancel(callback: CallbackQuery, state: FSMContext):
     # 3. Уведомляем администратора
     user_id = callback.from_user.id
     # Получаем номер телефона пользователя
-    phone_number = None
-    try:
-        with open("users.json", "r", encoding="utf-8") as f:
-            users = json.load(f)
-            phone_number = users.get(str(user_id), {}).get("phone_number")
-    except Exception:
-        phone_number = None
+    phone_number = get_user_phone(user_id)
     phone_info = phone_number if phone_number else 'номер не найден'
     await bot.send_message(ADMIN_ID, f"❌ Клиент отменил оплату, свяжитесь для уточнения подробностей\nТелефон: {phone_info}")
     await callback.answer()
@@ -400,21 +374,34 @@ async def executor_skip_comment(callback: CallbackQuery, state: FSMContext):
     await finish_executor_cancel_order(callback, state, order_id, "Другое", "")
 
 async def finish_executor_cancel_order(message_or_callback, state, order_id, reason, comment):
-    # Обновляем заказ
-    orders = get_all_orders()
-    updated = False
-    for order in orders:
-        if str(order['order_id']) == str(order_id):
-            order['status'] = "Рассматривается"
-            order['executor_cancel_reason'] = reason
-            order['executor_cancel_comment'] = comment
-            order.pop('executor_offer', None)
-            order.pop('executor_id', None)  # Удаляем исполнителя
-            updated = True
-            break
-    # Сохраняем orders.json
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        # Обновляем заказ
+        order = get_order(order_id)
+        if order:
+            # Исполнитель удаляется из заказа — для уведомления запоминаем его оффер заранее
+            offer = _selected_offer(order)
+            try:
+                order_status.transition(
+                    order, "Рассматривается",
+                    executor_cancel_reason=reason,
+                    executor_cancel_comment=comment,
+                    executor_offer=None,
+                    executor_id=None,  # Удаляем исполнителя
+                )
+            except order_status.InvalidStatusTransition:
+                await state.clear()
+                text = f"Заказ уже в статусе «{order.get('status')}», отказаться от него нельзя."
+                if isinstance(message_or_callback, Message):
+                    await message_or_callback.answer(text)
+                else:
+                    await message_or_callback.answer(text, show_alert=True)
+                return
+            # Администратора уведомляет подписчик order_events
+            order_events.emit(
+                order_events.EXECUTOR_CANCELLED, order,
+                actor_id=message_or_callback.from_user.id, reason=reason, comment=comment,
+                executor_full_name=(offer or {}).get('executor_full_name') or get_full_name(message_or_callback.from_user),
+            )
     await state.clear()
     # Уведомляем исполнителя
     if isinstance(message_or_callback, Message):
@@ -422,69 +409,32 @@ async def finish_executor_cancel_order(message_or_callback, state, order_id, rea
     else:
         await message_or_callback.message.edit_text("❎ Заказ отменен, администратор получит уведомление")
         await message_or_callback.answer()
-    # Уведомляем администратора
-    # Получаем ФИО исполнителя и предмет
-    executor_full_name = '—'
-    subject = '—'
-    for order in orders:
-        if str(order['order_id']) == str(order_id):
-            subject = order.get('subject', '—')
-            executor_id = order.get('executor_id')
-            offers = order.get('executor_offers', [])
-            offer = None
-            if executor_id and offers:
-                for o in offers:
-                    if str(o.get('executor_id')) == str(executor_id):
-                        offer = o
-                        break
-            if not offer and offers:
-                offer = offers[0]
-            if offer:
-                executor_full_name = offer.get('executor_full_name') or '—'
-            if not executor_full_name and executor_id:
-                from shared import get_executors_list
-                executors = get_executors_list()
-                for ex in executors:
-                    if str(ex.get('id')) == str(executor_id):
-                        executor_full_name = ex.get('name') or '—'
-                        break
-            break
-    admin_text = f"""
-❌ <b>Исполнитель - {executor_full_name}</b> отказался от заказа по предмету <b>{subject}</b>.
-<b>Причина:</b> {reason}
-<b>Комментарий:</b> {comment or 'Нет'}
-    """
-    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
 
 @payment_router.callback_query(F.data.startswith("admin_confirm_payment:"))
 async def admin_confirm_payment(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[-1])
-    all_orders = get_all_orders()
-    target_order = next((o for o in all_orders if o.get("order_id") == order_id), None)
-    if not target_order:
-        await callback.answer("Заказ не найден.", show_alert=True)
-        return
-    # Меняем статус
-    target_order['status'] = "В работе"
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(all_orders, f, ensure_ascii=False, indent=4)
-    await save_order_to_gsheets(target_order)
-    # Уведомления
-    customer_id = target_order.get("user_id")
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+        if not target_order:
+            await callback.answer("Заказ не найден.", show_alert=True)
+            return
+        # Повторное нажатие не должно второй раз слать уведомления и писать в таблицу
+        if target_order.get('status') == "В работе":
+            await callback.answer("Оплата по этому заказу уже подтверждена.", show_alert=True)
+            return
+        # Меняем статус
+        try:
+            order_status.transition(target_order, "В работе")
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
+    # Таблицу и уведомления клиенту и исполнителю обновляют подписчики order_events
+    order_events.emit(order_events.PAYMENT_CONFIRMED, target_order, actor_id=callback.from_user.id)
     executor_id = target_order.get("executor_id")
-    offer = target_order.get("executor_offer", {})
-    executor_deadline = offer.get("deadline", "не указан")
-    # Если дедлайн = 'До дедлайна', берем срок от клиента
-    if str(executor_deadline).strip().lower() == 'До дедлайна':
-        deadline_str = target_order.get('deadline', 'не указан')
-    else:
-        deadline_str = pluralize_days(executor_deadline) if isinstance(executor_deadline, str) and executor_deadline.isdigit() else executor_deadline
-    executor_full_name = offer.get('executor_full_name', 'Я')
     subject = target_order.get('subject', 'Не указан')
     work_type = target_order.get('work_type', '').replace('work_type_', '')
-    # Если исполнитель — админ, пишем 'Я' в поле Исполнитель и добавляем кнопку
+    # Если исполнитель — админ, добавляем кнопку
     if executor_id and str(executor_id) == str(ADMIN_ID):
-        executor_full_name = 'Я'
         admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Перейти к заказу", callback_data=f"admin_view_order_{order_id}")]
         ])
@@ -498,46 +448,73 @@ async def admin_confirm_payment(callback: CallbackQuery, state: FSMContext):
 
     )
     await callback.message.edit_text(admin_text, parse_mode="HTML", reply_markup=admin_keyboard)
-    # Уведомление клиенту
-    if customer_id:
-        try:
-            client_text = (
-                f"✅ Оплата по вашей заявке подтверждена!\n\n"
-                f"Исполнитель уже приступил к работе. "
-                f"Ожидаемый срок сдачи: <b>{deadline_str}</b>."
-            )
-            await bot.send_message(customer_id, client_text, parse_mode="HTML")
-        except Exception as e:
-            await bot.send_message(ADMIN_ID, f"Не удалось уведомить клиента {customer_id} о подтверждении оплаты. Ошибка: {e}")
-    # Уведомление исполнителю
-    if executor_id:
-        deadline_executor = target_order.get('executor_offer', {}).get('deadline') or target_order.get('deadline', '')
-        deadline_executor_str = pluralize_days(deadline_executor) if isinstance(deadline_executor, str) and deadline_executor.isdigit() else deadline_executor
-        executor_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Перейти к заказу", callback_data=f"executor_view_order_{order_id}")]
-        ])
-        await bot.send_message(
-            executor_id,
-            f"✅ Заказ перешел в статус 'В работе'\nВаш дедлайн - {deadline_executor_str}",
-            reply_markup=executor_keyboard
-        )
     await callback.answer()
 
+async def notify_admin_executor_cancelled(event):
+    # Общий подписчик для отказов из меню исполнителя и из уведомления об оплате
+    admin_text = f"""
+❌ <b>Исполнитель - {event.data.get('executor_full_name') or '—'}</b> (ID: {event.data.get('actor_id')}) отказался от заказа №{event.order_id} по предмету <b>{event.order.get('subject', '—')}</b>.
+<b>Причина:</b> {event.data.get('reason')}
+<b>Комментарий:</b> {event.data.get('comment') or 'Нет'}
+    """
+    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
+
+async def notify_client_payment_confirmed(event):
+    customer_id = event.order.get("user_id")
+    if not customer_id:
+        return
+    offer = event.order.get("executor_offer", {})
+    executor_deadline = offer.get("deadline", "не указан")
+    # Если дедлайн = 'До дедлайна', берем срок от клиента
+    if str(executor_deadline).strip().lower() == 'До дедлайна':
+        deadline_str = event.order.get('deadline', 'не указан')
+    else:
+        deadline_str = pluralize_days(executor_deadline) if isinstance(executor_deadline, str) and executor_deadline.isdigit() else executor_deadline
+    try:
+        client_text = (
+            f"✅ Оплата по вашей заявке подтверждена!\n\n"
+            f"Исполнитель уже приступил к работе. "
+            f"Ожидаемый срок сдачи: <b>{deadline_str}</b>."
+        )
+        await bot.send_message(customer_id, client_text, parse_mode="HTML")
+    except Exception as e:
+        await bot.send_message(ADMIN_ID, f"Не удалось уведомить клиента {customer_id} о подтверждении оплаты. Ошибка: {e}")
+
+async def notify_executor_payment_confirmed(event):
+    executor_id = event.order.get("executor_id")
+    if not executor_id:
+        return
+    deadline_executor = event.order.get('executor_offer', {}).get('deadline') or event.order.get('deadline', '')
+    deadline_executor_str = pluralize_days(deadline_executor) if isinstance(deadline_executor, str) and deadline_executor.isdigit() else deadline_executor
+    executor_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Перейти к заказу", callback_data=f"executor_view_order_{event.order_id}")]
+    ])
+    await bot.send_message(
+        executor_id,
+        f"✅ Заказ перешел в статус 'В работе'\nВаш дедлайн - {deadline_executor_str}",
+        reply_markup=executor_keyboard
+    )
+
+order_events.subscribe(order_events.EXECUTOR_CANCELLED, notify_admin_executor_cancelled)
+order_events.subscribe(order_events.PAYMENT_CONFIRMED, notify_client_payment_confirmed)
+order_events.subscribe(order_events.PAYMENT_CONFIRMED, notify_executor_payment_confirmed)
+
 @payment_router.callback_query(F.data.startswith("admin_reject_payment:"))
 async def admin_reject_payment(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split(":")[-1])
 
-    orders = get_all_orders()
-    target_order = next((o for o in orders if o.get("order_id") == order_id), None)
-    
-    if not target_order:
-        await callback.answer("Заказ не найден.", show_alert=True)
-        return
-        
-    target_order["status"] = "Ожидает оплаты"
-    
-    with open("orders.json", "w", encoding="utf-8") as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    async with order_lock(order_id):
+        target_order = get_order(order_id)
+
+        if not target_order:
+            await callback.answer("Заказ не найден.", show_alert=True)
+            return
+
+        try:
+            order_status.transition(target_order, "Ожидает оплаты", allow_same=True)
+        except order_status.InvalidStatusTransition:
+            await callback.answer(f"Заказ уже в статусе «{target_order.get('status')}».", show_alert=True)
+            return
         
     customer_id = target_order.get("user_id")
     if customer_id:
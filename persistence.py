@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import logging
+import os
+import tempfile
+
+from io_pool import run_io
+
+# Задержка перед сбросом на диск: серия нажатий кнопок укладывается в одну запись
+FLUSH_DELAY = 0.5
+
+
+def atomic_write_text(file_path: str, payload: str) -> None:
+    """Пишет текст во временный файл рядом с целевым и атомарно подменяет его."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class WriteBehind:
+    """
+    Отложенная запись: изменения только помечаются грязными,
+    а на диск уходят одним сбросом по таймеру или при остановке бота.
+    flush_func получает множества изменённых и удалённых ключей.
+    """
+
+    def __init__(self, flush_func, delay: float = FLUSH_DELAY, name: str = "write-behind"):
+        self._flush_func = flush_func
+        self.delay = delay
+        self.name = name
+        self._dirty = set()
+        self._deleted = set()
+        self._handle = None
+        self._task = None
+        atexit.register(self.flush)
+
+    def mark_dirty(self, key) -> None:
+        self._deleted.discard(key)
+        self._dirty.add(key)
+        self._schedule()
+
+    def mark_deleted(self, key) -> None:
+        self._dirty.discard(key)
+        self._deleted.add(key)
+        self._schedule()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._dirty or self._deleted)
+
+    def _schedule(self) -> None:
+        if self._handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты, миграции) пишем сразу
+            self.flush()
+            return
+        self._handle = loop.call_later(self.delay, self._on_timer)
+
+    def _take(self):
+        dirty, deleted = self._dirty, self._deleted
+        self._dirty, self._deleted = set(), set()
+        return dirty, deleted
+
+    def _on_timer(self) -> None:
+        self._handle = None
+        if not self.pending:
+            return
+        if self._task is not None and not self._task.done():
+            # Предыдущий сброс ещё идёт — попробуем позже
+            self._schedule()
+            return
+        dirty, deleted = self._take()
+        try:
+            writer = self._flush_func(dirty, deleted)
+        except Exception as e:
+            logging.error(f"{self.name}: ошибка подготовки сброса: {e}")
+            self._restore(dirty, deleted)
+            return
+        if writer is None:
+            return
+        # Снимок уже сериализован, сам диск трогаем в отдельном потоке
+        self._task = asyncio.get_running_loop().create_task(self._run_writer(writer, dirty, deleted))
+
+    async def _run_writer(self, writer, dirty, deleted) -> None:
+        try:
+            await run_io(writer, name=f"{self.name}-flush")
+        except Exception as e:
+            logging.error(f"{self.name}: ошибка записи на диск: {e}")
+            self._restore(dirty, deleted)
+
+    def _restore(self, dirty, deleted, reschedule: bool = True) -> None:
+        # Возвращаем ключи в очередь, не затирая более свежие пометки
+        for key in deleted:
+            if key not in self._dirty:
+                self._deleted.add(key)
+        for key in dirty:
+            if key not in self._deleted:
+                self._dirty.add(key)
+        if reschedule:
+            self._schedule()
+
+    def flush(self) -> None:
+        """Синхронно сбрасывает все накопленные изменения (остановка бота, atexit)."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self.pending:
+            return
+        dirty, deleted = self._take()
+        try:
+            writer = self._flush_func(dirty, deleted)
+            if writer is not None:
+                writer()
+        except Exception as e:
+            logging.error(f"{self.name}: ошибка сброса: {e}")
+            self._restore(dirty, deleted, reschedule=False)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.flush()
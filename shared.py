@@ -1,8 +1,11 @@
 import os
-import json
+import logging
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
+from order_store import order_store
+from executor_registry import executor_registry
+import order_events
 
 # Глобальная карта статусов для консистентности
 STATUS_EMOJI_MAP = {
@@ -19,21 +22,24 @@ STATUS_EMOJI_MAP = {
     "Утверждено администратором": "✅",
     "На доработке": "✍️",
 }
+# Порядок статусов задаёт их короткие коды в callback_data (фильтры списков заказов)
+ORDER_STATUSES = list(STATUS_EMOJI_MAP)
 
 ADMIN_ID = os.getenv("ADMIN_ID", "842270366")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7763016986:AAFW4Rwh012_bfh8Jt0E_zaq5abvzenr4bE")
 bot = Bot(token=BOT_TOKEN)
 
 def get_all_orders() -> list:
-    file_path = "orders.json"
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return []
-    with open(file_path, "r", encoding="utf-8") as f:
-        try:
-            all_orders = json.load(f)
-        except json.JSONDecodeError:
-            return []
-    return all_orders if isinstance(all_orders, list) else []
+    return order_store.all()
+
+def get_order(order_id):
+    return order_store.get(order_id)
+
+def save_order(order: dict):
+    order_store.save(order)
+
+def delete_order(order_id):
+    return order_store.delete(order_id)
 
 def get_full_name(user_or_dict):
     if isinstance(user_or_dict, dict):
@@ -141,11 +147,10 @@ def get_admin_comment_skip_keyboard():
     ])
 
 async def admin_view_order_handler(callback: CallbackQuery, state: FSMContext):
-    from shared import get_all_orders, ADMIN_ID, pluralize_days, get_full_name, get_admin_order_keyboard
+    from shared import get_order, ADMIN_ID, pluralize_days, get_full_name, get_admin_order_keyboard
     if callback.from_user.id != int(ADMIN_ID): return
     order_id = int(callback.data.split("_")[-1])
-    orders = get_all_orders()
-    target_order = next((order for order in orders if order['order_id'] == order_id), None)
+    target_order = get_order(order_id)
     if not target_order:
         await callback.answer("Заказ не найден.", show_alert=True)
         return
@@ -237,36 +242,25 @@ async def admin_view_order_handler(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 def get_executors_list():
-    EXECUTORS_FILE = "executors.json"
-    if not os.path.exists(EXECUTORS_FILE):
-        return []
-    with open(EXECUTORS_FILE, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except Exception:
-            return [] 
+    return executor_registry.list()
+
+def save_executors_list(executors):
+    executor_registry.save(executors)
         
 
 async def save_order_to_gsheets(order):
     """
-    Сохраняет заявку в Google Sheets.
+    Ставит заявку в очередь на запись в Google Sheets (отправляет фоновый воркер sheets_sync).
+    Строка заявки обновляется, если она уже есть в таблице (повторная оплата после отмены), иначе добавляется.
     """
     try:
-        from google.oauth2.service_account import Credentials
-        import gspread
-        GOOGLE_SHEET_ID = "1D15yyPKHyN1Vw8eRnjT79xV28cwL_q5EIZa97tgTF2U"
-        users_file = "users.json"
-        phone_number = order.get("phone_number", "")
-        if not phone_number and os.path.exists(users_file):
-            with open(users_file, "r", encoding="utf-8") as f:
-                try:
-                    users = json.load(f)
-                    phone_number = users.get(str(order.get("user_id")), {}).get("phone_number", "")
-                except Exception:
-                    phone_number = ""
+        from sheets_sync import enqueue_upsert
+        from user_store import get_user_phone
+        phone_number = order.get("phone_number", "") or get_user_phone(order.get("user_id"))
 
          # --- Новый блок: срок выполнения в днях ---
         exec_deadline = ""
+        due_date = ""
         executor_name = ""
         executor_price = ""
 
@@ -305,10 +299,17 @@ async def save_order_to_gsheets(order):
             str(profit),
             order.get("status", "")
         ]
-        creds = Credentials.from_service_account_file("google-credentials.json", scopes=["https://www.googleapis.com/auth/spreadsheets"])
-        gc = gspread.authorize(creds)
-        sh = gc.open_by_key(GOOGLE_SHEET_ID)
-        worksheet = sh.sheet1
-        worksheet.append_row(row, value_input_option="USER_ENTERED")
+        enqueue_upsert(order.get("order_id"), row)
     except Exception as e:
-        print(f"Ошибка при сохранении в Google Sheets: {e}")
\ No newline at end of file
+        logging.error(f"Ошибка при сохранении заявки {order.get('order_id')} в Google Sheets: {e}")
+
+async def sync_order_to_sheets(event):
+    """Подписчик order_events: оплаченная заявка попадает в таблицу, дальше в ней обновляется только статус."""
+    new_status = event.data.get("new_status")
+    if new_status == "В работе":
+        await save_order_to_gsheets(event.order)
+    else:
+        from sheets_sync import enqueue_status
+        enqueue_status(event.order_id, new_status)
+
+order_events.subscribe(order_events.STATUS_CHANGED, sync_order_to_sheets)
\ No newline at end of file
@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import time
+
+import gspread
+from google.auth.exceptions import TransportError
+
+import db
+import gsheets
+from io_pool import run_io
+from metrics import sheets_latency
+
+STATUS_COLUMN = "N"  # Столбец статуса заявки
+
+BATCH_SIZE = 50
+ROW_INDEX_TTL = 600  # секунд; лист могут править руками, поэтому индекс строк периодически перестраиваем
+MAX_BACKOFF = 300  # секунд между повторами при недоступности Google
+MAX_ATTEMPTS = 10  # после стольких неудач записи задача уходит в sheets_dead_letter и больше не держит очередь
+
+_wakeup = None
+# Недоступность Google (сеть, 429, 5xx, не открылся лист) — общая пауза очереди, попытки задач не тратит
+_outage = {"failures": 0, "until": 0.0}
+
+_db = db.LazyConnection(
+    '''CREATE TABLE IF NOT EXISTS sheets_outbox
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        order_id TEXT,
+        payload TEXT,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS sheets_dead_letter
+       (id INTEGER PRIMARY KEY,
+        op TEXT NOT NULL,
+        order_id TEXT,
+        payload TEXT,
+        attempts INTEGER,
+        last_error TEXT,
+        created_at TEXT,
+        failed_at TEXT DEFAULT CURRENT_TIMESTAMP)''',
+    # Заявки, которые уже записаны (или поставлены на запись) в таблицу: только им имеет смысл слать статус
+    "CREATE TABLE IF NOT EXISTS sheets_orders (order_id TEXT PRIMARY KEY)",
+)
+_known = None  # кэш sheets_orders в памяти
+
+
+def _get_conn() -> sqlite3.Connection:
+    return _db.get()
+
+
+def _enqueue(op: str, order_id=None, payload=None):
+    conn = _get_conn()
+    with conn:
+        conn.execute(
+            "INSERT INTO sheets_outbox (op, order_id, payload) VALUES (?, ?, ?)",
+            (op, None if order_id is None else str(order_id), json.dumps(payload, ensure_ascii=False)),
+        )
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _known_orders() -> set:
+    global _known
+    if _known is None:
+        _known = {row[0] for row in _get_conn().execute("SELECT order_id FROM sheets_orders")}
+    return _known
+
+
+def _remember(order_ids):
+    new_ids = {str(order_id).strip() for order_id in order_ids if order_id is not None} - {""} - _known_orders()
+    if not new_ids:
+        return
+    conn = _get_conn()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO sheets_orders (order_id) VALUES (?)", [(i,) for i in new_ids])
+    _known.update(new_ids)
+
+
+def _forget(order_id):
+    key = str(order_id).strip()
+    if key in _known_orders():
+        conn = _get_conn()
+        with conn:
+            conn.execute("DELETE FROM sheets_orders WHERE order_id = ?", (key,))
+        _known.discard(key)
+
+
+def is_in_sheet(order_id) -> bool:
+    return str(order_id).strip() in _known_orders()
+
+
+# --- API для хендлеров: только ставим задачу в очередь ---
+def enqueue_upsert(order_id, row: list):
+    """Обновить строку заявки, а если её нет — добавить."""
+    _enqueue("upsert", order_id, row)
+    _remember([order_id])
+
+
+def enqueue_delete(order_id):
+    _enqueue("delete", order_id)
+    _forget(order_id)
+
+
+def enqueue_status(order_id, status: str):
+    """Обновить статус; заявки, которой нет в таблице (черновик, ещё не оплачена), это не касается."""
+    if not is_in_sheet(order_id):
+        return
+    _enqueue("status", order_id, status)
+
+
+def pending_count() -> int:
+    return _get_conn().execute("SELECT COUNT(*) FROM sheets_outbox").fetchone()[0]
+
+
+def dead_letter_count() -> int:
+    return _get_conn().execute("SELECT COUNT(*) FROM sheets_dead_letter").fetchone()[0]
+
+
+# --- Работа с Google Sheets (выполняется в отдельном потоке) ---
+class SheetRowIndex:
+    """
+    Индекс order_id -> номер строки на листе.
+    Строится один раз по столбцу A и дальше поддерживается при добавлении и удалении строк,
+    поэтому записи адресуются прямо по диапазону, без worksheet.find().
+    """
+
+    def __init__(self):
+        self._rows = None
+        self._last_row = 0
+        self._built_at = 0.0
+
+    def invalidate(self):
+        self._rows = None
+        self._last_row = 0
+
+    def ensure(self, worksheet) -> bool:
+        """Перестраивает индекс, если он устарел; True — если перестроили (прочитали столбец A)."""
+        if self._rows is not None and time.time() - self._built_at < ROW_INDEX_TTL:
+            return False
+        values = worksheet.col_values(1)
+        rows = {}
+        for i, value in enumerate(values, start=1):
+            key = str(value).strip()
+            if key and key not in rows:
+                rows[key] = i
+        self._rows = rows
+        self._last_row = len(values)
+        self._built_at = time.time()
+        return True
+
+    def order_ids(self) -> list:
+        return list(self._rows or ())
+
+    def get(self, order_id):
+        return self._rows.get(str(order_id).strip())
+
+    def on_append(self, order_ids: list, response):
+        # Номер первой добавленной строки берём из ответа API (updates.updatedRange, напр. "Лист1!A5:N6")
+        updated_range = ((response or {}).get("updates") or {}).get("updatedRange", "")
+        match = re.search(r"![A-Z]+(\d+)", updated_range)
+        if not match:
+            self.invalidate()
+            return
+        start = int(match.group(1))
+        for offset, order_id in enumerate(order_ids):
+            key = str(order_id).strip()
+            if key and key not in self._rows:
+                self._rows[key] = start + offset
+        self._last_row = max(self._last_row, start + len(order_ids) - 1)
+
+    def on_delete(self, row_num: int):
+        self._rows = {key: (row if row < row_num else row - 1) for key, row in self._rows.items() if row != row_num}
+        self._last_row -= 1
+
+
+row_index = SheetRowIndex()
+
+
+def _append(worksheet, rows: list):
+    response = worksheet.append_rows(rows, value_input_option="USER_ENTERED")
+    row_index.on_append([row[0] if row else "" for row in rows], response)
+
+
+# Операции, которые пишут в уже существующие строки и склеиваются в один batch_update
+UPDATE_OPS = {"upsert", "status"}
+
+
+def _step_kind(op: str) -> str:
+    return "update" if op in UPDATE_OPS else op
+
+
+def _group_steps(rows: list) -> list:
+    """
+    Подряд идущие append склеиваются в один шаг (append_rows), подряд идущие upsert и status —
+    в один batch_update; delete выполняется по одному. Задача, которая уже падала, идёт отдельным
+    шагом, чтобы одна битая строка не валила (и не отправляла в dead letter) соседние.
+    """
+    steps = []
+    for row in rows:
+        kind = _step_kind(row[1])
+        if (kind != "delete" and steps and _step_kind(steps[-1][0][1]) == kind
+                and not steps[-1][0][4] and not row[4]):
+            steps[-1].append(row)
+        else:
+            steps.append([row])
+    return steps
+
+
+def _update(worksheet, step: list, payloads: list):
+    """upsert и status подряд — одним batch_update; upsert заявки, которой ещё нет на листе, добавляет строку."""
+    data = []
+
+    def flush():
+        if data:
+            worksheet.batch_update(list(data), value_input_option="USER_ENTERED")
+            data.clear()
+
+    for row, payload in zip(step, payloads):
+        op, order_id = row[1], row[2]
+        row_num = row_index.get(order_id)
+        if op == "upsert":
+            if row_num:
+                data.append({"range": f"A{row_num}:N{row_num}", "values": [payload]})
+            else:
+                # Номер новой строки узнаем только из ответа append — сначала отправляем накопленное
+                flush()
+                _append(worksheet, [payload])
+        elif row_num:
+            data.append({"range": f"{STATUS_COLUMN}{row_num}", "values": [[payload]]})
+    flush()
+
+
+def _apply_step(worksheet, step: list):
+    op, order_id = step[0][1], step[0][2]
+    payloads = [json.loads(row[3]) if row[3] else None for row in step]
+    row_index.ensure(worksheet)
+    if op == "append":
+        _append(worksheet, payloads)
+    elif op in UPDATE_OPS:
+        _update(worksheet, step, payloads)
+    elif op == "delete":
+        row_num = row_index.get(order_id)
+        # Удаление необратимо: убеждаемся, что в строке всё ещё нужная заявка
+        if row_num and str(worksheet.acell(f"A{row_num}").value).strip() != str(order_id).strip():
+            row_index.invalidate()
+            row_index.ensure(worksheet)
+            row_num = row_index.get(order_id)
+        if row_num:
+            worksheet.delete_rows(row_num)
+            row_index.on_delete(row_num)
+    else:
+        logging.error(f"Неизвестная операция в очереди Google Sheets: {op}")
+
+
+async def _timed(op: str, func, *args):
+    started = time.perf_counter()
+    result = "error"
+    try:
+        value = await run_io(func, *args, name=f"sheets-{op}")
+        result = "ok"
+        return value
+    finally:
+        sheets_latency.observe(time.perf_counter() - started, op=op, result=result)
+
+
+def _is_outage(error: Exception) -> bool:
+    """Сбой на стороне Google или сети, а не ошибка конкретной задачи."""
+    if isinstance(error, gspread.exceptions.APIError):
+        status = getattr(getattr(error, "response", None), "status_code", None) or error.code
+        return status == 429 or (isinstance(status, int) and status >= 500)
+    # requests.ConnectionError/Timeout — подклассы OSError
+    return isinstance(error, (OSError, TransportError))
+
+
+def _start_outage(error: Exception, stage: str):
+    gsheets.reset()
+    row_index.invalidate()
+    _outage["failures"] += 1
+    delay = min(2 ** _outage["failures"], MAX_BACKOFF)
+    _outage["until"] = time.time() + delay
+    logging.error(f"Google Sheets недоступен ({stage}), очередь ждёт {delay} с: {type(error).__name__}: {error}")
+
+
+async def _open_indexed():
+    """Открывает лист и при необходимости перестраивает индекс строк."""
+    worksheet = await _timed("open", gsheets.get_worksheet)
+    if await _timed("index", row_index.ensure, worksheet):
+        # Заявки, добавленные на лист до sheets_orders или вручную, тоже получают обновления статуса
+        _remember(row_index.order_ids())
+    return worksheet
+
+
+async def _process_due() -> bool:
+    """Обрабатывает одну пачку готовых к отправке задач. Возвращает True, если что-то отправили."""
+    conn = _get_conn()
+    now = time.time()
+    if now < _outage["until"]:
+        return False
+    rows = conn.execute(
+        "SELECT id, op, order_id, payload, attempts, next_attempt_at FROM sheets_outbox ORDER BY id LIMIT ?",
+        (BATCH_SIZE,),
+    ).fetchall()
+    if not rows:
+        return False
+    # Очередь строго упорядочена: ждём, пока наступит время повтора для головы очереди
+    if rows[0][5] > now:
+        return False
+    try:
+        worksheet = await _open_indexed()
+    except Exception as e:
+        # Лист не открылся — задачи тут ни при чём, их попытки не считаем
+        _start_outage(e, "открытие листа")
+        return False
+    sent = False
+    try:
+        for step in _group_steps(rows):
+            await _timed(step[0][1], _apply_step, worksheet, step)
+            # Выполненный шаг сразу убираем из очереди, чтобы при сбое не повторить его
+            with conn:
+                conn.executemany("DELETE FROM sheets_outbox WHERE id = ?", [(row[0],) for row in step])
+            sent = True
+        _outage["failures"] = 0
+    except Exception as e:
+        if _is_outage(e):
+            _start_outage(e, "запись")
+            return sent
+        # Клиент мог протухнуть (права, удалённый лист) — при повторе откроем заново
+        gsheets.reset()
+        # Состояние листа после сбоя неизвестно — индекс строк перестроим при следующей попытке
+        row_index.invalidate()
+        head = conn.execute("SELECT id, op, order_id, attempts FROM sheets_outbox ORDER BY id LIMIT 1").fetchone()
+        if head:
+            attempts = head[3] + 1
+            if attempts >= MAX_ATTEMPTS:
+                _to_dead_letter(conn, head[0], attempts, str(e))
+                logging.error(
+                    f"Google Sheets: задача {head[1]} заявки {head[2]} не выполнена за {attempts} попыток "
+                    f"и перенесена в sheets_dead_letter: {e}"
+                )
+                return True
+            delay = min(2 ** attempts, MAX_BACKOFF)
+            logging.error(f"Синхронизация с Google Sheets не удалась (попытка {attempts}), повтор через {delay} с: {e}")
+            with conn:
+                conn.execute(
+                    "UPDATE sheets_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + delay, str(e), head[0]),
+                )
+    return sent
+
+
+def _to_dead_letter(conn, task_id: int, attempts: int, error: str):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sheets_dead_letter (id, op, order_id, payload, attempts, last_error, created_at) "
+            "SELECT id, op, order_id, payload, ?, ?, created_at FROM sheets_outbox WHERE id = ?",
+            (attempts, error, task_id),
+        )
+        conn.execute("DELETE FROM sheets_outbox WHERE id = ?", (task_id,))
+
+
+async def run_sheets_worker(poll_interval: float = 5.0):
+    """Фоновый воркер: разбирает outbox и переживает перезапуски (очередь лежит в student.db)."""
+    global _wakeup
+    _wakeup = asyncio.Event()
+    if not _known_orders():
+        # Первый запуск с sheets_orders: узнаём, какие заявки уже есть на листе
+        try:
+            await _open_indexed()
+        except Exception as e:
+            logging.warning(f"Google Sheets: не удалось прочитать заявки с листа: {e}")
+    while True:
+        try:
+            sent = await _process_due()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка воркера Google Sheets: {e}")
+            sent = False
+        if sent:
+            continue
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
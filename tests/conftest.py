@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import order_db  # noqa: E402
+from order_store import OrderStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Пустое хранилище заказов поверх временной student.db (orders.json тоже ищется в tmp_path)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        order_db, "_db", db.LazyConnection(init=order_db.init_orders_table, db_file=str(tmp_path / "student.db"))
+    )
+    return OrderStore()
@@ -0,0 +1,71 @@
+import pytest
+
+import order_status
+from order_status import TRANSITIONS, InvalidStatusTransition, can_transition
+
+
+def test_transition_targets_are_known_statuses():
+    for old_status, targets in TRANSITIONS.items():
+        assert old_status not in targets, old_status
+        assert targets <= set(TRANSITIONS), old_status
+
+
+def test_can_transition_follows_table():
+    assert can_transition("Рассматривается", "Ожидает подтверждения")
+    assert can_transition("Ожидает оплаты", "В работе")
+    assert can_transition("Отправлен на проверку", "На доработке")
+    assert not can_transition("Рассматривается", "В работе")
+    assert not can_transition("Отправлен на проверку", "Рассматривается")
+
+
+def test_completed_order_is_final():
+    assert TRANSITIONS["Выполнена"] == set()
+    assert not can_transition("Выполнена", "Отменена")
+    assert not can_transition("Выполнена", "Рассматривается")
+
+
+def test_same_status_needs_allow_same():
+    assert not can_transition("На доработке", "На доработке")
+    assert can_transition("На доработке", "На доработке", allow_same=True)
+
+
+def test_unknown_status_is_rejected():
+    assert not can_transition("Что-то старое", "Рассматривается")
+    assert not can_transition(None, "Рассматривается")
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = []
+    monkeypatch.setattr(order_status.order_store, "save", lambda order: saved.append(dict(order)))
+    return saved
+
+
+def test_transition_applies_changes_in_one_save(saved):
+    order = {"order_id": 1, "status": "Ожидает оплаты", "executor_id": 5, "note": "x"}
+    old_status = order_status.transition(order, "Рассматривается", executor_id=None, reason="отказ")
+    assert old_status == "Ожидает оплаты"
+    assert order == {"order_id": 1, "status": "Рассматривается", "note": "x", "reason": "отказ"}
+    assert saved == [order]
+
+
+def test_invalid_transition_leaves_order_untouched(saved):
+    order = {"order_id": 1, "status": "Выполнена"}
+    with pytest.raises(InvalidStatusTransition):
+        order_status.transition(order, "На доработке", revision_comment="…")
+    assert order == {"order_id": 1, "status": "Выполнена"}
+    assert saved == []
+    order_status.transition(order, "На доработке", force=True)
+    assert order["status"] == "На доработке"
+
+
+def test_failed_save_restores_snapshot(monkeypatch):
+    def broken_save(order):
+        order["version"] = 99
+        raise OSError("disk full")
+
+    monkeypatch.setattr(order_status.order_store, "save", broken_save)
+    order = {"order_id": 1, "status": "В работе", "submitted_work": {"file_id": "a"}}
+    with pytest.raises(OSError):
+        order_status.transition(order, "Отправлен на проверку", submitted_work={"file_id": "b"})
+    assert order == {"order_id": 1, "status": "В работе", "submitted_work": {"file_id": "a"}}
@@ -0,0 +1,108 @@
+from order_store import parse_page_cursor
+
+
+def _ids(orders):
+    return [order["order_id"] for order in orders]
+
+
+def _fill(store, count, **fields):
+    for order_id in range(1, count + 1):
+        store.save({"order_id": order_id, "status": "Рассматривается", "user_id": 100, **fields})
+
+
+def test_parse_page_cursor():
+    assert parse_page_cursor("f") == (None, None)
+    assert parse_page_cursor("") == (None, None)
+    assert parse_page_cursor("n15") == (15, None)
+    assert parse_page_cursor("p15") == (None, 15)
+    assert parse_page_cursor("nabc") == (None, None)
+
+
+def test_page_walks_from_newest_to_oldest(store):
+    _fill(store, 25)
+    orders, has_more = store.page(limit=10)
+    assert _ids(orders) == list(range(25, 15, -1))
+    assert has_more
+    orders, has_more = store.page(before=16, limit=10)
+    assert _ids(orders) == list(range(15, 5, -1))
+    assert has_more
+    orders, has_more = store.page(before=6, limit=10)
+    assert _ids(orders) == [5, 4, 3, 2, 1]
+    assert not has_more
+
+
+def test_page_after_returns_newer_orders_in_display_order(store):
+    _fill(store, 25)
+    orders, has_more = store.page(after=5, limit=10)
+    assert _ids(orders) == list(range(15, 5, -1))
+    assert has_more
+    orders, has_more = store.page(after=15, limit=10)
+    assert _ids(orders) == list(range(25, 15, -1))
+    assert not has_more
+
+
+def test_page_filters_and_follows_status_changes(store):
+    for order_id in range(1, 11):
+        store.save({"order_id": order_id, "status": "Рассматривается", "user_id": 100 + order_id % 2})
+    orders, _ = store.page(user_id=101, limit=10)
+    assert _ids(orders) == [9, 7, 5, 3, 1]
+    orders, _ = store.page(user_id="101", status="Рассматривается", before=5, limit=10)
+    assert _ids(orders) == [3, 1]
+
+    order = store.get(7)
+    order["status"] = "В работе"
+    store.save(order)
+    orders, _ = store.page(status="В работе", limit=10)
+    assert _ids(orders) == [7]
+    orders, _ = store.page(user_id=101, status="Рассматривается", limit=10)
+    assert _ids(orders) == [9, 5, 3, 1]
+
+
+def test_page_predicate_and_stop(store):
+    _fill(store, 10)
+    orders, has_more = store.page(limit=3, predicate=lambda o: o["order_id"] % 2 == 0)
+    assert _ids(orders) == [10, 8, 6]
+    assert has_more
+    orders, has_more = store.page(limit=10, stop=lambda o: o["order_id"] < 8)
+    assert _ids(orders) == [10, 9, 8]
+    assert not has_more
+
+
+def test_page_skips_deleted_orders(store):
+    _fill(store, 5)
+    store.delete(4)
+    orders, _ = store.page(limit=10)
+    assert _ids(orders) == [5, 3, 2, 1]
+    assert store.max_order_id() == 5
+
+
+def test_page_union_merges_without_duplicates(store):
+    # Клиент 100 — заказчик заказов 1..6 и исполнитель заказов 5..8
+    for order_id in range(1, 9):
+        store.save({
+            "order_id": order_id,
+            "status": "В работе",
+            "user_id": 100 if order_id <= 6 else 200,
+            "executor_id": 100 if order_id >= 5 else 300,
+        })
+    queries = [{"user_id": 100}, {"executor_id": 100}]
+    orders, has_more = store.page_union(queries, limit=5)
+    assert _ids(orders) == [8, 7, 6, 5, 4]
+    assert has_more
+    orders, has_more = store.page_union(queries, before=4, limit=5)
+    assert _ids(orders) == [3, 2, 1]
+    assert not has_more
+    orders, has_more = store.page_union(queries, after=3, limit=3)
+    assert _ids(orders) == [6, 5, 4]
+    assert has_more
+
+
+def test_orders_survive_reload(store):
+    _fill(store, 3)
+    store.flush()
+    from order_store import OrderStore
+
+    reloaded = OrderStore()
+    orders, _ = reloaded.page(limit=10)
+    assert _ids(orders) == [3, 2, 1]
+    assert reloaded.get(2)["version"] == 1
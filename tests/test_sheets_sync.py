@@ -0,0 +1,91 @@
+from sheets_sync import SheetRowIndex, _group_steps
+
+
+class FakeWorksheet:
+    def __init__(self, column):
+        self.column = column
+        self.reads = 0
+
+    def col_values(self, col):
+        assert col == 1
+        self.reads += 1
+        return list(self.column)
+
+
+def _index(*column):
+    index = SheetRowIndex()
+    assert index.ensure(FakeWorksheet(column))
+    return index
+
+
+def test_ensure_builds_index_once():
+    worksheet = FakeWorksheet(["Номер заказа", "10", "11", "", "12", "11"])
+    index = SheetRowIndex()
+    assert index.ensure(worksheet)
+    assert not index.ensure(worksheet)
+    assert worksheet.reads == 1
+    # Дубликат номера не перетирает первую строку, пустые строки пропускаются
+    assert index.get(11) == 3
+    assert index.get("12") == 5
+    assert index.get(13) is None
+    index.invalidate()
+    assert index.ensure(worksheet)
+    assert worksheet.reads == 2
+
+
+def test_on_append_uses_range_from_response():
+    index = _index("Номер заказа", "10", "11")
+    index.on_append(["12", "13"], {"updates": {"updatedRange": "Лист1!A4:N5"}})
+    assert index.get(12) == 4
+    assert index.get(13) == 5
+    # Уже известный номер не переезжает
+    index.on_append(["10"], {"updates": {"updatedRange": "'Лист 1'!A6:N6"}})
+    assert index.get(10) == 2
+
+
+def test_on_append_without_range_invalidates():
+    index = _index("Номер заказа", "10")
+    index.on_append(["11"], {})
+    assert index.order_ids() == []
+    assert index.ensure(FakeWorksheet(["Номер заказа", "10", "11"]))
+    assert index.get(11) == 3
+
+
+def test_on_delete_shifts_rows_below():
+    index = _index("Номер заказа", "10", "11", "12", "13")
+    index.on_delete(3)
+    assert index.get(11) is None
+    assert index.get(10) == 2
+    assert index.get(12) == 3
+    assert index.get(13) == 4
+    index.on_append(["14"], {"updates": {"updatedRange": "Лист1!A5:N5"}})
+    assert index.get(14) == 5
+
+
+def _row(row_id, op, attempts=0):
+    # Строка sheets_outbox: id, op, order_id, payload, attempts, next_attempt_at
+    return (row_id, op, str(row_id), "[]", attempts, 0)
+
+
+def _step_ids(steps):
+    return [[row[0] for row in step] for step in steps]
+
+
+def test_group_steps_merges_neighbours_of_same_kind():
+    rows = [
+        _row(1, "append"), _row(2, "append"),
+        _row(3, "upsert"), _row(4, "status"), _row(5, "upsert"),
+        _row(6, "delete"), _row(7, "delete"),
+        _row(8, "status"),
+    ]
+    assert _step_ids(_group_steps(rows)) == [[1, 2], [3, 4, 5], [6], [7], [8]]
+
+
+def test_group_steps_isolates_failed_rows():
+    rows = [_row(1, "upsert"), _row(2, "status", attempts=1), _row(3, "status"), _row(4, "upsert")]
+    assert _step_ids(_group_steps(rows)) == [[1], [2], [3, 4]]
+
+
+def test_group_steps_keeps_queue_order():
+    rows = [_row(1, "status"), _row(2, "delete"), _row(3, "status")]
+    assert _step_ids(_group_steps(rows)) == [[1], [2], [3]]
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError, TelegramRetryAfter
+
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 200
+POLLING_TIMEOUT = 30
+HIGH_WATER_RATIO = 0.8  # доля заполнения очереди, после которой пишем предупреждение
+HIGH_WATER_LOG_INTERVAL = 30.0
+
+
+def update_key(update):
+    """
+    Ключ упорядочивания: апдейты одного пользователя (а без пользователя — одного чата)
+    обрабатываются строго по очереди, чтобы FSM-сценарии вроде OrderState не гонялись сами с собой.
+    """
+    try:
+        event = update.event
+    except Exception:
+        return ("update", update.update_id)
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = getattr(event.message, "chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return ("update", update.update_id)
+
+
+class UpdatePipeline:
+    """
+    Ограниченная очередь апдейтов и N воркеров поверх dp.feed_update.
+    submit() ждёт, пока в очереди освободится место (backpressure для polling и webhook),
+    апдейты с одним ключом никогда не выполняются параллельно и идут в порядке поступления.
+    """
+
+    def __init__(self, dispatcher, bot, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_QUEUE_SIZE):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self._capacity = None
+        self._ready = None       # ключи, у которых есть апдейты и которые никто не обрабатывает
+        self._pending = {}       # ключ -> deque апдейтов; ключ есть здесь, пока он в _ready или в работе
+        self._tasks = []
+        self._idle = None
+        # Метрики
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self._high_water_logged_at = 0.0
+
+    def start(self):
+        self._capacity = asyncio.Semaphore(self.max_queue)
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logging.info(f"Обработка апдейтов: {self.workers} воркеров, очередь до {self.max_queue}")
+
+    async def submit(self, update):
+        await self._capacity.acquire()
+        key = update_key(update)
+        item = (update, time.monotonic())
+        self.queued += 1
+        self._idle.clear()
+        self.max_depth = max(self.max_depth, self.queued)
+        self._check_high_water()
+        bucket = self._pending.get(key)
+        if bucket is not None:
+            bucket.append(item)
+            return
+        self._pending[key] = deque([item])
+        self._ready.put_nowait(key)
+
+    def _check_high_water(self):
+        if self.queued < self.max_queue * HIGH_WATER_RATIO:
+            return
+        now = time.monotonic()
+        if now - self._high_water_logged_at >= HIGH_WATER_LOG_INTERVAL:
+            self._high_water_logged_at = now
+            logging.warning(f"Очередь апдейтов почти заполнена: {self.queued}/{self.max_queue}")
+
+    async def _worker(self, number: int):
+        while True:
+            key = await self._ready.get()
+            bucket = self._pending[key]
+            update, enqueued_at = bucket.popleft()
+            self.queued -= 1
+            self.in_flight += 1
+            self.total_wait += time.monotonic() - enqueued_at
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                self.in_flight -= 1
+                self.processed += 1
+                self._capacity.release()
+                if bucket:
+                    # Остальные апдейты ключа — в конец очереди, чтобы один активный чат не занимал воркер
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                if not self._pending:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "max_depth": self.max_depth,
+            "active_keys": len(self._pending),
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+        }
+
+    async def stop(self, timeout: float = 10.0):
+        """Даёт доработать очереди (не дольше timeout) и останавливает воркеров."""
+        if self._idle is not None and not self._idle.is_set():
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Остановка: не обработано апдейтов: {self.queued + self.in_flight}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_polling(self, allowed_updates=None):
+        """Long polling, который складывает апдейты в очередь (и притормаживает, когда она полна)."""
+        offset = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates,
+                    request_timeout=POLLING_TIMEOUT + 10,
+                )
+                backoff = 1.0
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logging.warning(f"Polling: ошибка получения апдейтов, повтор через {backoff:.0f} с: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Как dp.start_polling: конфликт getUpdates при передеплое, неверный токен и прочее
+                # не должны останавливать бота — логируем и повторяем с задержкой
+                logging.error(f"Polling: {type(e).__name__}: {e}, повтор через {backoff:.0f} с")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.submit(update)
@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+
+from metrics import storage_latency, storage_bytes
+from persistence import WriteBehind, atomic_write_text
+
+USERS_FILE = "users.json"
+
+
+class UserStore:
+    """
+    Профили пользователей (ФИО, телефон, группа, университет) в памяти процесса.
+    users.json читается один раз; изменения применяются в памяти синхронно (внутри event loop
+    это атомарно, без блокировок и ожиданий) и пишутся на диск отложенно и атомарно.
+    """
+
+    def __init__(self, file_path: str = USERS_FILE):
+        self.file_path = file_path
+        self._users = None
+        self._listeners = []  # callback(user_id) после изменения профиля
+        self._writer = WriteBehind(self._prepare_flush, name="users")
+
+    def _ensure_loaded(self):
+        if self._users is not None:
+            return
+        users = {}
+        if os.path.exists(self.file_path) and os.path.getsize(self.file_path) > 0:
+            storage_bytes.observe(os.path.getsize(self.file_path), store="users", op="load")
+            with storage_latency.time(store="users", op="load"), open(self.file_path, "r", encoding="utf-8") as f:
+                try:
+                    users = json.load(f)
+                except json.JSONDecodeError as e:
+                    logging.error(f"users.json повреждён, профили не загружены: {e}")
+                    users = {}
+        self._users = users if isinstance(users, dict) else {}
+
+    def get(self, user_id) -> dict:
+        self._ensure_loaded()
+        # Возвращаем копию, чтобы правки вызывающего кода не попадали в кэш мимо записи
+        return dict(self._users.get(str(user_id), {}))
+
+    def all_ids(self) -> list:
+        self._ensure_loaded()
+        return list(self._users.keys())
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, user_id):
+        for callback in self._listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика изменений профиля {user_id}: {e}")
+
+    def replace(self, user_id, entry: dict):
+        self._ensure_loaded()
+        self._users[str(user_id)] = dict(entry)
+        self._writer.mark_dirty(str(user_id))
+        self._notify(str(user_id))
+
+    def update(self, user_id, data: dict):
+        self._ensure_loaded()
+        entry = self._users.setdefault(str(user_id), {})
+        entry.update(data)
+        self._writer.mark_dirty(str(user_id))
+        self._notify(str(user_id))
+
+    def _prepare_flush(self, dirty: set, deleted: set):
+        payload = json.dumps(self._users, ensure_ascii=False)
+
+        def write():
+            with storage_latency.time(store="users", op="write"):
+                atomic_write_text(self.file_path, payload)
+            storage_bytes.observe(len(payload.encode("utf-8")), store="users", op="write")
+        return write
+
+    def flush(self):
+        self._writer.flush()
+
+    async def aclose(self):
+        await self._writer.aclose()
+
+
+user_store = UserStore()
+
+
+def get_user_phone(user_id) -> str:
+    return user_store.get(user_id).get("phone_number", "")